@@ -1,5 +1,8 @@
 from . import utils
 from . import ilp_model
 from . import ilp_solver
+from . import scorer
+from . import preprocessing
+from . import inference
 
-__all__ = ['utils', 'ilp_model', 'ilp_solver']
\ No newline at end of file
+__all__ = ['utils', 'ilp_model', 'ilp_solver', 'scorer', 'preprocessing', 'inference']
\ No newline at end of file
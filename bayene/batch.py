@@ -0,0 +1,238 @@
+"""
+batch.py: Runs cussensILPBN over many Cussens score files. Jobs run in up to n_jobs worker
+processes at a time, each with an optional wall-clock time limit after which its process is
+killed. One JSON record per score file is appended to a JSONL output file as soon as the job
+finishes, so that a crashed or interrupted batch can be resumed from the same file. Score
+files are loaded through their compiled score cache (bayene.utils.score_cache), so running a
+batch again does not parse them again.
+
+From the command line:
+    python -m bayene.batch 'test_datasets/parent_3/**/*.scores' -o results.jsonl -j 4 --time-limit 600
+"""
+import argparse
+import ast
+import contextlib
+import glob
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+import traceback
+
+# Statuses of the records written to the output file
+STATUSES = ['ok', 'infeasible', 'timeout', 'error']
+
+# Seconds between checks of the running jobs' time limits
+POLL_INTERVAL = 1.0
+
+def expand_score_files(score_files):
+	# Paths and glob patterns (recursive '**' allowed) to a sorted list of distinct files
+	if isinstance(score_files, str):
+		score_files = [score_files]
+
+	paths = set()
+	for pattern in score_files:
+		matches = glob.glob(pattern, recursive=True)
+		paths.update(matches if len(matches) > 0 else [pattern])
+
+	return sorted(paths)
+
+def completed_jobs(output_path, retry_failed=False):
+	# Score files that already have a record in the output file. A line cut short by a crash,
+	# or one that is not a record of a score file, is ignored, so its job runs again.
+	completed = set()
+	if not os.path.exists(output_path):
+		return completed
+
+	with open(output_path, 'r') as output_file:
+		for line in output_file:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				continue
+			score_file = record.get('score_file') if isinstance(record, dict) else None
+			if score_file is None:
+				continue
+			if retry_failed and record.get('status') in ('timeout', 'error'):
+				completed.discard(score_file)
+			else:
+				completed.add(score_file)
+
+	return completed
+
+def run_job(score_path, classifier_options=None, quiet=True, use_score_cache=True):
+	# Solves one score file in this process and returns its record
+	from bayene.bayesian_network import cussensILPBN
+	from bayene.utils import score_cache
+	from bayene.ilp_model.cussens.solution_controller import convert_to_graph
+	from pyomo.opt import TerminationCondition
+
+	classifier_options = classifier_options if classifier_options is not None else {}
+
+	start_time = time.time()
+	start_cpu_time = time.process_time()
+
+	with open(os.devnull, 'w') as devnull:
+		with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+			scores, parent_sets = score_cache.read_score_file(score_path, use_cache=use_score_cache)
+			read_time = time.time() - start_time
+
+			classifier = cussensILPBN(**classifier_options)
+			instance, results, objective_progress, heuristic_progress = classifier._fit_scores(scores, parent_sets)
+
+	record = {
+		'score_file': score_path,
+		'n_nodes': len(scores),
+		'n_columns': sum(len(node_scores) for node_scores in scores),
+		'timings': {
+			'read': read_time,
+			'solve': time.time() - start_time - read_time,
+			'total': time.time() - start_time,
+			'cpu': time.process_time() - start_cpu_time
+		}
+	}
+
+	# A solve stopped by its time limit before finding any DAG proves nothing about feasibility
+	if instance is None and results.solver.termination_condition == TerminationCondition.maxTimeLimit:
+		record['status'] = 'timeout'
+		record['termination_condition'] = str(results.solver.termination_condition)
+		return record
+	
+	if instance is None or results.solver.termination_condition == TerminationCondition.infeasible:
+		record['status'] = 'infeasible'
+		return record
+
+	record['status'] = 'ok'
+	record['termination_condition'] = str(results.solver.termination_condition)
+	record['objective'] = instance.objective_value()
+	record['edges'] = sorted([int(parent), int(child)] for parent, child in convert_to_graph(instance).edges())
+	record['iterations'] = {
+		'cluster_cut_rounds': instance.add_cluster_cuts_count,
+		'cluster_cuts': instance.add_cluster_total_count,
+		'cycle_cut_rounds': instance.add_cycle_cuts_count,
+		'cycle_cuts': instance.add_cycle_total_count,
+		'objective_progress': len(objective_progress)
+	}
+
+	return record
+
+def _job_process(score_path, classifier_options, use_score_cache, connection):
+	try:
+		record = run_job(score_path, classifier_options, use_score_cache=use_score_cache)
+	except Exception as error:
+		record = {'score_file': score_path, 'status': 'error', 'error': repr(error), 'traceback': traceback.format_exc()}
+	connection.send(record)
+	connection.close()
+
+def run_batch(score_files, output_path, n_jobs=1, time_limit=None, resume=True, retry_failed=False,
+              classifier_options=None, poll_interval=POLL_INTERVAL, use_score_cache=True):
+	# Returns the number of records written with each status in this run
+	paths = expand_score_files(score_files)
+
+	completed = completed_jobs(output_path, retry_failed) if resume else set()
+	pending = [path for path in paths if path not in completed]
+
+	print('Batch: ' + str(len(paths)) + ' score files, ' + str(len(paths) - len(pending)) + ' already done, '
+	      + str(len(pending)) + ' to run.')
+
+	counts = dict((status, 0) for status in STATUSES)
+	n_jobs = n_jobs if n_jobs is not None else multiprocessing.cpu_count()
+
+	# Receiving end of each running job's pipe -> (process, score file, start time)
+	running = {}
+
+	with open(output_path, 'a' if resume else 'w') as output_file:
+		# A record cut short by a crash is closed off, so that the next record is not written
+		# onto the end of its line
+		if resume and output_file.tell() > 0 and not _ends_with_newline(output_path):
+			output_file.write('\n')
+
+		def write_record(record):
+			output_file.write(json.dumps(record) + '\n')
+			output_file.flush()
+			os.fsync(output_file.fileno())
+			counts[record['status']] += 1
+			print('[' + record['status'] + '] ' + record['score_file'])
+
+		try:
+			while len(pending) > 0 or len(running) > 0:
+				while len(pending) > 0 and len(running) < n_jobs:
+					score_path = pending.pop(0)
+					receiver, sender = multiprocessing.Pipe(duplex=False)
+					process = multiprocessing.Process(target=_job_process, args=(score_path, classifier_options, use_score_cache, sender))
+					process.start()
+					sender.close()
+					running[receiver] = (process, score_path, time.time())
+
+				for receiver in multiprocessing.connection.wait(list(running.keys()), timeout=poll_interval):
+					process, score_path, job_start_time = running.pop(receiver)
+					try:
+						record = receiver.recv()
+					except EOFError:
+						record = {'score_file': score_path, 'status': 'error',
+						          'error': 'Worker process exited without a result'}
+					receiver.close()
+					process.join()
+					if process.exitcode not in (0, None) and record.get('status') != 'error':
+						record = {'score_file': score_path, 'status': 'error',
+						          'error': 'Worker process exited with code ' + str(process.exitcode)}
+					record['wall_time'] = time.time() - job_start_time
+					write_record(record)
+
+				if time_limit is not None:
+					now = time.time()
+					for receiver, (process, score_path, job_start_time) in list(running.items()):
+						if now - job_start_time > time_limit:
+							process.terminate()
+							process.join()
+							receiver.close()
+							del running[receiver]
+							write_record({'score_file': score_path, 'status': 'timeout', 'time_limit': time_limit,
+							              'wall_time': now - job_start_time})
+		finally:
+			# Interrupted: stop the jobs still running, which will run again on resume
+			for receiver, (process, score_path, job_start_time) in running.items():
+				process.terminate()
+				process.join()
+
+	return counts
+
+def _ends_with_newline(path):
+	with open(path, 'rb') as output_file:
+		output_file.seek(-1, os.SEEK_END)
+		return output_file.read(1) == b'\n'
+
+def parse_option(text):
+	# 'name=value' with value a Python literal (or a plain string)
+	name, value = text.split('=', 1)
+	try:
+		return name, ast.literal_eval(value)
+	except (ValueError, SyntaxError):
+		return name, value
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Learn Bayesian network structures from many Cussens score files.')
+	parser.add_argument('score_files', nargs='+', help='score files or glob patterns')
+	parser.add_argument('-o', '--output', required=True, help='JSONL file the results are appended to')
+	parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+	parser.add_argument('--time-limit', type=float, default=None, help='seconds allowed per score file')
+	parser.add_argument('--no-resume', action='store_true', help='overwrite the output file instead of resuming')
+	parser.add_argument('--retry-failed', action='store_true', help='run timed out or failed score files again')
+	parser.add_argument('--no-score-cache', action='store_true', help='parse the score files instead of using their compiled caches')
+	parser.add_argument('--solver', default='gurobi', help='solver passed to cussensILPBN')
+	parser.add_argument('--option', action='append', default=[], metavar='NAME=VALUE',
+	                    help='other cussensILPBN option, e.g. --option gomory_cut=False')
+	args = parser.parse_args(argv)
+
+	classifier_options = dict(parse_option(option) for option in args.option)
+	classifier_options['solver'] = args.solver
+
+	counts = run_batch(args.score_files, args.output, n_jobs=args.jobs, time_limit=args.time_limit,
+	                   resume=not args.no_resume, retry_failed=args.retry_failed,
+	                   classifier_options=classifier_options, use_score_cache=not args.no_score_cache)
+	print('Batch finished: ' + str(counts))
+
+if __name__ == '__main__':
+	main()
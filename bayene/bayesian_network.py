@@ -5,6 +5,11 @@ with class definitions for the variations of Bayesian Network classifiers provid
 import os
 from pyutilib.services import TempfileManager
 
+import numpy as np
+
+from bayene import scorer
+from bayene import inference
+from bayene import preprocessing
 from bayene.ilp_model import cussens
 
 class cussensILPBN():
@@ -16,6 +21,7 @@ class cussensILPBN():
 		TempfileManager.tempdir = os.getcwd()
 		
 		# Record the options to the object
+		# (solver: any Pyomo solver name, or 'highs' for the in-process sparse matrix backend)
 		self.score_type = score_type
 		self.n_parents = n_parents
 		self.solver = solver
@@ -24,44 +30,156 @@ class cussensILPBN():
 		self.cycle_finding = cycle_finding
 		self.gomory_cut = gomory_cut
 		
+		# Cycle separation limits per iteration: number of cycle cuts and seconds spent
+		self.max_cycles = kwargs.get('max_cycles', cussens.solution_controller.DEFAULT_MAX_CYCLES)
+		self.cycle_time_limit = kwargs.get('cycle_time_limit', None)
+		
+		# Try greedy cluster heuristics before the cluster cut sub-IP
+		self.cluster_heuristics = kwargs.get('cluster_heuristics', True)
+		
+		# Cluster cuts added per iteration, and the minimum violation for a cluster cut
+		self.max_cluster_cuts = kwargs.get('max_cluster_cuts', cussens.solution_controller.cluster_separator.DEFAULT_MAX_CLUSTERS)
+		self.min_cluster_violation = kwargs.get('min_cluster_violation', cussens.solution_controller.cluster_separator.MIN_VIOLATION)
+		
 		# Extra optimisation options
 		self.sink_heuristic = sink_heuristic
 		
+		# Use the best sink heuristic score as an objective cutoff
+		self.cutoff = kwargs.get('cutoff', True)
+		
+		# Equivalent sample size for BDeu scores computed by fit()
+		self.ess = kwargs.get('ess', 1.0)
+		
+		# Parent set scoring: worker processes (None = one per CPU) and bound-based pruning
+		self.n_jobs = kwargs.get('n_jobs', 1)
+		self.pruning = kwargs.get('pruning', True)
+		
+		# Keep the main problem loaded in a persistent solver between cutting plane iterations
+		self.persistent = kwargs.get('persistent', False)
+		
+		# Cut pool: deactivate cuts slack for cut_max_age rounds (None = never), and keep at
+		# most max_active_cuts cuts active (None = no limit)
+		self.cut_max_age = kwargs.get('cut_max_age', cussens.solution_controller.cut_pool.DEFAULT_MAX_AGE)
+		self.max_active_cuts = kwargs.get('max_active_cuts', None)
+		
+		# Directory of the on-disk cut cache (None = no cache). With cut_cache_drop_slack, cuts
+		# deactivated for staying slack are dropped from the cache.
+		self.cut_cache = kwargs.get('cut_cache', None)
+		self.cut_cache_drop_slack = kwargs.get('cut_cache_drop_slack', False)
+		
+		# Solve independent components of the problem separately, in component_jobs processes
+		self.decompose = kwargs.get('decompose', True)
+		self.component_jobs = kwargs.get('component_jobs', 1)
+		
+		# Run the branch-and-cut tree search from Python (nodes evaluated by node_jobs processes,
+		# up to max_nodes nodes) instead of leaving branching to the solver
+		self.branch_and_cut = kwargs.get('branch_and_cut', False)
+		self.node_jobs = kwargs.get('node_jobs', 1)
+		self.max_nodes = kwargs.get('max_nodes', None)
+		
+		# Anytime solving: stop after time_limit seconds or once the relative gap between the
+		# bound and the best DAG found is at most gap_target, returning that DAG
+		self.time_limit = kwargs.get('time_limit', None)
+		self.gap_target = kwargs.get('gap_target', None)
+		
+		# Console output of the solve, and where its structured events go (file paths, functions
+		# or sinks from ilp_model.cussens.instrumentation). profile_phases and trace_memory add
+		# cProfile and tracemalloc results to the phase events.
+		self.verbose = kwargs.get('verbose', True)
+		self.event_sinks = kwargs.get('event_sinks', None)
+		self.profile_phases = kwargs.get('profile_phases', False)
+		self.trace_memory = kwargs.get('trace_memory', False)
+		
+		# Keep the whole model of the final solve (as model_instance.model) instead of only the
+		# chosen parent sets
+		self.keep_model = kwargs.get('keep_model', False)
+		
+		# Remove dominated parent sets before building the model
+		self.preprocess = kwargs.get('preprocess', True)
+		
+		# Inference: Dirichlet pseudo-count of the CPTs, the variable predict() predicts by
+		# default, and the number of rows evaluated together
+		self.cpt_prior = kwargs.get('cpt_prior', inference.DEFAULT_ALPHA)
+		self.target = kwargs.get('target', None)
+		self.inference_batch_size = kwargs.get('inference_batch_size', inference.DEFAULT_BATCH_SIZE)
+		
 		# Process additional user constraints
-		if 'extra_constraints' in kwargs:
-			self.extra_constraints = kwargs['extra_constraints']
-		else:
-			self.extra_constraints = None
+		self.extra_constraints = kwargs.get('extra_constraints', None)
 	
-	def fit(self, X):
-		# (1) Generate Parent Sets
-		_generate_parent_sets()
+	def fit(self, X, arities=None):
+		# X is an integer matrix (rows = instances, columns = variables) with values coded
+		# 0..(arity - 1), as returned by cussens_files.read_cussens_data().
+		# If arities are not given, they are inferred from the largest value in each column.
+		if arities is None:
+			arities = scorer.infer_arities(X)
 		
-		# (2) Calculate the scores
-		# self.scores = scorer.calculate_scores(X, self.parent_candidates, score_type = self.score_type)
+		# (1) Generate Parent Sets and (2) Calculate the scores
+		# Parent sets that provably cannot be optimal are pruned while being enumerated.
+		self.scores, self.parent_candidates = scorer.score_parent_sets(
+			X, self.n_parents, arities=arities, score_type=self.score_type, ess=self.ess,
+			pruning=self.pruning, n_jobs=self.n_jobs
+		)
 
 		# (3) Insert the scores into the model and solve the model
-		self.model_instance, self.result = _fit_scores(self.scores, self.parent_candidates)
+		self.model_instance, self.result, self.objective_progress, self.heuristic_progress = \
+			self._fit_scores(self.scores, self.parent_candidates)
+		
+		# Chosen parent set of every node, as indexes into self.parent_candidates
+		if self.model_instance is not None:
+			solution = self.model_instance.solution_values()
+			if self.preprocessed is not None:
+				solution = self.preprocessed.to_original(solution)
+			self.chosen_parent_sets = dict((node, candidate) for (node, candidate), value in solution.items() if value > 0.5)
+			
+			# (4) Parameters of the learned structure, for inference
+			self.node_parents = [list(self.parent_candidates[self.chosen_parent_sets[node]]) if node in self.chosen_parent_sets else []
+			                     for node in range(X.shape[1])]
+			self.inference_engine = inference.inference_engine.fit(
+				X, self.node_parents, arities, alpha=self.cpt_prior, batch_size=self.inference_batch_size
+			)
 		
 		return self
 
-	def predict(self, X):
-		# (4) Inference - use the graph structure
-		pass
+	def predict(self, X, target=None):
+		# (5) Inference - the most probable value of the target variable in every row of X,
+		# given the row's other values (negative values count as missing)
+		return np.argmax(self.predict_proba(X, target), axis=1)
+	
+	def predict_proba(self, X, target=None):
+		# P(target | the other values of the row), one row per row of X
+		if target is None:
+			target = self.target
+		if target is None:
+			raise inference.InvalidQueryError('No target variable given, and none set with target= when created.')
+		
+		return self.inference_engine.posterior(X, target)
 	
-	def _generate_parent_sets():
-		# Do something with self.parent_candidates, along with self.n_parents
-		pass
-
 	def _fit_scores(self, scores, parent_candidates):
-		if self.extra_constraints:
-			return cussens.solve_model(scores, parent_candidates, 
-		            self.solver, 
-					cycle_finding=self.cycle_finding, gomory_cut=self.gomory_cut, 
-					sink_heuristic=self.sink_heuristic, extra_constraints=self.extra_constraints
-			)
+		# With preprocessing, the model is built over the reduced candidate list, so the
+		# returned model instance uses its indexes; self.preprocessed maps them back.
+		if self.preprocess:
+			self.preprocessed = preprocessing.prune_dominated(scores, parent_candidates)
+			if self.verbose:
+				print('Preprocessing: ' + str(self.preprocessed.report()))
+			scores, parent_candidates = self.preprocessed.scores, self.preprocessed.parents
 		else:
-			return cussens.solve_model(scores, parent_candidates, 
-		            self.solver, cycle_finding=self.cycle_finding, gomory_cut=self.gomory_cut,
-					sink_heuristic=self.sink_heuristic
-			)
\ No newline at end of file
+			self.preprocessed = None
+		
+		solve_options = dict(
+			cycle_finding=self.cycle_finding, gomory_cut=self.gomory_cut,
+			sink_heuristic=self.sink_heuristic, cutoff=self.cutoff, persistent=self.persistent,
+			max_cycles=self.max_cycles, cycle_time_limit=self.cycle_time_limit,
+			cluster_heuristics=self.cluster_heuristics, max_cluster_cuts=self.max_cluster_cuts,
+			min_cluster_violation=self.min_cluster_violation,
+			cut_max_age=self.cut_max_age, max_active_cuts=self.max_active_cuts,
+			cut_cache=self.cut_cache, cut_cache_drop_slack=self.cut_cache_drop_slack,
+			decompose=self.decompose, component_jobs=self.component_jobs,
+			branch_and_cut=self.branch_and_cut, node_jobs=self.node_jobs, max_nodes=self.max_nodes,
+			time_limit=self.time_limit, gap_target=self.gap_target,
+			verbose=self.verbose, event_sinks=self.event_sinks,
+			profile_phases=self.profile_phases, trace_memory=self.trace_memory, keep_model=self.keep_model
+		)
+		if self.extra_constraints:
+			solve_options['extra_constraints'] = self.extra_constraints
+		
+		return cussens.solve_model(scores, parent_candidates, self.solver, **solve_options)
\ No newline at end of file
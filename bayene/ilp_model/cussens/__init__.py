@@ -1,3 +1,3 @@
 from .solution_controller import *
 
-__all__ = ['solution_controller', 'main_model', 'cluster_cut_model']
\ No newline at end of file
+__all__ = ['solution_controller', 'main_model', 'cluster_cut_model', 'branch_and_cut', 'cut_pool', 'cut_cache', 'decomposition', 'instrumentation', 'solution']
\ No newline at end of file
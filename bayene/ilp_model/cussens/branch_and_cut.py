@@ -0,0 +1,428 @@
+"""
+branch_and_cut.py: A branch-and-cut search driven from Python, for solvers that give no
+callbacks into their own tree search. Every node of the tree is the LP relaxation of the
+main model with the branching decisions on its path applied as variable bounds
+(model_writer.apply_branchings), on one model per evaluator that is reused from node to node.
+A node is solved and cut (cluster and cycle cuts) until no violated cut is left, and then
+either:
+  - pruned, if its LP bound is no better than the incumbent;
+  - accepted as a new incumbent, if its solution is integral;
+  - split on its most fractional variable into a child with the variable fixed to 1 and a
+    child with it fixed to 0.
+Open nodes are kept in a best-bound priority queue. Cluster and cycle cuts are valid for
+every DAG, so cuts found at any node go to a global pool that every later node starts with.
+The sink heuristic is run on every node's LP solution to improve the incumbent.
+
+With n_jobs > 1, up to n_jobs open nodes are taken from the queue at a time and evaluated in
+parallel by a multiprocessing pool, each worker keeping its own node_evaluator. No batch is
+made larger than the nodes left under max_nodes.
+"""
+import heapq
+import itertools
+import multiprocessing
+import time
+
+from pyomo.opt import TerminationCondition
+
+import bayene.ilp_solver
+
+from . import main_model
+from . import sparse_model
+from . import cycle_separator
+from . import cluster_separator
+from . import cut_pool
+from . import heuristics
+from .solution import structure_solution
+
+# Separation rounds at each node before branching on a still fractional solution
+DEFAULT_NODE_CUT_ROUNDS = 20
+
+# Distance from 0 or 1 under which a variable value is taken as integral
+INTEGRALITY_TOLERANCE = 1e-6
+
+class tree_results():
+	# Mirrors the parts of Pyomo's SolverResults that Bayene reads, for the whole search tree
+	def __init__(self, termination_condition, message, objective, bound):
+		self.solver = bayene.ilp_solver.sparse_solver_results.solver_info(termination_condition, message)
+		self.objective = objective
+		self.bound = bound
+
+class node_evaluator():
+	# Evaluates nodes on one relaxed model, built once: a node's branching decisions are applied
+	# as variable bounds and undone afterwards, and cuts stay in the model for later nodes, aged
+	# by a cut pool like in the cutting plane loop. With persistent=True (and a solver that has
+	# a persistent interface) the model is loaded into the solver once, and with cutoff=True a
+	# solver with a native cutoff option prunes nodes during the solve.
+
+	def __init__(self, scores, parents, solver, sparse_backend, cycle_finding=True, sink_heuristic=True,
+	             max_cycles=None, cluster_heuristics=True, max_cluster_cuts=cluster_separator.DEFAULT_MAX_CLUSTERS,
+	             min_cluster_violation=cluster_separator.MIN_VIOLATION, cut_rounds=DEFAULT_NODE_CUT_ROUNDS,
+	             persistent=False, cutoff=True, cut_max_age=cut_pool.DEFAULT_MAX_AGE, max_active_cuts=None):
+		self.scores = scores
+		self.parents = parents
+		self.solver = solver
+		self.sparse_backend = sparse_backend
+		self.cycle_finding = cycle_finding
+		self.max_cycles = max_cycles
+		self.cut_rounds = cut_rounds
+
+		self.sink_heuristic_finder = heuristics.sink_heuristic(scores, parents) if sink_heuristic else None
+
+		if sparse_backend:
+			self.problem = sparse_model.model_writer(scores, parents)
+		else:
+			self.problem = main_model.model_writer(scores, parents)
+		self.problem.relax()
+
+		self.cuts = cut_pool.cut_pool(self.problem, max_age=cut_max_age, max_active=max_active_cuts)
+
+		# The sub-IP of the cluster separator is kept alive across nodes as well
+		self.separator = cluster_separator.cluster_separator(
+			len(scores), parents, solver, sparse_backend, heuristics=cluster_heuristics,
+			max_clusters=max_cluster_cuts, min_violation=min_cluster_violation
+		)
+
+		self.native_cutoff = cutoff and bayene.ilp_solver.supports_native_cutoff(solver)
+
+		self.solver_session = None
+		if persistent and not sparse_backend and bayene.ilp_solver.supports_persistent(solver):
+			self.solver_session = bayene.ilp_solver.solver_session(self.problem.main_model, {}, solver)
+			self.problem.pop_new_constraints()
+
+	def evaluate(self, branchings, cuts, cutoff, time_limit=None):
+		# branchings: list of ((node, candidate), 'leq' or 'geq') on the path to this node
+		# cuts: clusters (sorted node tuples) from the global cut pool
+		# cutoff: the node is pruned as soon as its bound is no better than this (or None)
+		# time_limit: seconds the node may take, shared by its LP solves and cluster sub-IPs
+		# (None for no limit)
+		# Returns a dict with 'status' ('infeasible', 'pruned', 'integral', 'fractional',
+		# 'time_limit' or 'failed'), 'bound', 'solution' (non-zero values), 'cuts' found here,
+		# 'heuristic' ((score, solution) or None) and 'branching_key' for fractional nodes.
+
+		# Cuts other workers found since this model last saw the global pool
+		known_cuts = self.cuts.active | self.cuts.inactive
+		pool_cuts = [cluster_key for cluster_key in cuts if cluster_key not in known_cuts]
+		if len(pool_cuts) > 0:
+			self.problem.add_cluster_cuts([list(cluster_key) for cluster_key in pool_cuts])
+			self.cuts.register(pool_cuts)
+
+		self._update_variables(self.problem.apply_branchings(branchings))
+		try:
+			return self._evaluate(cutoff, time_limit)
+		finally:
+			self._update_variables(self.problem.clear_branchings())
+
+	def _evaluate(self, cutoff, time_limit):
+		problem = self.problem
+		solver_cutoff = cutoff if self.native_cutoff else None
+		deadline = time.time() + time_limit if time_limit is not None else None
+
+		result = {'status': 'failed', 'bound': None, 'solution': {}, 'cuts': [], 'heuristic': None, 'branching_key': None}
+
+		rounds = 0
+		while True:
+			# Every solve only gets what is left of the node's time
+			solver_options = {}
+			if deadline is not None:
+				remaining_time = deadline - time.time()
+				if remaining_time <= 0:
+					result['status'] = 'time_limit'
+					return result
+				solver_options = bayene.ilp_solver.time_limit_options(self.solver, remaining_time)
+
+			if self.sparse_backend:
+				solver_results = problem.solve(solver_options)
+			elif self.solver_session is not None:
+				self.solver_session.remove_constraints(problem.pop_removed_constraints())
+				self.solver_session.add_constraints(problem.pop_new_constraints())
+				solver_results = self.solver_session.solve(cutoff=solver_cutoff, options=solver_options)
+			else:
+				problem.pop_removed_constraints()
+				problem.pop_new_constraints()
+				solver_results = bayene.ilp_solver.call_solver(problem.main_model, solver_options, solver=self.solver,
+				                                               cutoff=solver_cutoff)
+
+			termination_condition = solver_results.solver.termination_condition
+			if termination_condition == TerminationCondition.infeasible:
+				result['status'] = 'infeasible'
+				return result
+			elif termination_condition in bayene.ilp_solver.CUTOFF_TERMINATION_CONDITIONS and solver_cutoff is not None:
+				result['status'] = 'pruned'
+				return result
+			elif termination_condition == TerminationCondition.maxTimeLimit and deadline is not None:
+				result['status'] = 'time_limit'
+				return result
+			elif termination_condition != TerminationCondition.optimal:
+				return result
+
+			result['bound'] = problem.objective_value()
+			if cutoff is not None and result['bound'] <= cutoff:
+				result['status'] = 'pruned'
+				return result
+
+			current_solution = problem.solution_values()
+			current_non_zero_solution = dict((key, value) for key, value in current_solution.items() if value > 0.0)
+			integral = all(value > 1 - INTEGRALITY_TOLERANCE for value in current_non_zero_solution.values()
+			               if value > INTEGRALITY_TOLERANCE)
+
+			# Cuts slack for too long are deactivated; deactivated ones this solution violates
+			# come back, and the node is solved again with them
+			reactivated_count = self.cuts.update(current_solution)
+
+			# A fractional solution is branched on once the round limit is reached, but an
+			# integral one is cut until it is acyclic
+			if not integral and rounds >= self.cut_rounds:
+				break
+			rounds += 1
+
+			if reactivated_count > 0:
+				continue
+
+			clusters_found, _ = self.separator.separate(
+				current_non_zero_solution, time_limit=deadline - time.time() if deadline is not None else None
+			)
+			if clusters_found is None:
+				if integral:
+					# Without the sub-IP, the solution is not known to be acyclic
+					if deadline is not None and time.time() >= deadline:
+						result['status'] = 'time_limit'
+					return result
+				clusters_found = []
+
+			if self.cycle_finding:
+				clusters_found = clusters_found + cycle_separator.find_violated_cycles(
+					current_solution, self.parents, max_cycles=self.max_cycles
+				)
+
+			new_clusters, reactivated_count = self.cuts.filter_new(clusters_found)
+			if len(new_clusters) == 0 and reactivated_count == 0:
+				break
+
+			if len(new_clusters) > 0:
+				new_cuts = [tuple(sorted(cluster_members)) for cluster_members in new_clusters]
+				problem.add_cluster_cuts([list(cluster_key) for cluster_key in new_cuts])
+				self.cuts.register(new_cuts)
+				result['cuts'].extend(new_cuts)
+
+		result['solution'] = current_non_zero_solution
+
+		if self.sink_heuristic_finder is not None:
+			heuristic_total_score, heuristic_solutions, sink_heuristic_found = self.sink_heuristic_finder.find(current_solution)
+			if sink_heuristic_found:
+				result['heuristic'] = (heuristic_total_score, heuristic_solutions)
+
+		if integral:
+			result['status'] = 'integral'
+		else:
+			result['status'] = 'fractional'
+			result['branching_key'] = most_fractional_key(current_non_zero_solution, self.scores)
+
+		return result
+
+	def _update_variables(self, variables):
+		if self.solver_session is not None:
+			self.solver_session.update_variables(variables)
+
+def most_fractional_key(current_non_zero_solution, scores):
+	# The variable closest to 0.5, ties broken by the higher local score
+	return max(current_non_zero_solution.keys(),
+	           key=lambda key: (-abs(current_non_zero_solution[key] - 0.5), scores[key[0]][key[1]]))
+
+# node_evaluator of a worker process, set up once by _initialise_worker()
+_worker_evaluator = None
+
+def _initialise_worker(evaluator_arguments, evaluator_options):
+	global _worker_evaluator
+
+	_worker_evaluator = node_evaluator(*evaluator_arguments, **evaluator_options)
+
+def _evaluate_node_task(task):
+	return _worker_evaluator.evaluate(*task)
+
+def solve(scores, parents, solver, sparse_backend, cycle_finding=True, sink_heuristic=True, n_jobs=1,
+          max_nodes=None, initial_cuts=None, time_limit=None, gap_target=None, log=print, keep_model=False,
+          **evaluator_options):
+	# Returns (best_solution, results, objective_progress, heuristic_progress) like
+	# solution_controller.solve_model(). best_solution is a structure_solution of the best
+	# DAG found (with keep_model, its model writer holds every cut in the global pool);
+	# objective_progress records the global
+	# upper bound and heuristic_progress the incumbent objective after each batch of nodes.
+	# initial_cuts (e.g. from a cut_cache) seed the global cut pool. The search also stops once
+	# time_limit seconds have passed or the relative gap is at most gap_target, and every node
+	# only gets the time left. Progress is reported through log.
+	start_time = time.time()
+	evaluator_arguments = (scores, parents, solver, sparse_backend, cycle_finding, sink_heuristic)
+
+	best_incumbent = bayene.ilp_solver.incumbent()
+
+	cut_pool = []
+	cut_pool_keys = set()
+	for cluster_members in (initial_cuts if initial_cuts is not None else []):
+		cluster_key = tuple(sorted(cluster_members))
+		if cluster_key not in cut_pool_keys:
+			cut_pool_keys.add(cluster_key)
+			cut_pool.append(cluster_key)
+
+	# Open nodes: (-bound inherited from the parent, sequence number, branchings)
+	sequence = itertools.count()
+	open_nodes = [(-float('inf'), next(sequence), [])]
+
+	# Nodes whose LP could not be solved are dropped, but their subtrees were never bounded:
+	# the best bound they inherited still bounds the tree
+	dropped_bound = None
+
+	stats = {'nodes': 0, 'pruned': 0, 'infeasible': 0, 'integral': 0, 'branched': 0, 'failed': 0, 'max_depth': 0}
+	objective_progress = []
+	heuristic_progress = []
+
+	pool = None
+	if n_jobs is None or n_jobs > 1:
+		pool = multiprocessing.Pool(processes=n_jobs, initializer=_initialise_worker,
+		                            initargs=(evaluator_arguments, evaluator_options))
+		batch_size = n_jobs if n_jobs is not None else multiprocessing.cpu_count()
+	else:
+		evaluator = node_evaluator(*evaluator_arguments, **evaluator_options)
+		batch_size = 1
+
+	try:
+		stop_reason = None
+		while len(open_nodes) > 0:
+			if max_nodes is not None and stats['nodes'] >= max_nodes:
+				stop_reason = (TerminationCondition.maxIterations, 'Node limit reached')
+				break
+			if time_limit is not None and time.time() - start_time >= time_limit:
+				stop_reason = (TerminationCondition.maxTimeLimit, 'Time limit reached')
+				break
+			if gap_target is not None and best_incumbent.objective is not None and tree_gap(open_nodes, best_incumbent, dropped_bound) <= gap_target:
+				stop_reason = (TerminationCondition.feasible, 'Gap target reached')
+				break
+
+			cutoff = best_incumbent.cutoff()
+
+			# The node limit caps the batch, so that parallel evaluation cannot overshoot it
+			node_budget = batch_size if max_nodes is None else min(batch_size, max_nodes - stats['nodes'])
+
+			batch = []
+			while len(open_nodes) > 0 and len(batch) < node_budget:
+				negative_bound, _, branchings = heapq.heappop(open_nodes)
+				if cutoff is not None and -negative_bound <= cutoff:
+					stats['pruned'] += 1
+					continue
+				batch.append((negative_bound, branchings))
+
+			if len(batch) == 0:
+				continue
+
+			remaining_time = time_limit - (time.time() - start_time) if time_limit is not None else None
+			tasks = [(branchings, list(cut_pool), cutoff, remaining_time) for _, branchings in batch]
+			if pool is not None:
+				node_results = pool.map(_evaluate_node_task, tasks, chunksize=1)
+			else:
+				node_results = [evaluator.evaluate(*task) for task in tasks]
+
+			for (negative_bound, branchings), node_result in zip(batch, node_results):
+				status = node_result['status']
+				if status == 'time_limit':
+					# Cut short by the time limit: the node goes back to the queue, and the loop stops
+					heapq.heappush(open_nodes, (negative_bound, next(sequence), branchings))
+				else:
+					stats['nodes'] += 1
+					stats['max_depth'] = max(stats['max_depth'], len(branchings))
+
+				for cluster_key in node_result['cuts']:
+					if cluster_key not in cut_pool_keys:
+						cut_pool_keys.add(cluster_key)
+						cut_pool.append(cluster_key)
+
+				if node_result['heuristic'] is not None:
+					best_incumbent.update(*node_result['heuristic'])
+
+				if status == 'integral':
+					stats['integral'] += 1
+					best_incumbent.update(node_result['bound'], node_result['solution'])
+				elif status == 'fractional':
+					if best_incumbent.objective is not None and node_result['bound'] <= best_incumbent.cutoff():
+						stats['pruned'] += 1
+						continue
+					stats['branched'] += 1
+					branching_key = node_result['branching_key']
+					for direction in ['geq', 'leq']:
+						heapq.heappush(open_nodes, (-node_result['bound'], next(sequence),
+						                            branchings + [(branching_key, direction)]))
+				elif status != 'time_limit':
+					stats[status] += 1
+					if status == 'failed':
+						log('Node at depth ' + str(len(branchings)) + ' could not be solved; dropping it.')
+						dropped_bound = -negative_bound if dropped_bound is None else max(dropped_bound, -negative_bound)
+
+			global_bound = tree_bound(open_nodes, best_incumbent, dropped_bound)
+			objective_progress.append(global_bound)
+			heuristic_progress.append(best_incumbent.objective)
+
+			log('Nodes evaluated = ' + str(stats['nodes']) + ', open = ' + str(len(open_nodes))
+			      + ', bound = ' + str(global_bound) + ', incumbent = ' + str(best_incumbent.objective)
+			      + ', cuts in pool = ' + str(len(cut_pool)))
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	global_bound = tree_bound(open_nodes, best_incumbent, dropped_bound)
+
+	# Dropped nodes leave the search unfinished, unless the incumbent beats their bound
+	unsolved = dropped_bound is not None and (best_incumbent.objective is None or dropped_bound > best_incumbent.objective)
+
+	if best_incumbent.objective is None:
+		if stop_reason is not None:
+			results = tree_results(stop_reason[0], stop_reason[1], None, global_bound)
+		elif unsolved:
+			results = tree_results(TerminationCondition.error, 'No feasible DAG found, and '
+			                       + str(stats['failed']) + ' nodes could not be solved', None, global_bound)
+		else:
+			results = tree_results(TerminationCondition.infeasible, 'No feasible DAG found', None, global_bound)
+		return None, results, objective_progress, heuristic_progress
+
+	if stop_reason is not None:
+		results = tree_results(stop_reason[0], stop_reason[1], best_incumbent.objective, global_bound)
+	elif unsolved:
+		results = tree_results(TerminationCondition.feasible, 'Search tree exhausted, but ' + str(stats['failed'])
+		                       + ' nodes could not be solved', best_incumbent.objective, global_bound)
+	else:
+		results = tree_results(TerminationCondition.optimal, 'Search tree exhausted', best_incumbent.objective, global_bound)
+
+	best_solution = structure_solution.from_solution(scores, parents, best_incumbent.solution,
+	                                                 objective=best_incumbent.objective, bound=global_bound,
+	                                                 gap=tree_gap(open_nodes, best_incumbent, dropped_bound))
+
+	if len(cut_pool) > 0:
+		best_solution.add_cluster_cuts_count = 1
+		best_solution.add_cluster_total_count = len(cut_pool)
+
+	if keep_model:
+		# Integral node solutions only carry their non-zero values
+		if sparse_backend:
+			model = sparse_model.model_writer(scores, parents)
+		else:
+			model = main_model.model_writer(scores, parents)
+		if len(cut_pool) > 0:
+			model.add_cluster_cuts([list(cluster_key) for cluster_key in cut_pool])
+		model.set_solution(dict((key, 1 if best_incumbent.solution.get(key, 0) > 0.5 else 0)
+		                        for key in model.solution_values().keys()))
+		best_solution.model = model
+
+	best_solution.branch_and_cut_stats = stats
+	best_solution.cut_keys = list(cut_pool)
+
+	return best_solution, results, objective_progress, heuristic_progress
+
+def tree_bound(open_nodes, best_incumbent, dropped_bound=None):
+	# Best bound over the open nodes and the nodes dropped unsolved (dropped_bound, or None),
+	# or the incumbent objective once the tree is exhausted
+	bounds = [bound for bound in [best_incumbent.objective, dropped_bound] if bound is not None]
+	if len(open_nodes) > 0:
+		bounds.append(-open_nodes[0][0])
+	return max(bounds) if len(bounds) > 0 else None
+
+def tree_gap(open_nodes, best_incumbent, dropped_bound=None):
+	# Relative gap between the tree bound and the incumbent
+	return (tree_bound(open_nodes, best_incumbent, dropped_bound) - best_incumbent.objective) / max(1e-10, abs(best_incumbent.objective))
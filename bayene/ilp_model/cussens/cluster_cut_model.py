@@ -1,39 +1,112 @@
 """
-cluster_cut_model.py: 
+cluster_cut_model.py: The cluster cut finding sub-IP. The model is kept alive between
+iterations of the main loop: update() only adds variables for parent set keys it has not
+seen before and replaces the objective coefficients with the current solution values.
+The variables, constraints and objective changed since the last pop_changes() are recorded,
+so that a persistent solver session only receives those.
 """
 from pyomo.environ import *
 
 class model_writer():
     def __init__(self, current_non_zero_solution, n_variables, parents):
-        
+
+        self.n_variables = n_variables
+        self.parents = parents
+        self.keys = []
+        self.key_set = set()
+
+        # Changes not yet sent to a persistent solver (see pop_changes)
+        self.new_variables = []
+        self.new_constraints = []
+        self.removed_constraints = []
+        self.objective_changed = False
+
         # Main Model Object
         self.main_model = ConcreteModel()
-        
-        # Non-zero variables I(W->v) in the main problem constitutes a set
-        self.main_model.parent_set_variable = Var(current_non_zero_solution.keys(), domain = Binary)
-        
+
+        # Non-zero variables I(W->v) in the main problem constitutes a set. Keys are added
+        # as they first appear in a solution, so the variable is indexed by Any.
+        self.main_model.parent_set_variable = Var(Any, dense = False, domain = Binary)
+
         # Among all the variable nodes, we choose the ones to be included in the cluster
         self.main_model.cluster_member_variable = Var(range(n_variables), domain = Binary)
-        
-        # -|C| + sum[x(W->v) * J(W->v)] > -1 ==> sum[x(W->v) * J(W->v)] -|C| > -1
-        def cluster_cut_objective_rule(model):
-            return sum(current_non_zero_solution[key] * model.parent_set_variable[key] for key in current_non_zero_solution.keys()) - sum(model.cluster_member_variable[node] for node in range(n_variables))
-        
-        self.main_model.objective = Objective(rule = cluster_cut_objective_rule, sense = maximize)
-    
-        def cluster_child_always_selected_rule(model, key0, key1):
-            return model.parent_set_variable[(key0, key1)] == model.cluster_member_variable[key0]
-        
-        self.main_model.cluster_child_always_selected = Constraint(current_non_zero_solution.keys(), rule = cluster_child_always_selected_rule)
-        
-        def cluster_parent_at_least_one_rule(model, key0, key1):
-            return model.parent_set_variable[(key0, key1)] <= sum(model.cluster_member_variable[parent] for parent in parents[key1])
-        
-        self.main_model.cluster_parent_at_least_one = Constraint(current_non_zero_solution.keys(), rule = cluster_parent_at_least_one_rule)
-        
+
+        # J(W->v) <= K(v): a parent set can only be counted if its child is in the cluster.
+        # (Keys from earlier solutions stay in the model with a zero objective coefficient,
+        # so this must not be an equality.)
+        self.main_model.cluster_child_always_selected = ConstraintList()
+
+        # J(W->v) <= sum[K(w) for w in W]: ... and if at least one of its parents is
+        self.main_model.cluster_parent_at_least_one = ConstraintList()
+
         self.main_model.cluster_size_at_least_two = Constraint(expr = summation(self.main_model.cluster_member_variable) >= 2)
-        
-        def objective_bigger_than_minus_one_rule(model):
-            return sum(current_non_zero_solution[key] * model.parent_set_variable[key] for key in current_non_zero_solution.keys()) - sum(model.cluster_member_variable[node] for node in range(n_variables)) >= -1
-        
-        self.main_model.objective_bigger_than_minus_one = Constraint(rule = objective_bigger_than_minus_one_rule)
\ No newline at end of file
+
+        # Clusters already found in this round, excluded so that the next solve finds another
+        self.main_model.no_good_cuts = ConstraintList()
+
+        self.update(current_non_zero_solution)
+
+    def update(self, current_non_zero_solution):
+        model = self.main_model
+
+        # No-good cuts only apply to the round they were added in. The ones a solver never
+        # received are simply forgotten.
+        unsent = set(id(constraint) for constraint in self.new_constraints)
+        for constraint in model.no_good_cuts.values():
+            if id(constraint) in unsent:
+                self.new_constraints = [other for other in self.new_constraints if other is not constraint]
+            else:
+                self.removed_constraints.append(constraint)
+        model.del_component(model.no_good_cuts)
+        model.no_good_cuts = ConstraintList()
+
+        for key in current_non_zero_solution.keys():
+            if key in self.key_set:
+                continue
+
+            self.keys.append(key)
+            self.key_set.add(key)
+
+            self.new_constraints.append(
+                model.cluster_child_always_selected.add(model.parent_set_variable[key] <= model.cluster_member_variable[key[0]])
+            )
+            self.new_constraints.append(model.cluster_parent_at_least_one.add(
+                model.parent_set_variable[key] <= sum(model.cluster_member_variable[parent] for parent in self.parents[key[1]])
+            ))
+            self.new_variables.append(model.parent_set_variable[key])
+
+        # -|C| + sum[x(W->v) * J(W->v)] > -1 ==> sum[x(W->v) * J(W->v)] -|C| > -1
+        # A violated cluster exists if the optimal objective is larger than -1.
+        if model.component('objective') is not None:
+            model.del_component(model.objective)
+
+        model.objective = Objective(
+            expr = sum(current_non_zero_solution[key] * model.parent_set_variable[key] for key in current_non_zero_solution.keys())
+                   - sum(model.cluster_member_variable[node] for node in range(self.n_variables)),
+            sense = maximize
+        )
+        self.objective_changed = True
+
+    def add_no_good(self, cluster_members):
+        # sum[K(v) for v not in C] + sum[1 - K(v) for v in C] >= 1
+        members = set(cluster_members)
+        model = self.main_model
+        self.new_constraints.append(model.no_good_cuts.add(
+            sum(model.cluster_member_variable[node] for node in range(self.n_variables) if node not in members)
+            - sum(model.cluster_member_variable[node] for node in members) >= 1 - len(members)
+        ))
+
+    def pop_changes(self):
+        # (new variables, new constraints, removed constraints, whether the objective was
+        # replaced) since the last call
+        changes = (self.new_variables, self.new_constraints, self.removed_constraints, self.objective_changed)
+        self.new_variables = []
+        self.new_constraints = []
+        self.removed_constraints = []
+        self.objective_changed = False
+        return changes
+
+    def cluster_members(self):
+        return [node for node in range(self.n_variables)
+                if self.main_model.cluster_member_variable[node].value is not None
+                and float(self.main_model.cluster_member_variable[node].value) > 0.5]
@@ -0,0 +1,245 @@
+"""
+cluster_separator.py: Layered search for violated cluster cuts in the current solution.
+
+A cluster C is violated when
+    sum[x(W->v) for v in C, W intersecting C] > |C| - 1,
+and the violation is the difference between the two sides. The layers are tried in order:
+  1. 'scc': the strongly connected components of the solution's support graph. For an
+     integer solution, a component with two or more nodes is always violated;
+  2. 'greedy': local search that grows clusters around the heaviest edges.
+Clusters from both layers are then shrunk while their violation does not drop, since cuts
+on small clusters are stronger than cuts on whole components.
+  3. 'sub_ip': the cluster cut sub-IP of cluster_cut_model (or sparse_cluster_cut_model),
+     built once and kept alive, with only its objective coefficients updated. With a solver
+     that has a persistent interface, the sub-IP is loaded into it once as well, and only the
+     changed variables, rows and objective are sent before each solve.
+Each round returns a batch of up to max_clusters distinct clusters, all violated by at least
+min_violation. The sub-IP is only used if the heuristic layers find nothing; it is then
+re-solved with a no-good constraint excluding each cluster already found, until the batch
+is full, no violated cluster is left or the time limit given to separate() runs out. The number of cuts found by each layer is kept in
+cluster_separator.stats.
+"""
+import time
+
+import networkx as nx
+from pyomo.opt import TerminationCondition
+
+import bayene.ilp_solver
+
+from . import cluster_cut_model
+from . import sparse_cluster_cut_model
+from .cycle_separator import solution_edges
+from .main_model import node_set_mask
+
+# Minimum violation for a cluster cut to be returned
+MIN_VIOLATION = 1e-6
+
+# Maximum number of cluster cuts returned per round
+DEFAULT_MAX_CLUSTERS = 10
+
+# Number of heaviest edges used as seeds by the greedy layer
+GREEDY_SEEDS = 10
+
+LAYERS = ['scc', 'greedy', 'sub_ip']
+
+class cluster_separator():
+
+	def __init__(self, n_variables, parents, solver, sparse_backend, heuristics=True,
+	             max_clusters=DEFAULT_MAX_CLUSTERS, min_violation=MIN_VIOLATION, instrumentation=None):
+		self.n_variables = n_variables
+		self.parents = parents
+		self.solver = solver
+		self.sparse_backend = sparse_backend
+		self.heuristics = heuristics
+		self.max_clusters = max_clusters
+		self.min_violation = max(min_violation, MIN_VIOLATION)
+
+		# Times the sub-IP as a 'cluster_sub_ip' phase (see instrumentation)
+		self.instrumentation = instrumentation
+
+		self.sub_ip_problem = None
+		self.sub_ip_session = None
+
+		self.stats = dict((layer, 0) for layer in LAYERS)
+		self.stats['none'] = 0
+
+	def separate(self, current_non_zero_solution, time_limit=None):
+		# Returns (clusters, layers): the violated clusters found this round, most violated first,
+		# and the layer that found each. clusters is empty if no violated cluster exists, or None
+		# if the heuristics found nothing and the sub-IP could not be solved. The sub-IP solves
+		# share time_limit seconds (None for no limit).
+		if self.heuristics:
+			entries = self._solution_entries(current_non_zero_solution)
+			
+			found = {}
+			for layer, candidates in [('scc', self._scc_clusters), ('greedy', self._greedy_clusters)]:
+				for cluster_members in candidates(current_non_zero_solution, entries):
+					cluster_key = frozenset(cluster_members)
+					if cluster_key in found:
+						continue
+					violation = cluster_violation(cluster_members, entries)
+					if violation > self.min_violation:
+						found[cluster_key] = (violation, sorted(cluster_members), layer)
+			
+			if len(found) > 0:
+				best = sorted(found.values(), key=lambda item: item[0], reverse=True)[:self.max_clusters]
+				for violation, cluster_members, layer in best:
+					self.stats[layer] += 1
+				return [cluster_members for _, cluster_members, _ in best], [layer for _, _, layer in best]
+		
+		if self.instrumentation is not None:
+			with self.instrumentation.phase('cluster_sub_ip'):
+				clusters = self._solve_sub_ip(current_non_zero_solution, time_limit)
+		else:
+			clusters = self._solve_sub_ip(current_non_zero_solution, time_limit)
+		
+		if clusters:
+			self.stats['sub_ip'] += len(clusters)
+			return clusters, ['sub_ip'] * len(clusters)
+		
+		self.stats['none'] += 1
+		return clusters, []
+	
+	def _solution_entries(self, current_non_zero_solution):
+		# (child, parent set bitmask, value) for every non-zero variable
+		return [(node, node_set_mask(self.parents[candidate]), value)
+		        for (node, candidate), value in current_non_zero_solution.items()]
+
+	def _scc_clusters(self, current_non_zero_solution, entries):
+		support_graph = nx.DiGraph()
+		support_graph.add_edges_from(solution_edges(current_non_zero_solution, self.parents).keys())
+
+		for component in nx.strongly_connected_components(support_graph):
+			if len(component) >= 2:
+				yield list(self._shrink(set(component), entries))
+
+	def _greedy_clusters(self, current_non_zero_solution, entries):
+		edge_values = solution_edges(current_non_zero_solution, self.parents)
+
+		# Seed with the pairs of nodes joined by the heaviest edges in both directions
+		pair_values = {}
+		for (parent, node), value in edge_values.items():
+			pair = (min(parent, node), max(parent, node))
+			pair_values[pair] = pair_values.get(pair, 0.0) + value
+
+		seeds = sorted(pair_values.items(), key=lambda item: item[1], reverse=True)[:GREEDY_SEEDS]
+		involved_nodes = set(node for (_, node) in edge_values.keys()) | set(parent for (parent, _) in edge_values.keys())
+
+		tried = set()
+		for (first, second), _ in seeds:
+			cluster = self._local_search(set([first, second]), involved_nodes, entries)
+			cluster_key = frozenset(cluster)
+			if cluster_key not in tried:
+				tried.add(cluster_key)
+				yield list(cluster)
+
+	def _local_search(self, cluster, involved_nodes, entries):
+		# Add the node that increases the violation most while it improves, then shrink
+		best_violation = cluster_violation(cluster, entries)
+
+		improved = True
+		while improved:
+			improved = False
+			best_move = None
+			for node in involved_nodes - cluster:
+				violation = cluster_violation(cluster | set([node]), entries)
+				if violation > best_violation + MIN_VIOLATION:
+					best_violation, best_move = violation, node
+			if best_move is not None:
+				cluster = cluster | set([best_move])
+				improved = True
+
+		return self._shrink(cluster, entries)
+
+	def _shrink(self, cluster, entries):
+		# Drop nodes as long as the violation does not decrease
+		best_violation = cluster_violation(cluster, entries)
+
+		shrunk = True
+		while shrunk and len(cluster) > 2:
+			shrunk = False
+			for node in sorted(cluster):
+				violation = cluster_violation(cluster - set([node]), entries)
+				if violation >= best_violation - MIN_VIOLATION:
+					best_violation = violation
+					cluster = cluster - set([node])
+					shrunk = True
+					break
+
+		return cluster
+
+	def _solve_sub_ip(self, current_non_zero_solution, time_limit=None):
+		deadline = time.time() + time_limit if time_limit is not None else None
+		
+		if self.sub_ip_problem is None:
+			if self.sparse_backend:
+				self.sub_ip_problem = sparse_cluster_cut_model.model_writer(current_non_zero_solution, self.n_variables, self.parents)
+			else:
+				self.sub_ip_problem = cluster_cut_model.model_writer(current_non_zero_solution, self.n_variables, self.parents)
+		else:
+			self.sub_ip_problem.update(current_non_zero_solution)
+		
+		clusters = []
+		while len(clusters) < self.max_clusters:
+			solver_options = {}
+			if deadline is not None:
+				remaining_time = deadline - time.time()
+				if remaining_time <= 0:
+					return clusters if len(clusters) > 0 else None
+				solver_options = bayene.ilp_solver.time_limit_options(self.solver, remaining_time)
+			
+			sub_ip_objective = self._solve_sub_ip_once(solver_options)
+			
+			if sub_ip_objective is None:
+				# Keep what this round found before the solver failed
+				return clusters if len(clusters) > 0 else None
+			
+			# The cluster is violated only if the objective is strictly larger than -1
+			if not sub_ip_objective > -1 + self.min_violation:
+				break
+			
+			cluster_members = self.sub_ip_problem.cluster_members()
+			clusters.append(cluster_members)
+			
+			# Exclude this cluster, so that the next solve returns a different one
+			self.sub_ip_problem.add_no_good(cluster_members)
+		
+		return clusters
+	
+	def _solve_sub_ip_once(self, solver_options):
+		# Returns the sub-IP objective, or None if it could not be solved
+		if self.sparse_backend:
+			sub_ip_results = self.sub_ip_problem.solve(solver_options)
+			if sub_ip_results.solver.termination_condition != TerminationCondition.optimal:
+				return None
+			return self.sub_ip_problem.objective
+		
+		sub_ip_solver_options = dict(solver_options)
+		sub_ip_solver_options["LogFile"] = ''
+		
+		# Send the cluster cut IP problem to the solver: as a whole the first time, and after that
+		# only what changed if the solver is persistent
+		if self.sub_ip_session is None and bayene.ilp_solver.supports_persistent(self.solver):
+			self.sub_ip_session = bayene.ilp_solver.solver_session(self.sub_ip_problem.main_model, {}, self.solver)
+			self.sub_ip_problem.pop_changes()
+		
+		if self.sub_ip_session is not None:
+			new_variables, new_constraints, removed_constraints, objective_changed = self.sub_ip_problem.pop_changes()
+			self.sub_ip_session.remove_constraints(removed_constraints)
+			self.sub_ip_session.add_variables(new_variables)
+			self.sub_ip_session.add_constraints(new_constraints)
+			if objective_changed:
+				self.sub_ip_session.set_objective(self.sub_ip_problem.main_model.objective)
+			sub_ip_results = self.sub_ip_session.solve(options=sub_ip_solver_options)
+		else:
+			self.sub_ip_problem.pop_changes()
+			sub_ip_results = bayene.ilp_solver.call_solver(self.sub_ip_problem.main_model, sub_ip_solver_options,
+			                                               solver=self.solver)
+		if sub_ip_results.solver.termination_condition != TerminationCondition.optimal:
+			return None
+		return self.sub_ip_problem.main_model.objective()
+
+def cluster_violation(cluster_members, entries):
+	cluster_mask = node_set_mask(cluster_members)
+	lhs = sum(value for (node, parent_mask, value) in entries if (cluster_mask >> node) & 1 and parent_mask & cluster_mask)
+	return lhs - (len(cluster_members) - 1)
@@ -0,0 +1,94 @@
+"""
+cut_cache.py: On-disk cache of the cluster and cycle cuts found for a set of scores, so that
+solving the same scores again (with other options, after a crash, or with other
+extra_constraints) starts from the cuts found before instead of rediscovering them.
+
+Cuts only depend on the nodes and candidate parent sets, never on the options of a solve,
+so the cache file is keyed by a SHA-256 digest of the scores and parents:
+  <cache_dir>/<digest>.cuts.npz
+Every cut is stored as a bitmask over the nodes, packed into a row of a uint8 matrix.
+Saving merges the new cuts into the ones already in the file.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+VERSION = 1
+
+class InvalidCutCacheError(Exception):
+	def __init__(self, value):
+		self.value = value
+	def __str__(self):
+		return repr(self.value)
+
+def scores_digest(scores, parents):
+	# Digest of every node's candidates and scores and of the candidates' parent sets
+	digest = hashlib.sha256()
+	digest.update(np.array([VERSION, len(scores), len(parents)], dtype=np.int64).tobytes())
+
+	for node_scores in scores:
+		candidates = np.array(sorted(node_scores.keys()), dtype=np.int64)
+		digest.update(np.array([len(candidates)], dtype=np.int64).tobytes())
+		digest.update(candidates.tobytes())
+		digest.update(np.array([node_scores[candidate] for candidate in candidates.tolist()], dtype=np.float64).tobytes())
+
+	parent_sizes = np.array([len(parent_set) for parent_set in parents], dtype=np.int64)
+	digest.update(parent_sizes.tobytes())
+	digest.update(np.array([parent for parent_set in parents for parent in parent_set], dtype=np.int64).tobytes())
+
+	return digest.hexdigest()
+
+def clusters_to_masks(clusters, n_nodes):
+	members = np.zeros((len(clusters), n_nodes), dtype=bool)
+	for row, cluster_members in enumerate(clusters):
+		members[row, list(cluster_members)] = True
+	return np.packbits(members, axis=1)
+
+def masks_to_clusters(masks, n_nodes):
+	members = np.unpackbits(masks, axis=1, count=n_nodes).astype(bool)
+	return [tuple(np.flatnonzero(row).tolist()) for row in members]
+
+class cut_cache():
+
+	def __init__(self, cache_dir, scores, parents):
+		self.cache_dir = cache_dir
+		self.n_nodes = len(scores)
+		self.digest = scores_digest(scores, parents)
+		self.path = os.path.join(cache_dir, self.digest + '.cuts.npz')
+
+	def load(self):
+		# Returns the cached cuts as sorted node tuples (empty if there is no cache file yet)
+		if not os.path.exists(self.path):
+			return []
+
+		with np.load(self.path) as cache_file:
+			if int(cache_file['version']) != VERSION or int(cache_file['n_nodes']) != self.n_nodes:
+				raise InvalidCutCacheError('Cut cache ' + self.path + ' does not match the given scores.')
+			masks = cache_file['masks']
+
+		return masks_to_clusters(masks, self.n_nodes)
+
+	def save(self, clusters, merge=True):
+		# Merge the given cuts into the cache file, or replace its cuts with them if merge is
+		# False. Returns the number of cuts now cached.
+		cached_clusters = self.load() if merge else []
+		known = set(cached_clusters)
+		for cluster_members in clusters:
+			cluster_key = tuple(sorted(cluster_members))
+			if cluster_key not in known:
+				known.add(cluster_key)
+				cached_clusters.append(cluster_key)
+
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir)
+
+		# Write into a temporary file first and move it into place, so that readers never
+		# see a half-written cache
+		temp_path = self.path + '.tmp' + str(os.getpid())
+		with open(temp_path, 'wb') as cache_file:
+			np.savez(cache_file, version=np.int64(VERSION), n_nodes=np.int64(self.n_nodes),
+			         masks=clusters_to_masks(cached_clusters, self.n_nodes))
+		os.replace(temp_path, self.path)
+
+		return len(cached_clusters)
@@ -0,0 +1,121 @@
+"""
+cut_pool.py: Keeps track of the cluster and cycle cuts of a main model between iterations.
+After every solve, the slack of each cut at the new solution,
+    slack = |C| - 1 - sum[x(W->v) for v in C, W intersecting C],
+is recorded. A cut that has been slack for max_age rounds in a row is deactivated
+(model_writer.deactivate_cuts), so the solver stops carrying it. A deactivated cut that
+becomes violated again is reactivated instead of being added a second time, and the number
+of rounds it may stay slack doubles with every reactivation so that it cannot keep coming
+and going. If more than max_active cuts are active, the never reactivated ones slack for
+longest are deactivated first (so the limit is a soft one).
+"""
+
+# Rounds a cut may stay slack before it is deactivated
+DEFAULT_MAX_AGE = 10
+
+# Slack under which a cut counts as binding, and violation above which it is reactivated
+SLACK_TOLERANCE = 1e-6
+
+class cut_pool():
+
+	def __init__(self, problem, max_age=DEFAULT_MAX_AGE, max_active=None):
+		self.problem = problem
+		self.max_age = max_age
+		self.max_active = max_active
+
+		# cut key (sorted tuple of nodes) -> (node, candidate) keys in the cut's left hand side
+		self.cut_candidates = {}
+		# cut key -> number of consecutive rounds the cut has been slack
+		self.age = {}
+		# cut key -> number of times the cut was reactivated
+		self.reactivations = {}
+		self.active = set()
+		self.inactive = set()
+
+		self.stats = {'added': 0, 'deactivated': 0, 'reactivated': 0, 'max_active': 0}
+
+	def filter_new(self, clusters):
+		# Returns (the clusters not in the pool yet, the number of cuts reactivated). Clusters
+		# already in the pool are reactivated if needed rather than added again.
+		new_clusters = []
+		new_keys = set()
+		reactivate = []
+		for cluster_members in clusters:
+			cut_key = tuple(sorted(cluster_members))
+			if cut_key in self.inactive:
+				reactivate.append(cut_key)
+			elif cut_key not in self.active and cut_key not in new_keys:
+				new_keys.add(cut_key)
+				new_clusters.append(cluster_members)
+
+		self._activate(reactivate)
+		return new_clusters, len(reactivate)
+
+	def register(self, clusters):
+		# Record cuts just added to the model
+		for cluster_members in clusters:
+			cut_key = tuple(sorted(cluster_members))
+			self.cut_candidates[cut_key] = self.problem.cluster_candidates(cut_key)
+			self.age[cut_key] = 0
+			self.reactivations[cut_key] = 0
+			self.active.add(cut_key)
+			self.stats['added'] += 1
+
+		self.stats['max_active'] = max(self.stats['max_active'], len(self.active))
+
+	def update(self, current_solution):
+		# Age the cuts against the current solution. Returns the number of cuts reactivated,
+		# which the caller must treat like newly added cuts.
+		reactivate = []
+		for cut_key in self.inactive:
+			if self.slack(cut_key, current_solution) < -SLACK_TOLERANCE:
+				reactivate.append(cut_key)
+
+		deactivate = []
+		for cut_key in self.active:
+			if self.slack(cut_key, current_solution) > SLACK_TOLERANCE:
+				self.age[cut_key] += 1
+				if self.max_age is not None and self.age[cut_key] >= self.max_age << self.reactivations[cut_key]:
+					deactivate.append(cut_key)
+			else:
+				self.age[cut_key] = 0
+
+		self._deactivate(deactivate)
+
+		if self.max_active is not None and len(self.active) > self.max_active:
+			# Only slack cuts are dropped, oldest first, so the current solution stays feasible
+			slack_cuts = sorted((cut_key for cut_key in self.active if self.age[cut_key] > 0 and self.reactivations[cut_key] == 0),
+			                    key=lambda cut_key: self.age[cut_key], reverse=True)
+			self._deactivate(slack_cuts[:len(self.active) - self.max_active])
+
+		self._activate(reactivate)
+		return len(reactivate)
+
+	def slack(self, cut_key, current_solution):
+		return len(cut_key) - 1 - sum(current_solution.get(key, 0.0) for key in self.cut_candidates[cut_key])
+
+	def report(self):
+		stats = dict(self.stats)
+		stats['active'] = len(self.active)
+		stats['inactive'] = len(self.inactive)
+		return stats
+
+	def _deactivate(self, cut_keys):
+		if len(cut_keys) == 0:
+			return
+		self.problem.deactivate_cuts(cut_keys)
+		self.active.difference_update(cut_keys)
+		self.inactive.update(cut_keys)
+		self.stats['deactivated'] += len(cut_keys)
+
+	def _activate(self, cut_keys):
+		if len(cut_keys) == 0:
+			return
+		self.problem.activate_cuts(cut_keys)
+		self.inactive.difference_update(cut_keys)
+		self.active.update(cut_keys)
+		for cut_key in cut_keys:
+			self.age[cut_key] = 0
+			self.reactivations[cut_key] += 1
+		self.stats['reactivated'] += len(cut_keys)
+		self.stats['max_active'] = max(self.stats['max_active'], len(self.active))
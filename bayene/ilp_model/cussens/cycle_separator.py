@@ -0,0 +1,83 @@
+"""
+cycle_separator.py: Finds violated cycle cuts in a (possibly fractional) solution of the main
+model, without enumerating every elementary cycle.
+
+Each edge u -> v of the solution graph gets the value x(u->v), the total value of the
+candidates of v whose parent set contains u, and the weight 1 - x(u->v). A cycle whose
+weights sum to less than 1 violates its cycle cut, so the most violated cycles are the
+shortest ones: for each edge u -> v, a shortest path v ~> u closes a candidate cycle.
+The number of cycles returned per round and the time spent looking for them are both capped.
+"""
+import heapq
+import timeit
+
+import networkx as nx
+
+# Values below this are treated as zero when building the solution graph
+EDGE_TOLERANCE = 1e-6
+
+# Added to every edge weight so that, among equally violated cycles, shorter ones come first
+LENGTH_PENALTY = 1e-6
+
+# Minimum violation for a cycle cut to be returned
+MIN_VIOLATION = 1e-6
+
+def solution_edges(current_solution, parents):
+	# x(u->v) for every edge with a non-zero value
+	edge_values = {}
+	for (node, candidate), value in current_solution.items():
+		if value <= EDGE_TOLERANCE:
+			continue
+		for parent in parents[candidate]:
+			edge_values[(parent, node)] = edge_values.get((parent, node), 0.0) + value
+	return edge_values
+
+def cycle_violation(cycle, current_solution, parents):
+	# Left-hand side of the cycle (cluster) cut minus its right-hand side |C| - 1
+	cycle_members = set(cycle)
+	lhs = sum(value for (node, candidate), value in current_solution.items()
+	          if node in cycle_members and not cycle_members.isdisjoint(parents[candidate]))
+	return lhs - (len(cycle_members) - 1)
+
+def find_violated_cycles(current_solution, parents, max_cycles=None, time_limit=None):
+	# Returns up to max_cycles violated cycles (as node lists), most violated first.
+	# Stops searching after time_limit seconds; cycles found so far are still returned.
+	start_time = timeit.default_timer()
+
+	edge_values = solution_edges(current_solution, parents)
+
+	bn_graph = nx.DiGraph()
+	for (parent, node), value in edge_values.items():
+		bn_graph.add_edge(parent, node, weight=max(0.0, 1.0 - value) + LENGTH_PENALTY)
+
+	# Edges with the largest values close the most violated cycles, so try them first
+	ordered_edges = sorted(edge_values.items(), key=lambda item: item[1], reverse=True)
+
+	found = {}
+	for (parent, node), value in ordered_edges:
+		if time_limit is not None and timeit.default_timer() - start_time > time_limit:
+			break
+
+		# Any cycle through this edge that can still be violated weighs less than 1
+		edge_weight = bn_graph[parent][node]['weight']
+		budget = 1.0 - edge_weight
+		if budget <= 0.0:
+			continue
+
+		try:
+			distance, path = nx.single_source_dijkstra(bn_graph, node, target=parent, cutoff=budget)
+		except nx.NetworkXNoPath:
+			continue
+
+		cycle_key = frozenset(path)
+		if cycle_key in found:
+			continue
+
+		violation = cycle_violation(path, current_solution, parents)
+		if violation > MIN_VIOLATION:
+			found[cycle_key] = (violation, path)
+
+	best = heapq.nlargest(max_cycles, found.values(), key=lambda item: item[0]) if max_cycles is not None \
+		else sorted(found.values(), key=lambda item: item[0], reverse=True)
+
+	return [path for violation, path in best]
@@ -0,0 +1,212 @@
+"""
+decomposition.py: Splits a structure learning problem into independent subproblems.
+
+Nodes u and v are in the same component if u appears in a candidate parent set of v (or the
+other way around), closed transitively; components are found with union-find. No candidate
+parent set crosses components, so no cycle can either, and the ILP separates exactly: the
+optimal DAG is the union of the optimal DAGs of the components, and the optimal score is the
+sum of their scores. Each component is re-indexed and solved by solution_controller.solve_model
+in a process of its own, and the results are merged back into the original indexes. A
+component of a single node needs no solver: it takes its best-scoring candidate.
+"""
+import multiprocessing
+import time
+
+from pyomo.opt import TerminationCondition
+
+from . import main_model
+from . import sparse_model
+from . import branch_and_cut
+from .solution import structure_solution, COUNTERS
+
+class union_find():
+
+	def __init__(self, n_elements):
+		self.parent = list(range(n_elements))
+		self.rank = [0] * n_elements
+
+	def find(self, element):
+		root = element
+		while self.parent[root] != root:
+			root = self.parent[root]
+		# Path compression
+		while self.parent[element] != root:
+			self.parent[element], element = root, self.parent[element]
+		return root
+
+	def union(self, first, second):
+		first_root, second_root = self.find(first), self.find(second)
+		if first_root == second_root:
+			return
+		if self.rank[first_root] < self.rank[second_root]:
+			first_root, second_root = second_root, first_root
+		self.parent[second_root] = first_root
+		if self.rank[first_root] == self.rank[second_root]:
+			self.rank[first_root] += 1
+
+def find_components(scores, parents):
+	# Components as sorted lists of nodes, largest first
+	components = union_find(len(scores))
+	for node, node_scores in enumerate(scores):
+		for candidate in node_scores.keys():
+			for parent in parents[candidate]:
+				components.union(node, parent)
+
+	members = {}
+	for node in range(len(scores)):
+		members.setdefault(components.find(node), []).append(node)
+
+	return sorted(members.values(), key=lambda component_nodes: (-len(component_nodes), component_nodes[0]))
+
+class component_problem():
+	# The scores and parents of one component, with nodes and candidates re-indexed from 0
+
+	def __init__(self, scores, parents, nodes):
+		self.nodes = nodes
+		node_index = dict((node, index) for index, node in enumerate(nodes))
+
+		self.candidates = sorted(set(candidate for node in nodes for candidate in scores[node].keys()))
+		candidate_index = dict((candidate, index) for index, candidate in enumerate(self.candidates))
+
+		self.scores = [dict((candidate_index[candidate], score) for candidate, score in scores[node].items()) for node in nodes]
+		self.parents = [[node_index[parent] for parent in parents[candidate]] for candidate in self.candidates]
+
+	def to_original(self, solution):
+		return dict(((self.nodes[key[0]], self.candidates[key[1]]), value) for key, value in solution.items())
+
+def _solve_component_task(task):
+	# Imported here, since solution_controller imports this module
+	from . import solution_controller
+
+	sub_scores, sub_parents, solver, cycle_finding, gomory_cut, sink_heuristic, deadline, options = task
+
+	# A component only gets the time left until the deadline, and is not started past it
+	if deadline is not None:
+		remaining_time = deadline - time.time()
+		if remaining_time <= 0:
+			return {'solution': None, 'termination_condition': str(TerminationCondition.maxTimeLimit)}
+		options = dict(options, time_limit=remaining_time)
+
+	best_solution, solver_results, objective_progress, heuristic_progress = solution_controller.solve_model(
+		sub_scores, sub_parents, solver, cycle_finding, gomory_cut, sink_heuristic, **options
+	)
+
+	# Only plain values go back to the parent process, not the model itself. A component
+	# without a DAG reports why: proved infeasible, out of time, or a solver failure.
+	if best_solution is None:
+		return {'solution': None, 'termination_condition': str(solver_results.solver.termination_condition)}
+
+	solution = dict((key, value) for key, value in best_solution.solution_values().items() if value > 0.5)
+	counts = dict((name, getattr(best_solution, name)) for name in COUNTERS)
+
+	return {
+		'solution': solution, 'objective': best_solution.objective_value(), 'counts': counts,
+		'bound': getattr(best_solution, 'bound', best_solution.objective_value()),
+		'termination_condition': str(solver_results.solver.termination_condition),
+		'objective_progress': objective_progress, 'heuristic_progress': heuristic_progress
+	}
+
+def _solve_singleton(problem):
+	# The optimum of a one-node component is its best-scoring candidate
+	node_scores = problem.scores[0]
+	best_candidate = max(node_scores, key=node_scores.get)
+
+	return {
+		'solution': {(0, best_candidate): 1.0}, 'objective': node_scores[best_candidate],
+		'counts': dict((name, 0) for name in COUNTERS), 'bound': node_scores[best_candidate],
+		'termination_condition': str(TerminationCondition.optimal), 'objective_progress': [], 'heuristic_progress': []
+	}
+
+def solve(scores, parents, components, solver, sparse_backend, cycle_finding, gomory_cut, sink_heuristic,
+          n_jobs=1, keep_model=False, deadline=None, **options):
+	# Returns (best_solution, results, objective_progress, heuristic_progress) like
+	# solution_controller.solve_model(), for the whole problem. best_solution is a
+	# structure_solution of the merged DAG, with the cut counters summed over the components
+	# (and, with keep_model, a model writer over the original scores holding the DAG). The
+	# progress lists sum the components' progress, each component counting with its final
+	# value once it has finished. deadline (a time.time() value) bounds the whole solve: each
+	# component is given the time left when it starts, and none is started after it.
+	problems = [component_problem(scores, parents, nodes) for nodes in components]
+
+	options = dict(options)
+	options['decompose'] = False
+
+	# Only components of two or more nodes go to the solver
+	solved_indexes = [index for index, problem in enumerate(problems) if len(problem.nodes) > 1]
+	tasks = [(problems[index].scores, problems[index].parents, solver, cycle_finding, gomory_cut, sink_heuristic,
+	          deadline, options) for index in solved_indexes]
+
+	if len(tasks) > 1 and (n_jobs is None or n_jobs > 1):
+		pool = multiprocessing.Pool(processes=n_jobs)
+		try:
+			solved_results = pool.map(_solve_component_task, tasks, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		solved_results = [_solve_component_task(task) for task in tasks]
+
+	component_results = [_solve_singleton(problem) if len(problem.nodes) == 1 else None for problem in problems]
+	for index, component_result in zip(solved_indexes, solved_results):
+		component_results[index] = component_result
+
+	# Without a DAG for every component there is none for the whole problem. That is only
+	# reported as infeasible if a component's solver proved it; a component that ran out of
+	# time (or was never started) makes it a time limit stop.
+	failed_conditions = [component_result['termination_condition'] for component_result in component_results
+	                     if component_result['solution'] is None]
+	if len(failed_conditions) > 0:
+		if str(TerminationCondition.infeasible) in failed_conditions:
+			results = branch_and_cut.tree_results(TerminationCondition.infeasible, 'A component has no feasible DAG', None, None)
+		elif str(TerminationCondition.maxTimeLimit) in failed_conditions:
+			results = branch_and_cut.tree_results(TerminationCondition.maxTimeLimit,
+			                                      'Time limit reached before every component had a DAG', None, None)
+		else:
+			results = branch_and_cut.tree_results(TerminationCondition(failed_conditions[0]),
+			                                      'A component could not be solved', None, None)
+		return None, results, [], []
+
+	solution = {}
+	for problem, component_result in zip(problems, component_results):
+		solution.update(problem.to_original(component_result['solution']))
+
+	best_solution = structure_solution.from_solution(scores, parents, solution)
+
+	if keep_model:
+		if sparse_backend:
+			model = sparse_model.model_writer(scores, parents)
+		else:
+			model = main_model.model_writer(scores, parents)
+		model.set_solution(dict((key, 1 if key in solution else 0) for key in model.solution_values().keys()))
+		best_solution.model = model
+
+	# Cut counters of the model writers, summed over the components
+	for name in COUNTERS:
+		setattr(best_solution, name, sum(component_result['counts'][name] for component_result in component_results))
+
+	best_solution.component_sizes = [len(nodes) for nodes in components]
+
+	# Each component's bound holds independently, so they add up like the objectives
+	objective = sum(component_result['objective'] for component_result in component_results)
+	bound = sum(component_result['bound'] for component_result in component_results)
+	best_solution.bound = bound
+	best_solution.gap = (bound - objective) / max(1e-10, abs(objective))
+
+	if all(component_result['termination_condition'] == str(TerminationCondition.optimal) for component_result in component_results):
+		results = branch_and_cut.tree_results(TerminationCondition.optimal, 'All components solved', objective, objective)
+	else:
+		results = branch_and_cut.tree_results(TerminationCondition.feasible, 'Some components not solved to optimality', objective, bound)
+
+	objective_progress = merge_progress([component_result['objective_progress'] for component_result in component_results],
+	                                    [component_result['objective'] for component_result in component_results])
+	heuristic_progress = merge_progress([component_result['heuristic_progress'] for component_result in component_results],
+	                                    [component_result['objective'] for component_result in component_results])
+
+	return best_solution, results, objective_progress, heuristic_progress
+
+def merge_progress(progress_lists, final_values):
+	# Element-wise sum over the components, padding each list with its component's final value
+	length = max(len(progress) for progress in progress_lists)
+	return [sum(progress[step] if step < len(progress) and progress[step] is not None else final_value
+	            for progress, final_value in zip(progress_lists, final_values))
+	        for step in range(length)]
@@ -0,0 +1,154 @@
+"""
+heuristics.py: Primal heuristics that turn the current (possibly fractional or cyclic) solution
+of the main model into a feasible DAG, whose score is a lower bound on the optimum.
+
+sink_heuristic builds the DAG from the sinks upwards: among the undecided nodes, it picks the
+one whose best remaining parent set has the value closest to 1 in the current solution, makes
+it the next sink with that parent set, and rules out every parent set of the remaining nodes
+that contains it. The per-node candidate orders and the parent -> containing candidates index
+are computed once, so each call only walks arrays. The resulting DAG is then improved by hill
+climbing: each node switches to its best-scoring parent set that keeps the graph acyclic.
+"""
+import numpy as np
+
+from .main_model import node_set_mask
+
+# Maximum number of passes over the nodes during hill climbing
+MAX_HILL_CLIMBING_PASSES = 10
+
+class sink_heuristic():
+
+	def __init__(self, scores, parents, hill_climbing=True):
+		self.scores = scores
+		self.parents = parents
+		self.hill_climbing = hill_climbing
+		self.n_nodes = len(scores)
+
+		# Candidates of each node sorted by decreasing score
+		self.sorted_candidates = []
+		self.sorted_scores = []
+		self.sorted_masks = []
+		for node in range(self.n_nodes):
+			candidates = np.array(list(scores[node].keys()), dtype=np.int64)
+			node_scores = np.array([scores[node][candidate] for candidate in candidates], dtype=float)
+			order = np.argsort(-node_scores, kind='stable')
+			self.sorted_candidates.append(candidates[order])
+			self.sorted_scores.append(node_scores[order])
+			self.sorted_masks.append([node_set_mask(parents[candidate]) for candidate in candidates[order]])
+
+		# parent -> (node, position in the node's sorted candidates) of every candidate containing it
+		containing_nodes = [[] for _ in range(self.n_nodes)]
+		containing_positions = [[] for _ in range(self.n_nodes)]
+		for node in range(self.n_nodes):
+			for position, candidate in enumerate(self.sorted_candidates[node]):
+				for parent in parents[candidate]:
+					containing_nodes[parent].append(node)
+					containing_positions[parent].append(position)
+		self.containing_nodes = [np.array(nodes, dtype=np.int64) for nodes in containing_nodes]
+		self.containing_positions = [np.array(positions, dtype=np.int64) for positions in containing_positions]
+
+	def find(self, current_solution):
+		# Returns (total score, solution dict over all (node, candidate) keys, found flag)
+		chosen_positions = self._sink_positions(current_solution)
+
+		if chosen_positions is None:
+			return float('-inf'), {}, False
+
+		if self.hill_climbing:
+			chosen_positions = self._hill_climb(chosen_positions)
+
+		heuristic_total_score = float(sum(self.sorted_scores[node][chosen_positions[node]] for node in range(self.n_nodes)))
+
+		heuristic_solutions = {}
+		for node in range(self.n_nodes):
+			for position, candidate in enumerate(self.sorted_candidates[node].tolist()):
+				heuristic_solutions[(node, candidate)] = 1 if position == chosen_positions[node] else 0
+
+		return heuristic_total_score, heuristic_solutions, True
+
+	def _sink_positions(self, current_solution):
+		# Current solution values aligned with each node's sorted candidates
+		values = [np.array([current_solution.get((node, candidate), 0.0) for candidate in self.sorted_candidates[node].tolist()])
+		          for node in range(self.n_nodes)]
+
+		ruled_out = [np.zeros(len(self.sorted_candidates[node]), dtype=bool) for node in range(self.n_nodes)]
+		first_available = np.zeros(self.n_nodes, dtype=np.int64)
+		undecided = np.ones(self.n_nodes, dtype=bool)
+		chosen_positions = np.zeros(self.n_nodes, dtype=np.int64)
+
+		for _ in range(self.n_nodes):
+			best_node = -1
+			best_value = -np.inf
+
+			for node in np.flatnonzero(undecided):
+				# Skip the ruled out candidates at the front of this node's order
+				position = first_available[node]
+				while position < len(ruled_out[node]) and ruled_out[node][position]:
+					position += 1
+				first_available[node] = position
+
+				# Every parent set of this node has been ruled out: no heuristic solution
+				if position == len(ruled_out[node]):
+					return None
+
+				if values[node][position] > best_value:
+					best_node = node
+					best_value = values[node][position]
+
+			# best_node becomes the next sink with its best remaining parent set
+			chosen_positions[best_node] = first_available[best_node]
+			undecided[best_node] = False
+
+			# Rule out all the parent candidates that have this node as member
+			nodes = self.containing_nodes[best_node]
+			positions = self.containing_positions[best_node]
+			for node, position in zip(nodes.tolist(), positions.tolist()):
+				ruled_out[node][position] = True
+
+		return chosen_positions
+
+	def _hill_climb(self, chosen_positions):
+		chosen_positions = chosen_positions.copy()
+
+		# Children of every node in the current DAG, kept up to date as nodes switch
+		children = [set() for _ in range(self.n_nodes)]
+		for node in range(self.n_nodes):
+			for parent in self._parent_set(node, chosen_positions[node]):
+				children[parent].add(node)
+
+		for _ in range(MAX_HILL_CLIMBING_PASSES):
+			improved = False
+
+			for node in range(self.n_nodes):
+				# A parent set keeps the graph acyclic iff it contains no descendant of the node
+				descendants = descendants_mask(node, children)
+
+				for position in range(chosen_positions[node]):
+					if not self.sorted_masks[node][position] & descendants:
+						for parent in self._parent_set(node, chosen_positions[node]):
+							children[parent].discard(node)
+						for parent in self._parent_set(node, position):
+							children[parent].add(node)
+						chosen_positions[node] = position
+						improved = True
+						break
+
+			if not improved:
+				break
+
+		return chosen_positions
+
+	def _parent_set(self, node, position):
+		return self.parents[self.sorted_candidates[node][position]]
+
+def descendants_mask(node, children):
+	# Bitmask of node and everything reachable from it
+	mask = 1 << node
+	stack = [node]
+	while stack:
+		current = stack.pop()
+		for child in children[current]:
+			if not (mask >> child) & 1:
+				mask |= 1 << child
+				stack.append(child)
+	return mask
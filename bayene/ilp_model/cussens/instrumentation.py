@@ -0,0 +1,173 @@
+"""
+instrumentation.py: Structured telemetry of a solve_session.
+
+Every phase of the cutting plane loop (model building, the main solve, cluster separation and
+its sub-IP, cycle finding, the sink heuristic, ...) is timed in wall-clock and CPU seconds, and
+each iteration reports the model size, the cuts added, the bound and the incumbent. These are
+emitted as events (plain dicts) to any number of sinks:
+  - memory_recorder: keeps the events in a list
+  - jsonl_sink: appends them to a JSON lines file
+  - callback_sink: passes them to a function
+A file path or a function given as a sink is wrapped in jsonl_sink or callback_sink.
+
+Console output of the solve goes through instrumentation.log(), and can be turned off with
+verbose=False. With profile=True, each top-level phase runs under cProfile and its event carries
+the most expensive functions; with trace_memory=True, the current and peak memory allocated
+during the phase (from tracemalloc).
+"""
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+# Functions listed in the profile of a phase
+DEFAULT_PROFILE_LIMIT = 20
+
+class memory_recorder():
+
+	def __init__(self):
+		self.events = []
+
+	def emit(self, event):
+		self.events.append(event)
+
+	def close(self):
+		pass
+
+	def of_type(self, event_type):
+		return [event for event in self.events if event['event'] == event_type]
+
+class jsonl_sink():
+
+	def __init__(self, path, mode='a'):
+		self.path = path
+		self.output_file = open(path, mode)
+
+	def emit(self, event):
+		self.output_file.write(json.dumps(event, default=str) + '\n')
+		self.output_file.flush()
+
+	def close(self):
+		self.output_file.close()
+
+class callback_sink():
+
+	def __init__(self, callback):
+		self.callback = callback
+
+	def emit(self, event):
+		self.callback(event)
+
+	def close(self):
+		pass
+
+def as_sink(sink):
+	if isinstance(sink, str):
+		return jsonl_sink(sink)
+	if hasattr(sink, 'emit'):
+		return sink
+	if callable(sink):
+		return callback_sink(sink)
+	raise TypeError('Not an event sink: ' + repr(sink))
+
+class instrumentation():
+
+	def __init__(self, sinks=None, verbose=True, profile=False, trace_memory=False, profile_limit=DEFAULT_PROFILE_LIMIT):
+		self.sinks = [as_sink(sink) for sink in (sinks if sinks is not None else [])]
+		self.verbose = verbose
+		self.profile = profile
+		self.trace_memory = trace_memory
+		self.profile_limit = profile_limit
+
+		# Iteration the events belong to (None outside the cutting plane loop)
+		self.iteration = None
+
+		# Phase name -> {'calls', 'wall', 'cpu'} summed over the solve
+		self.phase_totals = {}
+
+		self.start_time = time.time()
+		self.depth = 0
+
+		# tracemalloc is only stopped again if this object started it
+		self.started_tracing = False
+		if trace_memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self.started_tracing = True
+
+	def log(self, message=''):
+		if self.verbose:
+			print(message)
+
+	def emit(self, event_type, **fields):
+		if len(self.sinks) == 0:
+			return
+		event = {'event': event_type, 'time': time.time() - self.start_time, 'iteration': self.iteration}
+		event.update(fields)
+		for sink in self.sinks:
+			sink.emit(event)
+
+	@contextlib.contextmanager
+	def phase(self, name, **fields):
+		# Times the enclosed block and emits a 'phase' event for it. Phases may nest (an outer
+		# phase's times include the inner ones), but only top-level phases are profiled.
+		top_level = self.depth == 0
+		self.depth += 1
+
+		profiler = None
+		if self.profile and top_level:
+			profiler = cProfile.Profile()
+			profiler.enable()
+		if self.trace_memory and top_level:
+			tracemalloc.reset_peak()
+
+		start_time = time.time()
+		start_cpu_time = time.process_time()
+		try:
+			yield
+		finally:
+			wall_time = time.time() - start_time
+			cpu_time = time.process_time() - start_cpu_time
+			self.depth -= 1
+
+			totals = self.phase_totals.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+			totals['calls'] += 1
+			totals['wall'] += wall_time
+			totals['cpu'] += cpu_time
+
+			event = dict(fields)
+			event.update({'phase': name, 'wall': wall_time, 'cpu': cpu_time})
+
+			if profiler is not None:
+				profiler.disable()
+				event['profile'] = profile_summary(profiler, self.profile_limit)
+			if self.trace_memory and top_level:
+				event['memory_current'], event['memory_peak'] = tracemalloc.get_traced_memory()
+
+			self.emit('phase', **event)
+
+	def close(self):
+		# Emits the phase totals and closes the sinks
+		self.emit('summary', phases=self.phase_totals, total_wall=time.time() - self.start_time)
+		for sink in self.sinks:
+			sink.close()
+		if self.started_tracing:
+			tracemalloc.stop()
+			self.started_tracing = False
+
+def profile_summary(profiler, limit=DEFAULT_PROFILE_LIMIT):
+	# The most expensive functions by cumulative time, as plain dicts
+	stats = pstats.Stats(profiler, stream=io.StringIO())
+	stats.sort_stats('cumulative')
+
+	functions = []
+	for function in stats.fcn_list[:limit]:
+		primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[function]
+		functions.append({
+			'function': pstats.func_std_string(function), 'calls': calls,
+			'total_time': total_time, 'cumulative_time': cumulative_time
+		})
+
+	return functions
@@ -4,6 +4,18 @@ the main Pyomo model object and functions to create additional Constraint object
 if needed during the solution process.
 """
 from pyomo.environ import *
+from pyomo.core.expr.visitor import identify_variables
+
+def as_cluster_list(clusters):
+    if len(clusters) > 0 and not hasattr(clusters[0], '__iter__'):
+        return [clusters]
+    return clusters
+
+def node_set_mask(nodes):
+    mask = 0
+    for node in nodes:
+        mask |= 1 << node
+    return mask
 
 class model_writer():
     
@@ -12,23 +24,50 @@ class model_writer():
         self.scores = scores
         self.parents = parents
         self.main_model = ConcreteModel()
+
+        # Kept on the Pyomo model too, so that its solution can be turned into a graph on its own
+        self.main_model.candidate_parents = parents
         
         self.add_cluster_cuts_count = 0
+        self.add_cluster_total_count = 0
         self.add_cycle_cuts_count = 0
         self.add_cycle_total_count = 0
         self.add_branching_count = 0
+        
+        # Constraint components added since the last call to pop_new_constraints(),
+        # so that a persistent solver session only receives the new rows
+        self.new_constraints = []
+        self.removed_constraints = []
+
+        # Every cluster or cycle cut row, keyed by its cluster as a sorted tuple of nodes,
+        # so that a cut pool can deactivate and reactivate single cuts
+        self.cut_constraints = {}
+
+        # Variables whose bounds apply_branchings() changed, until clear_branchings()
+        self.branched_variables = []
     
+        # Index of the candidate parent sets of each node, and every parent set as an integer
+        # bitmask of its members, so that cuts only visit the candidates of their own nodes
+        # and test parent set membership with a single AND
+        self.node_candidates = [list(node_scores.keys()) for node_scores in scores]
+        self.parent_masks = [node_set_mask(parent_set) for parent_set in parents]
+        
         # Create range sets representing nodes and parents
         self.main_model.nodes_set = RangeSet(0, len(scores) - 1)
     
         # Only consider candidates that are actually feasible for each nodes (variables)
         def actual_parent_candidate_rule(model):
-            return [(node, candidate) for node in model.nodes_set for candidate in self.scores[node].keys()]
+            return [(node, candidate) for node in model.nodes_set for candidate in self.node_candidates[node]]
     
         self.main_model.candidates_set = Set(initialize = actual_parent_candidate_rule, dimen=2)
     
         # Decision Variable
         self.main_model.chosen_parent_variable = Var(self.main_model.candidates_set, domain = Binary)
+
+        # A node with a single candidate (e.g. after preprocessing.prune_dominated) must take it
+        for node in range(len(scores)):
+            if len(self.node_candidates[node]) == 1:
+                self.main_model.chosen_parent_variable[node, self.node_candidates[node][0]].fix(1)
     
         # Objective
         def maximise_global_score_rule(model):      
@@ -41,21 +80,24 @@ class model_writer():
         # Only one parent set should be selected for each nodes
         def only_one_parent_set_rule(model, node):
             return sum(model.chosen_parent_variable[node, candidate]
-                       for candidate in [matching[1] for matching in model.candidates_set if matching[0] == node]) == 1
+                       for candidate in self.node_candidates[node]) == 1
     
         self.main_model.only_one_parent_set_constraint = Constraint(self.main_model.nodes_set, rule = only_one_parent_set_rule)
 
-    def add_cluster_cuts(self, cluster_members):        
+    def add_cluster_cuts(self, clusters):
+        # clusters is a list of clusters (lists of nodes), added together as one indexed
+        # constraint block. A single cluster given as a flat list of nodes is accepted too.
+        clusters = as_cluster_list(clusters)
+
         self.add_cluster_cuts_count += 1
+        self.add_cluster_total_count += len(clusters)
 
-        def cluster_constraint_rule(model):
-            return sum(model.chosen_parent_variable[candidate]
-            for node in cluster_members
-            for candidate in model.candidates_set if candidate[0] == node and not set(cluster_members).isdisjoint(self.parents[candidate[1]])
-            ) <= len(cluster_members) - 1
+        def cluster_constraint_rule(model, cluster_index):
+            return self._cluster_expression(clusters[cluster_index]) <= len(clusters[cluster_index]) - 1
         
         # Add the cluster cuts to the main model
-        self.main_model.add_component('clusterCons'+str(self.add_cluster_cuts_count)+'_branch_'+str(self.add_branching_count), Constraint(rule = cluster_constraint_rule))
+        self._add_cut_constraint('clusterCons'+str(self.add_cluster_cuts_count)+'_branch_'+str(self.add_branching_count),
+                                 Constraint(range(len(clusters)), rule = cluster_constraint_rule), clusters)
     
     def add_cycle_cuts(self, cycles):
         # Since add_component in Pyomo requires unique names for each constraints, we assign unique serials
@@ -67,21 +109,128 @@ class model_writer():
         
         # Defined rule for one cycle
         def cycle_cuts_rule(model, cycle_index):
-            return sum(model.chosen_parent_variable[candidate]
-            for node in self.cycles[cycle_index]
-            for candidate in model.candidates_set if candidate[0] == node and not set(self.cycles[cycle_index]).isdisjoint(self.parents[candidate[1]])
-            ) <= len(self.cycles[cycle_index]) - 1
+            return self._cluster_expression(self.cycles[cycle_index]) <= len(self.cycles[cycle_index]) - 1
     
         # Generate and add constraints for each cycles found
-        self.main_model.add_component('cycleCons'+str(self.add_cycle_cuts_count)+'_branch_'+str(self.add_branching_count)+'_'+str(self.add_cycle_total_count),
-                                     Constraint(range(len(self.cycles)), rule=cycle_cuts_rule))
+        self._add_cut_constraint('cycleCons'+str(self.add_cycle_cuts_count)+'_branch_'+str(self.add_branching_count)+'_'+str(self.add_cycle_total_count),
+                                 Constraint(range(len(self.cycles)), rule=cycle_cuts_rule), self.cycles)
 
     def add_branching(self, variable_to_branch_key, direction):
         self.add_branching_count += 1
         
         if direction == 'leq':
-            self.main_model.add_component('branch_'+str(self.add_branching_count)+'_leq'+'_'+str(variable_to_branch_key),
-                                          Constraint(expr=self.main_model.chosen_parent_variable[variable_to_branch_key[0], variable_to_branch_key[1]] == 0))
+            self._add_constraint('branch_'+str(self.add_branching_count)+'_leq'+'_'+str(variable_to_branch_key),
+                                 Constraint(expr=self.main_model.chosen_parent_variable[variable_to_branch_key[0], variable_to_branch_key[1]] == 0))
         elif direction == 'geq':
-            self.main_model.add_component('branch_'+str(self.add_branching_count)+'_geq'+'_'+str(variable_to_branch_key),
-                                          Constraint(expr=self.main_model.chosen_parent_variable[variable_to_branch_key[0], variable_to_branch_key[1]] == 1))
\ No newline at end of file
+            self._add_constraint('branch_'+str(self.add_branching_count)+'_geq'+'_'+str(variable_to_branch_key),
+                                 Constraint(expr=self.main_model.chosen_parent_variable[variable_to_branch_key[0], variable_to_branch_key[1]] == 1))
+
+    def apply_branchings(self, branchings):
+        # Applies branching decisions ((node, candidate), 'leq' or 'geq') as variable bounds
+        # instead of constraints, so that one model serves every node of a branch-and-cut
+        # tree. Returns the variables changed, which a persistent solver must be told about.
+        variables = []
+        for variable_to_branch_key, direction in branchings:
+            variable = self.main_model.chosen_parent_variable[variable_to_branch_key[0], variable_to_branch_key[1]]
+            if direction == 'leq':
+                variable.setub(0)
+            elif direction == 'geq':
+                variable.setlb(1)
+            variables.append(variable)
+
+        self.branched_variables.extend(variables)
+        return variables
+
+    def clear_branchings(self):
+        # Undoes apply_branchings(): the variables are left with the bounds of their domain
+        variables = self.branched_variables
+        for variable in variables:
+            variable.setlb(None)
+            variable.setub(None)
+
+        self.branched_variables = []
+        return variables
+
+    def relax(self):
+        # LP relaxation of the model: the decision variables become continuous in [0, 1]
+        for variable in self.main_model.chosen_parent_variable.values():
+            variable.domain = UnitInterval
+
+    def cluster_candidates(self, cluster_members):
+        # (node, candidate) keys of the cluster's nodes whose parent set intersects the cluster
+        cluster_mask = node_set_mask(cluster_members)
+        return [(node, candidate)
+                for node in cluster_members
+                for candidate in self.node_candidates[node] if self.parent_masks[candidate] & cluster_mask]
+
+    def solution_values(self):
+        # Current value of every decision variable, keyed by (node, candidate)
+        return dict(((key[0], key[1]), float(variable.value) if variable.value is not None else 0.0)
+                    for key, variable in self.main_model.chosen_parent_variable.items())
+
+    def set_solution(self, solution):
+        # Replace all the current variable values with the given ones (e.g. for warmstart);
+        # variables missing from the solution are cleared
+        for key, variable in self.main_model.chosen_parent_variable.items():
+            variable.set_value(solution.get((key[0], key[1])))
+
+    def objective_value(self):
+        return self.main_model.objective()
+
+    def model_size(self):
+        # Active rows, columns and non-zero coefficients of the model as the solver sees it
+        rows = 0
+        nonzeros = 0
+        for constraint in self.main_model.component_data_objects(Constraint, active=True):
+            rows += 1
+            nonzeros += sum(1 for _ in identify_variables(constraint.body))
+        return {'rows': rows, 'columns': len(self.main_model.chosen_parent_variable), 'nonzeros': nonzeros}
+
+    def set_objective_cutoff(self, cutoff):
+        # objective >= cutoff as an explicit row, for solvers without a cutoff option.
+        # The row is replaced rather than modified, so that persistent solvers see the new value.
+        if self.main_model.component('objective_cutoff') is not None:
+            old_constraint = self.main_model.objective_cutoff
+            if old_constraint in self.new_constraints:
+                self.new_constraints.remove(old_constraint)
+            else:
+                self.removed_constraints.append(old_constraint)
+            self.main_model.del_component(old_constraint)
+
+        self._add_constraint('objective_cutoff', Constraint(expr = self.main_model.objective.expr >= cutoff))
+
+    def deactivate_cuts(self, cut_keys):
+        for cut_key in cut_keys:
+            constraint = self.cut_constraints[cut_key]
+            if constraint.active:
+                constraint.deactivate()
+                self.removed_constraints.append(constraint)
+
+    def activate_cuts(self, cut_keys):
+        for cut_key in cut_keys:
+            constraint = self.cut_constraints[cut_key]
+            if not constraint.active:
+                constraint.activate()
+                self.new_constraints.append(constraint)
+
+    def pop_removed_constraints(self):
+        removed_constraints = self.removed_constraints
+        self.removed_constraints = []
+        return removed_constraints
+
+    def pop_new_constraints(self):
+        new_constraints = self.new_constraints
+        self.new_constraints = []
+        return new_constraints
+
+    def _cluster_expression(self, cluster_members):
+        return sum(self.main_model.chosen_parent_variable[key] for key in self.cluster_candidates(cluster_members))
+
+    def _add_cut_constraint(self, name, constraint, clusters):
+        self._add_constraint(name, constraint)
+        for index, cluster_members in enumerate(clusters):
+            self.cut_constraints[tuple(sorted(cluster_members))] = constraint[index]
+
+    def _add_constraint(self, name, constraint):
+        self.main_model.add_component(name, constraint)
+        self.new_constraints.append(constraint)
@@ -0,0 +1,98 @@
+"""
+solution.py: The result of a structure learning solve. Instead of a copy of the whole model
+with every cut it accumulated, a structure_solution keeps the chosen candidate parent set of
+each node (an integer array), the objective, the bound and gap, and the solve statistics.
+Edges, parent bitmasks and a NetworkX graph are derived from the chosen candidates on demand.
+
+The model writer itself is only kept with keep_model=True (see solution_controller); its
+attributes (e.g. main_model) are then reachable through the solution as well.
+"""
+import numpy as np
+import networkx as nx
+
+from .main_model import node_set_mask
+
+# Cut counters of the model writers
+COUNTERS = ['add_cluster_cuts_count', 'add_cluster_total_count', 'add_cycle_cuts_count',
+            'add_cycle_total_count', 'add_branching_count']
+
+# Statistics attached to a solution by the solve, reported by stats() when present
+STATS = ['cluster_separation_stats', 'cut_pool_stats', 'branch_and_cut_stats', 'component_sizes']
+
+class structure_solution():
+
+	def __init__(self, scores, parents, chosen, objective=None, bound=None, gap=None, model=None):
+		# chosen[node]: the candidate (index into parents) chosen for the node, -1 if none
+		self.parents = parents
+		self.chosen = np.asarray(chosen, dtype=np.int64)
+		self.n_nodes = len(scores)
+
+		if objective is None:
+			objective = sum(scores[node][int(candidate)] for node, candidate in enumerate(self.chosen) if candidate >= 0)
+		self.objective = objective
+
+		self.bound = bound
+		self.gap = gap
+		self.model = model
+
+		for name in COUNTERS:
+			setattr(self, name, 0)
+
+	@classmethod
+	def from_solution(cls, scores, parents, solution, **kwargs):
+		# From values keyed by (node, candidate); values above 0.5 count as chosen
+		chosen = np.full(len(scores), -1, dtype=np.int64)
+		for (node, candidate), value in solution.items():
+			if value > 0.5:
+				chosen[node] = candidate
+		return cls(scores, parents, chosen, **kwargs)
+
+	@classmethod
+	def from_model(cls, problem, keep_model=False, **kwargs):
+		# From the current solution of a model writer, with its cut counters
+		best_solution = cls.from_solution(problem.scores, problem.parents, problem.solution_values(),
+		                                  model=problem if keep_model else None, **kwargs)
+		for name in COUNTERS:
+			setattr(best_solution, name, getattr(problem, name))
+		return best_solution
+
+	def __getattr__(self, name):
+		# Only reached for attributes the solution does not have itself
+		model = self.__dict__.get('model')
+		if model is not None:
+			return getattr(model, name)
+		raise AttributeError("'structure_solution' has no attribute '" + name + "' (pass keep_model=True to keep the model)")
+
+	def objective_value(self):
+		return self.objective
+
+	def solution_values(self):
+		# The chosen (node, candidate) keys with value 1
+		return dict(((node, int(candidate)), 1.0) for node, candidate in enumerate(self.chosen) if candidate >= 0)
+
+	def chosen_parent_sets(self):
+		return dict((node, int(candidate)) for node, candidate in enumerate(self.chosen) if candidate >= 0)
+
+	def parent_masks(self):
+		# Parents of every node as a bitmask over the nodes
+		return [node_set_mask(self.parents[candidate]) if candidate >= 0 else 0 for candidate in self.chosen]
+
+	@property
+	def edges(self):
+		# (parent, child) rows of an integer array
+		edges = [(parent, node) for node, candidate in enumerate(self.chosen) if candidate >= 0
+		         for parent in self.parents[candidate]]
+		return np.array(edges, dtype=np.int64).reshape(-1, 2)
+
+	def to_networkx(self):
+		bn_graph = nx.DiGraph()
+		bn_graph.add_nodes_from(range(self.n_nodes))
+		bn_graph.add_edges_from(self.edges.tolist())
+		return bn_graph
+
+	def stats(self):
+		stats = dict((name, getattr(self, name)) for name in COUNTERS)
+		for name in STATS:
+			if name in self.__dict__:
+				stats[name] = self.__dict__[name]
+		return stats
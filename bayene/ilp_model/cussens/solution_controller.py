@@ -2,15 +2,25 @@
 solution_controller.py: 
 """
 import six
-import sys
-import copy
-import operator
+import time
 import networkx as nx
 from pyomo.opt import TerminationCondition
 import bayene.ilp_solver
 
 from . import main_model
-from . import cluster_cut_model
+from . import sparse_model
+from . import cycle_separator
+from . import cluster_separator
+from . import heuristics
+from . import branch_and_cut
+from . import cut_pool
+from . import cut_cache
+from . import decomposition
+from . import instrumentation
+from .solution import structure_solution
+
+# Default cap on the cycle cuts added per iteration
+DEFAULT_MAX_CYCLES = 100
 
 def generate_solver_options(solver, gomory_cut):
 	options = {}
@@ -32,61 +42,358 @@ def generate_solver_options(solver, gomory_cut):
 	return options
 
 def solve_model(scores, parents, solver, cycle_finding, gomory_cut, sink_heuristic, **kwargs):
+	# Runs a solve_session to the end. Returns (best_solution, solver_results, objective_progress, heuristic_progress).
+	return solve_session(scores, parents, solver, cycle_finding, gomory_cut, sink_heuristic, **kwargs).run()
+
+class solve_session():
+	# All the state of one structure learning solve. Nothing is shared between sessions, so
+	# several of them can run side by side in threads or processes. The cutting plane loop can
+	# be driven one iteration at a time with step(), or to the end with run():
+	#
+	#     session = solve_session(scores, parents, 'appsi_highs', True, False, True)
+	#     while not session.step():
+	#         print(session.iteration, session.objective_progress[-1:])
+	#     best_solution, solver_results, objective_progress, heuristic_progress = session.result()
+	#
+	# Decomposed and branch-and-cut solves (see decomposition and branch_and_cut) run as a
+	# single step.
+	#
+	# Anytime mode: with time_limit (seconds of wall-clock time) or gap_target (relative gap
+	# between the bound and the incumbent), the session stops as soon as either is reached and
+	# returns the best DAG found so far. best_solution.bound and best_solution.gap certify how
+	# far it can be from the optimum.
+	#
+	# best_solution is a solution.structure_solution; the model writer behind it is only kept
+	# (as best_solution.model) with keep_model=True.
+	#
+	# Phase timings, model sizes and per-iteration progress go to self.instrumentation (see
+	# instrumentation), built from the event_sinks, verbose, profile_phases and trace_memory
+	# options unless an instrumentation object is given.
 	
-	# Variables to be globally used throughout ilp_model.cussens module
-	# Not using class here because we want everything to be accessed as cussens.<name>
-	global scores_input, parents_input, solver_input, cycle_finding_input, gomory_cut_input
+	def __init__(self, scores, parents, solver, cycle_finding, gomory_cut, sink_heuristic, **kwargs):
+		self.scores = scores
+		self.parents = parents
+		self.solver = solver
+		self.cycle_finding = cycle_finding
+		self.gomory_cut = gomory_cut
+		self.sink_heuristic = sink_heuristic
+		self.options = kwargs
+		self.keep_model = kwargs.get('keep_model', False)
+		
+		self.owns_instrumentation = kwargs.get('instrumentation') is None
+		if self.owns_instrumentation:
+			self.instrumentation = instrumentation.instrumentation(
+				sinks=kwargs.get('event_sinks', None),
+				verbose=kwargs.get('verbose', True),
+				profile=kwargs.get('profile_phases', False),
+				trace_memory=kwargs.get('trace_memory', False)
+			)
+		else:
+			self.instrumentation = kwargs['instrumentation']
+		
+		# Cycle separation limits: cycles added per iteration, and seconds spent searching for them
+		self.max_cycles = kwargs.get('max_cycles', DEFAULT_MAX_CYCLES)
+		self.cycle_time_limit = kwargs.get('cycle_time_limit', None)
+		
+		# Solvers in ilp_solver.SPARSE_SOLVERS use the sparse matrix model, which is solved
+		# in-process without building Pyomo objects.
+		self.sparse_backend = solver in bayene.ilp_solver.SPARSE_SOLVERS
+		
+		self.cluster_options = {
+			'cluster_heuristics': kwargs.get('cluster_heuristics', True),
+			'max_cluster_cuts': kwargs.get('max_cluster_cuts', cluster_separator.DEFAULT_MAX_CLUSTERS),
+			'min_cluster_violation': kwargs.get('min_cluster_violation', cluster_separator.MIN_VIOLATION)
+		}
+		
+		# Anytime limits, and the best upper bound on the optimum proved so far (from the solver's
+		# dual bound on each relaxation). The time limit
+		# counts from here, so model building and every component or node share one deadline.
+		self.time_limit = kwargs.get('time_limit', None)
+		self.gap_target = kwargs.get('gap_target', None)
+		self.start_time = time.time()
+		self.deadline = self.start_time + self.time_limit if self.time_limit is not None else None
+		self.upper_bound = None
+		
+		# Solution Process Control
+		self.finished = False
+		self.iteration = 0
+		self.solver_results = None
+		self.best_solution = None
+		self.objective_progress = []
+		self.heuristic_progress = []
+		
+		# If the candidate parent sets split the nodes into independent components, each one is
+		# solved as a problem of its own (in component_jobs processes) and the DAGs are merged
+		self.components = None
+		if kwargs.get('decompose', True):
+			components = decomposition.find_components(scores, parents)
+			if len(components) > 1:
+				self.components = components
+				return
+		
+		# Cuts found by earlier solves of the same scores, kept under the cut_cache directory
+		self.cut_store = None
+		self.cached_cuts = []
+		if kwargs.get('cut_cache') is not None:
+			self.cut_store = cut_cache.cut_cache(kwargs['cut_cache'], scores, parents)
+			self.cached_cuts = self.cut_store.load()
+			self.log('Loaded ' + str(len(self.cached_cuts)) + ' cached cuts from ' + self.cut_store.path)
+		
+		# Branch-and-cut driven from here instead of by the solver: nodes are LP relaxations,
+		# evaluated in a process pool if node_jobs > 1
+		self.use_branch_and_cut = kwargs.get('branch_and_cut', False)
+		self.best_incumbent = bayene.ilp_solver.incumbent()
+		if self.use_branch_and_cut:
+			return
+		
+		with self.instrumentation.phase('build'):
+			# Generate initial problem
+			if self.sparse_backend:
+				self.current_problem = sparse_model.model_writer(scores, parents)
+			else:
+				self.current_problem = main_model.model_writer(scores, parents)
+			
+			# Generate solver options for the solver selected
+			self.solver_options = generate_solver_options(solver, gomory_cut)
+			
+			# Cluster cuts are searched with fast heuristics first and the sub-IP only as a fallback.
+			# The sub-IP model is kept alive across iterations.
+			self.cluster_cut_separator = cluster_separator.cluster_separator(
+				len(scores), parents, solver, self.sparse_backend,
+				heuristics=self.cluster_options['cluster_heuristics'], max_clusters=self.cluster_options['max_cluster_cuts'],
+				min_violation=self.cluster_options['min_cluster_violation'], instrumentation=self.instrumentation
+			)
+			
+			# The sink-finding heuristic precomputes its candidate orders and indexes once per solve
+			self.sink_heuristic_finder = heuristics.sink_heuristic(scores, parents) if sink_heuristic else None
+			
+			# Cuts that stay slack for cut_max_age rounds are deactivated, and reactivated if they
+			# are violated again; at most max_active_cuts cuts are kept active (None = no limit)
+			self.cuts = cut_pool.cut_pool(
+				self.current_problem,
+				max_age=kwargs.get('cut_max_age', cut_pool.DEFAULT_MAX_AGE),
+				max_active=kwargs.get('max_active_cuts', None)
+			)
+			
+			# Seed the model with the cached cuts. They age in the cut pool like any other cut, and
+			# are not counted as separation rounds.
+			if len(self.cached_cuts) > 0:
+				self.current_problem.add_cluster_cuts([list(cluster_key) for cluster_key in self.cached_cuts])
+				self.cuts.register(self.cached_cuts)
+				self.current_problem.add_cluster_cuts_count = 0
+				self.current_problem.add_cluster_total_count = 0
+			
+			# In persistent mode the main problem is loaded into the solver once, and each iteration
+			# only pushes the newly added cut rows and re-optimises from the previous basis
+			self.solver_session = None
+			if kwargs.get('persistent', False) and not self.sparse_backend:
+				if bayene.ilp_solver.supports_persistent(solver):
+					self.solver_session = bayene.ilp_solver.solver_session(self.current_problem.main_model, self.solver_options, solver)
+					self.current_problem.pop_new_constraints()
+				else:
+					self.log('Solver ' + str(solver) + ' has no persistent interface; re-sending the whole model each iteration.')
+		
+		# Best heuristic DAG so far (self.best_incumbent): given to the solver as a MIP start, and its
+		# score as an objective cutoff (natively if the solver has a cutoff option, as a model row otherwise)
+		self.use_cutoff = kwargs.get('cutoff', True)
+		self.native_cutoff = bayene.ilp_solver.supports_native_cutoff(solver)
+		
+		self.previous_gap = None
 	
-	scores_input = scores
-	parents_input = parents
-	solver_input = solver
-	cycle_finding_input = cycle_finding
-	gomory_cut_input = gomory_cut
+	def run(self):
+		while not self.step():
+			pass
+		return self.result()
 	
-	# Generate initial problem
-	current_problem = main_model.model_writer(scores_input, parents_input)
-	# Generate solver options for the solver selected
-	solver_options = generate_solver_options(solver_input, gomory_cut_input)
-
-	# Solution Process Control
-	optimal_solution_found = False
-	solver_results = None
-	best_solution = None
-
-	best_cutoff_value = - sys.maxsize
+	def result(self):
+		return self.best_solution, self.solver_results, self.objective_progress, self.heuristic_progress
 	
-	objective_progress = []
-	heuristic_progress = []
-
-	while not optimal_solution_found:
+	def step(self):
+		# Runs one iteration. Returns True once the session has finished.
+		if self.finished:
+			return True
+		
+		self.instrumentation.iteration = self.iteration
+		
+		if self.components is not None:
+			with self.instrumentation.phase('components'):
+				self._solve_components()
+		elif self.use_branch_and_cut:
+			with self.instrumentation.phase('branch_and_cut'):
+				self._solve_branch_and_cut()
+		else:
+			self.iteration_stats = {}
+			self._cutting_plane_iteration()
+			self.instrumentation.emit('iteration', **self.iteration_stats)
+		
+		if self.finished:
+			self._emit_result()
+		
+		self.iteration += 1
+		return self.finished
+	
+	def _emit_result(self):
+		best_solution = self.best_solution
+		self.instrumentation.iteration = None
+		self.instrumentation.emit(
+			'result',
+			termination_condition=str(self.solver_results.solver.termination_condition) if self.solver_results is not None else None,
+			objective=best_solution.objective_value() if best_solution is not None else None,
+			bound=getattr(best_solution, 'bound', None), gap=getattr(best_solution, 'gap', None),
+			iterations=self.iteration + 1
+		)
+		if self.owns_instrumentation:
+			self.instrumentation.close()
+	
+	def log(self, message=''):
+		self.instrumentation.log(message)
+	
+	def remaining_time(self):
+		# Seconds left of the time limit (None without one)
+		if self.deadline is None:
+			return None
+		return self.deadline - time.time()
+	
+	def gap(self):
+		# Relative gap between the upper bound and the incumbent (None until both are known)
+		if self.upper_bound is None or self.best_incumbent.objective is None:
+			return None
+		return max(0.0, relative_gap(self.upper_bound, self.best_incumbent.objective))
+	
+	def _solve_components(self):
+		self.log('Problem splits into ' + str(len(self.components)) + ' independent components, sizes: '
+			  + str([len(nodes) for nodes in self.components]))
+		
+		# Each component logs to the console as this session does, but emits no events of its own.
+		# The components share this session's deadline instead of each getting the whole time limit.
+		component_options = dict((name, value) for name, value in self.options.items()
+		                         if name not in ('component_jobs', 'instrumentation', 'event_sinks', 'keep_model', 'time_limit'))
+		component_options['verbose'] = self.instrumentation.verbose
+		self.best_solution, self.solver_results, self.objective_progress, self.heuristic_progress = decomposition.solve(
+			self.scores, self.parents, self.components, self.solver, self.sparse_backend,
+			self.cycle_finding, self.gomory_cut, self.sink_heuristic,
+			n_jobs=self.options.get('component_jobs', 1),
+			keep_model=self.keep_model, deadline=self.deadline, **component_options
+		)
+		
+		if self.best_solution is not None:
+			self.log('Final Objective Value: ' + str(self.best_solution.objective_value()))
+			self.log('Number of Total Cluster Cuts: ' + str(self.best_solution.add_cluster_total_count))
+			self.log('Number of Total Cycle Cuts: ' + str(self.best_solution.add_cycle_total_count))
+		
+		self.finished = True
+	
+	def _solve_branch_and_cut(self):
+		self.best_solution, self.solver_results, self.objective_progress, self.heuristic_progress = branch_and_cut.solve(
+			self.scores, self.parents, self.solver, self.sparse_backend,
+			cycle_finding=self.cycle_finding, sink_heuristic=self.sink_heuristic,
+			n_jobs=self.options.get('node_jobs', 1),
+			max_nodes=self.options.get('max_nodes', None),
+			max_cycles=self.max_cycles,
+			cut_rounds=self.options.get('node_cut_rounds', branch_and_cut.DEFAULT_NODE_CUT_ROUNDS),
+			initial_cuts=self.cached_cuts, time_limit=self.remaining_time(), gap_target=self.gap_target,
+			log=self.log, keep_model=self.keep_model,
+			persistent=self.options.get('persistent', False),
+			cutoff=self.options.get('cutoff', True),
+			cut_max_age=self.options.get('cut_max_age', cut_pool.DEFAULT_MAX_AGE),
+			max_active_cuts=self.options.get('max_active_cuts', None),
+			**self.cluster_options
+		)
+		
+		if self.best_solution is not None:
+			self.log('Final Objective Value: ' + str(self.best_solution.objective_value()))
+			self.log('Branch-and-cut tree: ' + str(self.best_solution.branch_and_cut_stats))
+			
+			if self.cut_store is not None:
+				self.log('Cut cache now holds ' + str(self.cut_store.save(self.best_solution.cut_keys)) + ' cuts.')
+		
+		self.finished = True
+	
+	def _cutting_plane_iteration(self):
+		current_problem = self.current_problem
+		cuts = self.cuts
+		best_incumbent = self.best_incumbent
+		
+		remaining_time = self.remaining_time()
+		if remaining_time is not None and remaining_time <= 0:
+			self._stop_early(TerminationCondition.maxTimeLimit, 'Time limit reached')
+			return
+		
 		# Print empty lines between each iteration for better readability
-		print()
-		if sink_heuristic:
-			print('Current cutoff value = ' + str(best_cutoff_value))
+		self.log()
+		if self.sink_heuristic:
+			self.log('Current cutoff value = ' + str(best_incumbent.objective))
+		
+		solver_cutoff = best_incumbent.cutoff() if self.use_cutoff and self.native_cutoff else None
+		
+		# The solve itself may only use what is left of the time limit
+		solver_options = dict(self.solver_options)
+		if remaining_time is not None:
+			solver_options.update(bayene.ilp_solver.time_limit_options(self.solver, remaining_time))
+		
+		# Model size is only measured if someone receives the events
+		if len(self.instrumentation.sinks) > 0:
+			self.iteration_stats.update(current_problem.model_size())
 		
 		# Send the current problem to the solver
-		solver_results = bayene.ilp_solver.call_solver(
-			current_problem.main_model, solver_options, solver=solver, warmstart=True
-		)
+		with self.instrumentation.phase('solve'):
+			if self.sparse_backend:
+				self.solver_results = current_problem.solve(solver_options)
+			elif self.solver_session is not None:
+				self.solver_session.remove_constraints(current_problem.pop_removed_constraints())
+				self.solver_session.add_constraints(current_problem.pop_new_constraints())
+				self.solver_results = self.solver_session.solve(warmstart=True, cutoff=solver_cutoff, options=solver_options)
+			else:
+				self.solver_results = bayene.ilp_solver.call_solver(
+					current_problem.main_model, solver_options, solver=self.solver, warmstart=True, cutoff=solver_cutoff
+				)
+		
+		termination_condition = self.solver_results.solver.termination_condition
+		self.iteration_stats['termination_condition'] = str(termination_condition)
+		
+		# The cutoff stopped the solve: nothing in the relaxation beats the incumbent, and so no DAG does
+		if termination_condition in bayene.ilp_solver.CUTOFF_TERMINATION_CONDITIONS and best_incumbent.objective is not None:
+			self.upper_bound = best_incumbent.objective
+			self._stop_early(TerminationCondition.optimal, 'Cutoff proved the incumbent optimal')
+			return
+		
+		# Every DAG satisfies the current relaxation, so the solver's dual bound on it bounds the
+		# optimal DAG score from above, even if the solve stopped early. The objective of the
+		# solver's incumbent only stands in when no dual bound is reported.
+		current_bound = bayene.ilp_solver.dual_bound(self.solver_results)
+		if termination_condition == TerminationCondition.optimal and current_bound is None:
+			current_bound = current_problem.objective_value()
+		if current_bound is not None and (self.upper_bound is None or current_bound < self.upper_bound):
+			self.upper_bound = current_bound
 		
 		# If the problem is found infeasible, stop the solving process
-		if solver_results.solver.termination_condition == TerminationCondition.infeasible:
-			optimal_solution_found = True
-			continue
+		if termination_condition == TerminationCondition.infeasible:
+			self.log('Current problem is infeasible.')
+			self.finished = True
+			return
+		elif termination_condition != TerminationCondition.optimal:
+			# The solve was cut short (e.g. by the time limit), so its solution bounds nothing
+			self._stop_early(TerminationCondition.maxTimeLimit if termination_condition == TerminationCondition.maxTimeLimit
+							 else termination_condition, 'Solver stopped: ' + str(termination_condition))
+			return
 		else:
-			print(
+			self.log(
 				'Current problem solved successfully, Objective Value = '
-				+ str(current_problem.main_model.objective())
+				+ str(current_problem.objective_value())
 			)
+		
+		self.iteration_stats['objective'] = current_problem.objective_value()
+		self.iteration_stats['bound'] = self.upper_bound
 				
 		# Get all the non-zero variables in the main model		
-		current_non_zero_solution = {}
+		current_solution = current_problem.solution_values()
+		current_non_zero_solution = dict((key, value) for key, value in six.iteritems(current_solution) if value > 0.0)
 		
-		# We need float() and .value because non_zero_value here
-		# is a Pyomo object (Don't make a fuss with Pyomo functions)
-		for non_zero_key, non_zero_value in six.iteritems(current_problem.main_model.chosen_parent_variable):
-			if float(non_zero_value.value) > 0.0:
-				current_non_zero_solution[(non_zero_key[0], non_zero_key[1])] = float(non_zero_value.value)
+		# Age the cuts against this solution, and bring back deactivated ones it violates
+		with self.instrumentation.phase('cut_pool'):
+			reactivated_count = cuts.update(current_solution)
+		if reactivated_count > 0:
+			self.log('Reactivated ' + str(reactivated_count) + ' violated cuts from the cut pool.')
 						
 		########################
 		#### Cutting Planes ####
@@ -94,182 +401,223 @@ def solve_model(scores, parents, solver, cycle_finding, gomory_cut, sink_heurist
 		
 		# Cluster (Sub-IP)
 		# Generate IP Cluster Cut Finding Model
-		print('Searching for CLUSTER CUTS..')
+		self.log('Searching for CLUSTER CUTS..')
 		cluster_cut_applied = False
 
-		# Generate cluster cut sub-ip problem
-		cluster_cuts_sub_ip_problem = cluster_cut_model.model_writer(current_non_zero_solution, len(scores_input), parents_input)
-		cluster_cuts_sub_ip_solver_options = {}
-		cluster_cuts_sub_ip_solver_options["LogFile"] = ''
-		
-		# Send the cluster cut IP problem to the solver
-		cluster_cuts_sub_ip_solver_results = bayene.ilp_solver.call_solver(cluster_cuts_sub_ip_problem.main_model,
-																		   cluster_cuts_sub_ip_solver_options, solver=solver)
-		
-		# If the problem was properly solved (objective should be strictly larger than -1)
-		if cluster_cuts_sub_ip_solver_results.solver.termination_condition == TerminationCondition.optimal \
-		and cluster_cuts_sub_ip_problem.main_model.objective() > -1:
-		
-			# Check if found cluster size > 0
-			cluster_members = [node_key for node_key in range(len(scores_input))
-							   if float(cluster_cuts_sub_ip_problem.main_model.cluster_member_variable[node_key].value) > 0]
-			
-			if len(cluster_members) > 0:
-				print('Adding CLUSTER cuts to new problem.')
-				current_problem.add_cluster_cuts(cluster_members)
+		with self.instrumentation.phase('cluster_separation'):
+			clusters_found, cluster_layers = self.cluster_cut_separator.separate(current_non_zero_solution,
+			                                                                    time_limit=self.remaining_time())
+		
+		new_clusters = []
+		new_cycles = []
+		
+		if clusters_found is None:
+			self.log('NO CLUSTER cuts applicable. Cluster Cut Sub-IP could not be solved.')
+		elif len(clusters_found) > 0:
+			new_clusters, pool_reactivated_count = cuts.filter_new(clusters_found)
+			reactivated_count += pool_reactivated_count
+			if len(new_clusters) > 0:
+				self.log('Adding ' + str(len(new_clusters)) + ' CLUSTER cuts to new problem (found by '
+					  + ', '.join(sorted(set(cluster_layers))) + ').')
+				current_problem.add_cluster_cuts(new_clusters)
+				cuts.register(new_clusters)
 				cluster_cut_applied = True
-			else:
-				print('NO CLUSTER cuts applicable.')
-		else:				
-			print('NO CLUSTER cuts applicable. Cluster Cut Sub-IP could not be solved.')
+		else:
+			self.log('NO CLUSTER cuts applicable.')
 		
 		# Cycle cuts
 		cycle_cut_applied = False
-		if cycle_finding_input:
-			print('Searching for CYCLE cuts..')
-			cycles_found = find_cycles(current_problem.main_model)
-			if len(cycles_found) > 0:
-				print('Adding CYCLE cuts to new problem.')
-				current_problem.add_cycle_cuts(cycles_found)
+		if self.cycle_finding:
+			self.log('Searching for CYCLE cuts..')
+			with self.instrumentation.phase('cycle_separation'):
+				cycles_found = self.find_cycles(current_solution)
+			new_cycles, pool_reactivated_count = cuts.filter_new(cycles_found)
+			reactivated_count += pool_reactivated_count
+			if len(new_cycles) > 0:
+				self.log('Adding CYCLE cuts to new problem.')
+				current_problem.add_cycle_cuts(new_cycles)
+				cuts.register(new_cycles)
 				cycle_cut_applied = True
 			else:
-				print('NO CYCLE cuts applicable.')
+				self.log('NO CYCLE cuts applicable.')
 		
 		####################
 		#### Heuristics ####
 		####################
 		# Sink-Finding Heuristic
-		if sink_heuristic:
-			print('Performing Sink-finding algorithm..')
-			heuristic_total_score, heuristic_solutions, sink_heuristic_found = find_sink_heuristic(current_problem)
+		if self.sink_heuristic:
+			self.log('Performing Sink-finding algorithm..')
+			with self.instrumentation.phase('heuristic'):
+				heuristic_total_score, heuristic_solutions, sink_heuristic_found = self.find_sink_heuristic(current_solution)
+		
+		self.iteration_stats.update({
+			'cluster_cuts_added': len(new_clusters), 'cluster_layers': sorted(set(cluster_layers)) if clusters_found else [],
+			'cycle_cuts_added': len(new_cycles), 'cuts_reactivated': reactivated_count,
+			'active_cuts': len(cuts.active)
+		})
 		
 		#####################################
 		#### Moving on to Next Iteration ####
 		#####################################
-		# If either cluster or cycle cut got applied, we should solve the problem again
-		if cluster_cut_applied or cycle_cut_applied:
+		# If either cluster or cycle cut got applied (or reactivated), we should solve the problem again
+		if cluster_cut_applied or cycle_cut_applied or reactivated_count > 0:
 		
-			objective_progress.append(current_problem.main_model.objective())
+			self.objective_progress.append(current_problem.objective_value())
 
 			# If we have a heuristic solution, substitute current_problem with new_problem (which contains a heuristic solution)
 			# to allow the solver to make use of the solution.
-			if sink_heuristic and sink_heuristic_found:
-				print('Sink heuristic solution score = ' + str(heuristic_total_score))
+			if self.sink_heuristic and sink_heuristic_found:
+				self.log('Sink heuristic solution score = ' + str(heuristic_total_score))
 				
 				# Use the total score obtained to be used as cutoff value
-				if heuristic_total_score > best_cutoff_value:
-					best_cutoff_value = heuristic_total_score
-
-				# solver_options["Cutoff"] = best_cutoff_value
-				heuristic_progress.append(best_cutoff_value)
+				if best_incumbent.update(heuristic_total_score, heuristic_solutions) and self.use_cutoff and not self.native_cutoff:
+					current_problem.set_objective_cutoff(best_incumbent.cutoff())
+				
+				self.heuristic_progress.append(best_incumbent.objective)
+				self.iteration_stats['incumbent'] = best_incumbent.objective
+				self.iteration_stats['gap'] = self.gap()
+				
+				# Report how far the solver's bound still is from the incumbent
+				current_gap = relative_gap(current_bound, best_incumbent.objective)
+				if self.previous_gap is None:
+					self.log('Gap between bound and incumbent = ' + format_gap(current_gap))
+				else:
+					self.log('Gap between bound and incumbent = ' + format_gap(current_gap)
+						  + ' (was ' + format_gap(self.previous_gap) + ')')
+				self.previous_gap = current_gap
 				
-				# Clear all the current variable values
-				current_problem.main_model.chosen_parent_variable.reset()
+				# Insert the best solution found so far for warmstart
+				current_problem.set_solution(best_incumbent.solution)
 				
-				# Insert the solutions found from sink-finding for warmstart
-				for heuristic_key, heuristic_value in six.iteritems(heuristic_solutions):
-					current_problem.main_model.chosen_parent_variable[(heuristic_key[0], heuristic_key[1])].set_value(heuristic_value)
+				if self.gap_target is not None and self.gap() <= self.gap_target:
+					self._stop_early(TerminationCondition.feasible, 'Gap target reached')
 					
-			# Go to the next iteration of this loop
-			continue
+			# Go to the next iteration
+			return
 
+		# Without the cluster cut sub-IP, finding no violated cut does not prove the solution acyclic
+		if clusters_found is None and not nx.is_directed_acyclic_graph(solution_to_graph(current_solution, self.parents)):
+			remaining_time = self.remaining_time()
+			self._stop_early(TerminationCondition.maxTimeLimit if remaining_time is not None and remaining_time <= 0
+							 else TerminationCondition.error, 'Cluster cut sub-IP could not be solved')
+			return
+		
 		# If we don't we need to solve the problem again, the optimal solution is found.
-		print('INTEGER solution found!')
-		best_solution = copy.deepcopy(current_problem)
-		optimal_solution_found = True
-			
-	print('Final Objective Value: ' + str(best_solution.main_model.objective()))
-	print('Number of Cluster Cut Iteration: ' + str(best_solution.add_cluster_cuts_count))
-	print('Number of Cycle Cut Iteration: ' + str(best_solution.add_cycle_cuts_count))
-	print('Number of Total Cycle Cuts: ' + str(best_solution.add_cycle_total_count))
+		self.log('INTEGER solution found!')
+		self.best_solution = structure_solution.from_model(current_problem, keep_model=self.keep_model)
+		self.finished = True
+		
+		# The solver's MIP gap tolerance may leave the dual bound slightly above the DAG found
+		self.best_solution.bound = max(self.best_solution.objective_value(), self.upper_bound)
+		self.best_solution.gap = relative_gap(self.best_solution.bound, self.best_solution.objective_value())
+		
+		self._report()
 	
-	return best_solution, solver_results, objective_progress, heuristic_progress
-
-# Make use of not yet optimal solution generated by the solver to find a feasible solution.
-def find_sink_heuristic(current_problem):
+	def _stop_early(self, termination_condition, message):
+		# Anytime stop: return the incumbent with the bound and gap proved so far
+		self.log(message + '. Best bound = ' + str(self.upper_bound) + ', incumbent = ' + str(self.best_incumbent.objective))
+		
+		self.finished = True
+		self.solver_results = branch_and_cut.tree_results(termination_condition, message, self.best_incumbent.objective,
+		                                                  self.upper_bound)
+		
+		if self.best_incumbent.solution is None:
+			self.best_solution = None
+			return
+		
+		self.current_problem.set_solution(self.best_incumbent.solution)
+		self.best_solution = structure_solution.from_model(self.current_problem, keep_model=self.keep_model,
+		                                                   bound=self.upper_bound, gap=self.gap())
+		
+		self.log('Returning the best DAG found, gap = ' + (format_gap(self.best_solution.gap) if self.best_solution.gap is not None else 'unknown'))
+		
+		self._report()
+	
+	def _report(self):
+		best_solution = self.best_solution
+		
+		self.log('Final Objective Value: ' + str(best_solution.objective_value()))
+		self.log('Number of Cluster Cut Iteration: ' + str(best_solution.add_cluster_cuts_count))
+		self.log('Number of Total Cluster Cuts: ' + str(best_solution.add_cluster_total_count))
+		self.log('Number of Cycle Cut Iteration: ' + str(best_solution.add_cycle_cuts_count))
+		self.log('Number of Total Cycle Cuts: ' + str(best_solution.add_cycle_total_count))
+		self.log('Cluster cuts found by each separation layer: ' + str(self.cluster_cut_separator.stats))
+		self.log('Cut pool: ' + str(self.cuts.report()))
+		
+		best_solution.cluster_separation_stats = dict(self.cluster_cut_separator.stats)
+		best_solution.cut_pool_stats = self.cuts.report()
+		
+		# With cut_cache_drop_slack, the cache keeps only the cuts still active at the end, i.e.
+		# drops the ones the cut pool deactivated for staying slack; otherwise every cut is merged in
+		if self.cut_store is not None:
+			if self.options.get('cut_cache_drop_slack', False):
+				cached_count = self.cut_store.save(sorted(self.cuts.active), merge=False)
+			else:
+				cached_count = self.cut_store.save(sorted(self.cuts.active | self.cuts.inactive))
+			self.log('Cut cache now holds ' + str(cached_count) + ' cuts.')
+	
+	# Make use of not yet optimal solution generated by the solver to find a feasible solution.
+	def find_sink_heuristic(self, current_solution):
+		return self.sink_heuristic_finder.find(current_solution)
 	
-	heuristic_total_score = float(0)
-	heuristic_solutions = {}
-	variables_to_decide = range(len(scores_input))
+	# Find the most violated short cycles of the current (possibly fractional) solution
+	def find_cycles(self, current_solution):
+		return cycle_separator.find_violated_cycles(
+			current_solution, self.parents, max_cycles=self.max_cycles, time_limit=self.cycle_time_limit
+		)
+	
+	def convert_to_graph(self, instance=None):
+		# The DAG of the given model (by default the best solution of this session)
+		return convert_to_graph(instance if instance is not None else self.best_solution, self.parents)
 
-	# For each nodes, check the current answers and pick the variable(s) with the answer closest to 1,
-	# and choose the one with the highest coefficient (local scores). If that one is ruled out
-	# by earlier iteration, choose the next highest scoring one.
-	# Just in case all the variables for the node are ruled out before completion,
-	# we are unable to a heuristic solution and declare sink_heuristic_applied = False.
-	sink_heuristic_found = False
-			
-	while not sink_heuristic_found:
-				
-		best_scores_each_node_index = {}
-				
-		for search_node in variables_to_decide:
-			this_node_scores = sorted(scores_input[search_node].items(), key=operator.itemgetter(1), reverse = True)
-					
-			best_parent_for_this_node = -1
-			best_parent_for_this_node_score = float(-1)
-			for search_node_parent, search_node_parent_score in this_node_scores:
-				if not heuristic_solutions.has_key((search_node, search_node_parent)):
-					best_parent_for_this_node = search_node_parent
-					best_parent_for_this_node_score = search_node_parent_score
-					break
-		
-			best_scores_each_node_index[search_node] = best_parent_for_this_node
-					
-		# Among the best parents available selected for nodes, choose the one that has the closest value to 1
-		# in current solution.
-		node_closest = -1
-		node_closest_parent = -1
-		current_best_distance = sys.maxint
-			
-		for best_scores_node, best_scores_parent in six.iteritems(best_scores_each_node_index):
-			distance_to_one = 1.0 - float(current_problem.main_model.chosen_parent_variable[(best_scores_node, best_scores_parent)].value)
-			if distance_to_one < current_best_distance:
-				node_closest = best_scores_node
-				node_closest_parent = best_scores_parent
-				current_best_distance = distance_to_one
+def relative_gap(bound, incumbent_objective):
+	return (bound - incumbent_objective) / max(1e-10, abs(incumbent_objective))
 
-		# We choose the highest scoring parent candidate (unless already ruled out) as this node will be the sink
-		heuristic_solutions[node_closest, node_closest_parent] = 1
-				
-		# Rule out all the parent candidates that has this node as member
-		for other_node in range(len(scores_input)):
-			for other_node_parent in scores_input[other_node].keys():
-				if node_closest in parents_input[other_node_parent]:
-					heuristic_solutions[(other_node, other_node_parent)] = 0
-				
-		# Rule out other candidates for this node
-		for this_node_other_parent in scores_input[node_closest].keys():
-			if this_node_other_parent != node_closest_parent:
-				heuristic_solutions[node_closest, this_node_other_parent] = 0
-				
-		variables_to_decide.remove(node_closest)
-				
-		heuristic_total_score += scores_input[node_closest][node_closest_parent]
-				
-		if len(variables_to_decide) == 0:
-			sink_heuristic_found = True
-				
-	return heuristic_total_score, heuristic_solutions, sink_heuristic_found
+def format_gap(gap):
+	return '{:.4%}'.format(gap)
 
-# Use NetworkX Cycle Finding method to find elementary cycles
-def find_cycles(instance):
-		
-	bn_graph = convert_to_graph(instance)
+# Make use of not yet optimal solution generated by the solver to find a feasible solution.
+def find_sink_heuristic(current_solution, scores, parents):
 	
-	cycles_found = list(nx.simple_cycles(bn_graph))
+	return heuristics.sink_heuristic(scores, parents).find(current_solution)
 
+# Find the most violated short cycles of the current (possibly fractional) solution
+def find_cycles(current_solution, parents, max_cycles=DEFAULT_MAX_CYCLES, time_limit=None):
+	
+	cycles_found = cycle_separator.find_violated_cycles(
+		current_solution, parents, max_cycles=max_cycles, time_limit=time_limit
+	)
+	
 	return cycles_found
 
-# Convert the solutions returned by solver into NetworkX DiGraph format
-def convert_to_graph(instance):
-		
+# Convert the solutions returned by solver into NetworkX DiGraph format.
+# instance is a structure_solution, a Pyomo main model or a model writer from main_model or
+# sparse_model. All of them carry their candidate parent sets, so parents only needs to be
+# given for other models.
+def convert_to_graph(instance, parents=None):
+	
+	if isinstance(instance, structure_solution):
+		return instance.to_networkx()
+	
+	if parents is None:
+		parents = instance.parents if hasattr(instance, 'parents') else instance.candidate_parents
+	
+	if hasattr(instance, 'chosen_parent_variable'):
+		solution = dict(((var_key[0], var_key[1]), float(var_value.value) if var_value.value is not None else 0.0)
+						for var_key, var_value in six.iteritems(instance.chosen_parent_variable))
+	else:
+		solution = instance.solution_values()
+	
+	return solution_to_graph(solution, parents)
+
+def solution_to_graph(solution, parents):
+	
 	bn_graph = nx.DiGraph()
-		
-	for var_key, var_value in six.iteritems(instance.chosen_parent_variable):
-		if float(var_value.value) > 0.99:
+	
+	for var_key, var_value in six.iteritems(solution):
+		if var_value > 0.99:
 			# Check which nodes are in this parent set candidate
-			for parent in parents_input[var_key[1]]:
+			for parent in parents[var_key[1]]:
 				bn_graph.add_edge(parent, var_key[0])
-								
-	return bn_graph
\ No newline at end of file
+	
+	return bn_graph
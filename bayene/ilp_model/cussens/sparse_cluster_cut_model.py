@@ -0,0 +1,111 @@
+"""
+sparse_cluster_cut_model.py: The cluster cut finding sub-IP of cluster_cut_model, built as
+sparse arrays for the in-process HiGHS backend. Like cluster_cut_model, it is kept alive
+between iterations: update() appends the rows of new parent set keys and replaces the
+objective coefficients. The rows of the keys are kept as one assembled CSR matrix that only
+grows, so a solve only builds the few rows that change between solves (the cluster size row
+and the no-goods).
+"""
+import numpy as np
+import scipy.sparse as sp
+
+import bayene.ilp_solver
+
+class model_writer():
+    def __init__(self, current_non_zero_solution, n_variables, parents):
+
+        self.n_variables = n_variables
+        self.parents = parents
+        self.keys = []
+        self.key_index = {}
+
+        # Column layout: cluster_member_variable K(v) for each node first, then one
+        # parent_set_variable J(W->v) per key, in the order the keys were first seen.
+        # Each key contributes two rows:
+        #   J(W->v) - K(v) <= 0                   (cluster_child_always_selected)
+        #   J(W->v) - sum[K(w) for w in W] <= 0   (cluster_parent_at_least_one)
+        self.key_matrix = sp.csr_matrix((0, n_variables))
+
+        # Clusters already found in this round, excluded so that the next solve finds another
+        self.no_goods = []
+
+        self.objective = None
+        self.cluster_member_values = np.zeros(n_variables)
+
+        self.update(current_non_zero_solution)
+
+    def update(self, current_non_zero_solution):
+        self.no_goods = []
+
+        # Rows of the keys not seen before, as a block appended to the assembled matrix
+        rows = []
+        columns = []
+        data = []
+        n_new_rows = 0
+        for key in current_non_zero_solution.keys():
+            if key in self.key_index:
+                continue
+
+            column = self.n_variables + len(self.keys)
+            self.key_index[key] = len(self.keys)
+            self.keys.append(key)
+
+            for row_columns, row_data in [([column, key[0]], [1.0, -1.0]),
+                                          ([column] + list(self.parents[key[1]]), [1.0] + [-1.0] * len(self.parents[key[1]]))]:
+                rows.extend([n_new_rows] * len(row_columns))
+                columns.extend(row_columns)
+                data.extend(row_data)
+                n_new_rows += 1
+
+        if n_new_rows > 0:
+            n_columns = self.n_variables + len(self.keys)
+            # New columns are appended on the right, so the existing rows keep their entries
+            key_matrix = sp.csr_matrix((self.key_matrix.data, self.key_matrix.indices, self.key_matrix.indptr),
+                                       shape=(self.key_matrix.shape[0], n_columns))
+            self.key_matrix = sp.vstack([key_matrix, sp.csr_matrix((data, (rows, columns)), shape=(n_new_rows, n_columns))],
+                                        format='csr')
+
+        # sum[x(W->v) * J(W->v)] - |C|
+        self.objective_coefficients = np.concatenate([-np.ones(self.n_variables), np.zeros(len(self.keys))])
+        for key, value in current_non_zero_solution.items():
+            self.objective_coefficients[self.n_variables + self.key_index[key]] = value
+
+    def solve(self, options):
+        n_columns = self.n_variables + len(self.keys)
+
+        # cluster_size_at_least_two, then one no-good row per excluded cluster:
+        # sum[K(v) for v not in C] - sum[K(v) for v in C] >= 1 - |C|
+        extra_rows = [np.ones(self.n_variables)]
+        extra_lower = [2.0]
+        for cluster_members in self.no_goods:
+            row = np.ones(self.n_variables)
+            row[list(cluster_members)] = -1.0
+            extra_rows.append(row)
+            extra_lower.append(1.0 - len(cluster_members))
+
+        n_key_rows = self.key_matrix.shape[0]
+        extra_block = sp.csr_matrix(np.vstack(extra_rows))
+        extra_block = sp.csr_matrix((extra_block.data, extra_block.indices, extra_block.indptr),
+                                    shape=(len(extra_rows), n_columns))
+        constraint_matrix = sp.vstack([self.key_matrix, extra_block], format='csr')
+        row_lower = np.concatenate([np.full(n_key_rows, -np.inf), extra_lower])
+        row_upper = np.concatenate([np.zeros(n_key_rows), np.full(len(extra_rows), np.inf)])
+
+        results = bayene.ilp_solver.call_highs(
+            self.objective_coefficients, constraint_matrix, row_lower, row_upper,
+            np.zeros(n_columns), np.ones(n_columns), np.ones(n_columns), options
+        )
+
+        if results.x is not None:
+            self.objective = results.objective
+            self.cluster_member_values = results.x[:self.n_variables]
+        else:
+            self.objective = None
+
+        return results
+
+    def add_no_good(self, cluster_members):
+        self.no_goods.append(list(cluster_members))
+
+    def cluster_members(self):
+        return [node for node in range(self.n_variables) if self.cluster_member_values[node] > 0.5]
@@ -0,0 +1,225 @@
+"""
+sparse_model.py: An alternative to main_model.model_writer that keeps the ILP as NumPy/SciPy
+arrays instead of Pyomo expression trees: a score vector, one "only one parent set" row per
+node and blocks of cut rows over the candidate columns. It is solved in-process with HiGHS
+through bayene.ilp_solver.call_highs.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+import bayene.ilp_solver
+
+from .main_model import as_cluster_list, node_set_mask
+
+class model_writer():
+
+    def __init__(self, scores, parents):
+        self.scores = scores
+        self.parents = parents
+
+        self.add_cluster_cuts_count = 0
+        self.add_cluster_total_count = 0
+        self.add_cycle_cuts_count = 0
+        self.add_cycle_total_count = 0
+        self.add_branching_count = 0
+
+        self.new_constraints = []
+
+        # Columns are the (node, candidate) pairs, grouped by node
+        self.node_candidates = [list(node_scores.keys()) for node_scores in scores]
+        self.parent_masks = [node_set_mask(parent_set) for parent_set in parents]
+
+        self.keys = [(node, candidate) for node in range(len(scores)) for candidate in self.node_candidates[node]]
+        self.column_index = dict((key, column) for column, key in enumerate(self.keys))
+
+        self.node_offsets = np.zeros(len(scores) + 1, dtype=np.int64)
+        self.node_offsets[1:] = np.cumsum([len(candidates) for candidates in self.node_candidates])
+
+        self.objective_coefficients = np.array([scores[node][candidate] for (node, candidate) in self.keys], dtype=float)
+
+        n_columns = len(self.keys)
+        self.lower_bounds = np.zeros(n_columns)
+        self.upper_bounds = np.ones(n_columns)
+        self.integrality = np.ones(n_columns)
+
+        # A node with a single candidate (e.g. after preprocessing.prune_dominated) must take it
+        single_candidate_nodes = np.flatnonzero(np.diff(self.node_offsets) == 1)
+        self.lower_bounds[self.node_offsets[single_candidate_nodes]] = 1
+
+        # Only one parent set should be selected for each nodes
+        row_of_column = np.repeat(np.arange(len(scores)), np.diff(self.node_offsets))
+        self.row_blocks = [sp.csr_matrix((np.ones(n_columns), (row_of_column, np.arange(n_columns))),
+                                         shape=(len(scores), n_columns))]
+        self.row_lower = [np.ones(len(scores))]
+        self.row_upper = [np.ones(len(scores))]
+
+        # Rows left out of the solved problem (cuts deactivated by a cut pool), and the
+        # row of every cut keyed by its cluster as a sorted tuple of nodes
+        self.n_rows = len(scores)
+        self.inactive_rows = set()
+        self.cut_rows = {}
+
+        # Objective cutoff and MIP start of the next solve (see set_objective_cutoff and
+        # set_solution), both given to HiGHS as options
+        self.cutoff = None
+        self.start = None
+
+        self.values = np.zeros(n_columns)
+        self.objective = None
+
+        # (column, lower bound, upper bound) before apply_branchings(), until clear_branchings()
+        self.branched_columns = []
+
+    def cluster_columns(self, cluster_members):
+        # Columns of the cluster's nodes whose parent set intersects the cluster
+        cluster_mask = node_set_mask(cluster_members)
+        return [self.column_index[(node, candidate)]
+                for node in cluster_members
+                for candidate in self.node_candidates[node] if self.parent_masks[candidate] & cluster_mask]
+
+    def cluster_candidates(self, cluster_members):
+        return [self.keys[column] for column in self.cluster_columns(cluster_members)]
+
+    def add_cluster_cuts(self, clusters):
+        clusters = as_cluster_list(clusters)
+
+        self.add_cluster_cuts_count += 1
+        self.add_cluster_total_count += len(clusters)
+
+        self._add_cut_rows(clusters)
+
+    def add_cycle_cuts(self, cycles):
+        self.add_cycle_cuts_count += 1
+        self.cycles = cycles
+
+        self.add_cycle_total_count += len(self.cycles)
+
+        self._add_cut_rows(self.cycles)
+
+    def add_branching(self, variable_to_branch_key, direction):
+        self.add_branching_count += 1
+
+        column = self.column_index[(variable_to_branch_key[0], variable_to_branch_key[1])]
+
+        if direction == 'leq':
+            self.upper_bounds[column] = 0
+        elif direction == 'geq':
+            self.lower_bounds[column] = 1
+
+    def apply_branchings(self, branchings):
+        # Applies branching decisions as column bounds, undone by clear_branchings(). Returns
+        # the changed variables a persistent solver would need, of which this model has none.
+        for variable_to_branch_key, direction in branchings:
+            column = self.column_index[(variable_to_branch_key[0], variable_to_branch_key[1])]
+            self.branched_columns.append((column, self.lower_bounds[column], self.upper_bounds[column]))
+
+            if direction == 'leq':
+                self.upper_bounds[column] = 0
+            elif direction == 'geq':
+                self.lower_bounds[column] = 1
+
+        return []
+
+    def clear_branchings(self):
+        for column, lower_bound, upper_bound in reversed(self.branched_columns):
+            self.lower_bounds[column] = lower_bound
+            self.upper_bounds[column] = upper_bound
+
+        self.branched_columns = []
+        return []
+
+    def relax(self):
+        # LP relaxation of the model: the columns become continuous in [0, 1]
+        self.integrality = np.zeros(len(self.keys))
+
+    def constraint_matrix(self):
+        return sp.vstack(self.row_blocks, format='csr')
+
+    def solve(self, options):
+        constraint_matrix = self.constraint_matrix()
+        row_lower = np.concatenate(self.row_lower)
+        row_upper = np.concatenate(self.row_upper)
+
+        if len(self.inactive_rows) > 0:
+            active_rows = np.ones(self.n_rows, dtype=bool)
+            active_rows[list(self.inactive_rows)] = False
+            constraint_matrix = constraint_matrix[active_rows]
+            row_lower = row_lower[active_rows]
+            row_upper = row_upper[active_rows]
+
+        results = bayene.ilp_solver.call_highs(
+            self.objective_coefficients, constraint_matrix, row_lower, row_upper,
+            self.lower_bounds, self.upper_bounds, self.integrality, options,
+            cutoff=self.cutoff, start=self.start
+        )
+        self.start = None
+
+        if results.x is not None:
+            self.values = results.x
+            self.objective = results.objective
+
+        return results
+
+    def solution_values(self):
+        return dict(zip(self.keys, self.values.tolist()))
+
+    def set_solution(self, solution):
+        # Replaces the stored solution, e.g. with a heuristic one, which the next solve
+        # takes as its MIP start (only with highspy, see bayene.ilp_solver.call_highs)
+        self.values = np.zeros(len(self.keys))
+        for key, value in solution.items():
+            self.values[self.column_index[(key[0], key[1])]] = value
+        self.objective = float(np.dot(self.objective_coefficients, self.values))
+        self.start = self.values.copy()
+
+    def objective_value(self):
+        return self.objective
+
+    def model_size(self):
+        # Active rows, columns and non-zero coefficients of the model as solve() sends it
+        row_nonzeros = np.diff(self.constraint_matrix().indptr)
+        if len(self.inactive_rows) > 0:
+            row_nonzeros[list(self.inactive_rows)] = 0
+
+        return {'rows': self.n_rows - len(self.inactive_rows), 'columns': len(self.keys),
+                'nonzeros': int(row_nonzeros.sum())}
+
+    def set_objective_cutoff(self, cutoff):
+        # Given to HiGHS as its objective_bound option, so no row is added (except through
+        # SciPy without highspy, see bayene.ilp_solver.call_highs)
+        self.cutoff = cutoff
+
+    def deactivate_cuts(self, cut_keys):
+        self.inactive_rows.update(self.cut_rows[cut_key] for cut_key in cut_keys)
+
+    def activate_cuts(self, cut_keys):
+        self.inactive_rows.difference_update(self.cut_rows[cut_key] for cut_key in cut_keys)
+
+    def pop_removed_constraints(self):
+        return []
+
+    def pop_new_constraints(self):
+        new_constraints = self.new_constraints
+        self.new_constraints = []
+        return new_constraints
+
+    def _add_cut_rows(self, clusters):
+        # One row per cluster: sum of the cluster's intersecting candidates <= |cluster| - 1
+        row_indexes = []
+        column_indexes = []
+        for row, cluster_members in enumerate(clusters):
+            columns = self.cluster_columns(cluster_members)
+            row_indexes.extend([row] * len(columns))
+            column_indexes.extend(columns)
+
+        block = sp.csr_matrix((np.ones(len(column_indexes)), (row_indexes, column_indexes)),
+                              shape=(len(clusters), len(self.keys)))
+
+        for row, cluster_members in enumerate(clusters):
+            self.cut_rows[tuple(sorted(cluster_members))] = self.n_rows + row
+        self.n_rows += len(clusters)
+
+        self.row_blocks.append(block)
+        self.row_lower.append(np.full(len(clusters), -np.inf))
+        self.row_upper.append(np.array([len(cluster_members) - 1 for cluster_members in clusters], dtype=float))
+        self.new_constraints.append(block)
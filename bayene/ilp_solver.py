@@ -4,7 +4,12 @@ Pyomo's solver interfaces. Every code pieces within Bayene that sends
 ILP problems to the solver must use this.
 """
 
+import math
+
+import numpy as np
+import scipy.sparse
 from pyomo.environ import *
+from pyomo.opt import TerminationCondition
 
 class InvalidSolverError(Exception):
     def __init__(self, value):
@@ -12,6 +17,91 @@ class InvalidSolverError(Exception):
     def __str__(self):
         return repr(self.value)
 
+# Options through which solvers take an objective cutoff natively. Bayene's models maximise,
+# so these prune every node whose bound is below the cutoff. Other solvers get the cutoff
+# as an explicit objective row instead (see the model writers' set_objective_cutoff()).
+NATIVE_CUTOFF_OPTIONS = {
+    'gurobi': 'Cutoff',
+    'cplex': 'mip_tolerances_lowercutoff',
+    'xpress': 'MIPABSCUTOFF',
+    'appsi_highs': 'objective_bound'
+}
+
+# Solvers whose cutoff option bounds the objective as minimised internally, i.e. the
+# negated score
+NEGATED_CUTOFF_SOLVERS = ['appsi_highs']
+
+# Relative slack below the incumbent objective, so that solutions scoring exactly as much
+# as the incumbent (which may be optimal) are not cut off
+CUTOFF_TOLERANCE = 1e-9
+
+def supports_native_cutoff(solver):
+    return solver in NATIVE_CUTOFF_OPTIONS
+
+def native_cutoff_options(solver, cutoff):
+    # Solver options pruning every solution whose objective is no better than cutoff
+    if solver in NEGATED_CUTOFF_SOLVERS:
+        cutoff = -cutoff
+    return {NATIVE_CUTOFF_OPTIONS[solver]: cutoff}
+
+# Termination conditions Pyomo reports when a solve proved that no solution beats the cutoff
+CUTOFF_TERMINATION_CONDITIONS = (TerminationCondition.minFunctionValue,)
+
+# Options through which solvers take a wall-clock limit in seconds
+TIME_LIMIT_OPTIONS = {
+    'gurobi': 'TimeLimit',
+    'appsi_gurobi': 'TimeLimit',
+    'cplex': 'timelimit',
+    'cbc': 'sec',
+    'glpk': 'tmlim',
+    'appsi_highs': 'time_limit',
+    'highs': 'time_limit'
+}
+
+def time_limit_options(solver, seconds):
+    # Solver options limiting a solve to the given number of seconds (empty if the solver
+    # has no known time limit option)
+    if solver not in TIME_LIMIT_OPTIONS:
+        return {}
+    if solver == 'glpk':
+        seconds = int(math.ceil(seconds))
+    return {TIME_LIMIT_OPTIONS[solver]: max(seconds, 0)}
+
+def dual_bound(results):
+    # Bound the solver proved on the (maximised) objective, or None if it reported none:
+    # results.bound for the in-process HiGHS and branch-and-cut results, and the upper bound
+    # of Pyomo's results otherwise
+    if hasattr(results, 'bound'):
+        return results.bound
+    try:
+        bound = results.problem.upper_bound
+    except (AttributeError, IndexError):
+        return None
+    if bound is None or not math.isfinite(float(bound)):
+        return None
+    return float(bound)
+
+class incumbent():
+    # Best feasible solution found so far, kept in a solver-neutral form: its variable values
+    # are given to the solver as a MIP start and its objective as a cutoff.
+
+    def __init__(self):
+        self.objective = None
+        self.solution = None
+
+    def update(self, objective, solution):
+        # Returns True if the given solution replaced the incumbent
+        if self.objective is None or objective > self.objective:
+            self.objective = objective
+            self.solution = solution
+            return True
+        return False
+
+    def cutoff(self):
+        if self.objective is None:
+            return None
+        return self.objective - CUTOFF_TOLERANCE * max(1.0, abs(self.objective))
+
 def call_solver(model, options, **kwargs):    
     # For ConcreteModel, no need to create a separate instance
     if 'solver' in kwargs:
@@ -24,9 +114,277 @@ def call_solver(model, options, **kwargs):
         # Copy from custom solver options dictionary
         opt.options.update(options)
 
-        # Start the solver
-        results = opt.solve(model)
+        if kwargs.get('cutoff') is not None and supports_native_cutoff(kwargs['solver']):
+            opt.options.update(native_cutoff_options(kwargs['solver'], kwargs['cutoff']))
+
+        # Use the current variable values as a MIP start if the solver can
+        solve_options = {}
+        if kwargs.get('warmstart', False) and opt.warm_start_capable():
+            solve_options['warmstart'] = True
+
+        # Start the solver. Solutions are loaded explicitly so that infeasible problems
+        # return their termination condition instead of raising (as APPSI solvers do).
+        results = opt.solve(model, load_solutions=False, **solve_options)
+        
+        if len(results.solution) > 0:
+            model.solutions.load_from(results)
         
         return results
     else:
-        raise InvalidSolverError('Given solver choice is not supported or invalid.')
\ No newline at end of file
+        raise InvalidSolverError('Given solver choice is not supported or invalid.')
+
+# Solvers with a Pyomo persistent interface, which keeps the model loaded in the solver
+# between solves. APPSI solvers ('appsi_highs', 'appsi_gurobi', ...) are persistent as well.
+PERSISTENT_SOLVERS = {
+    'gurobi': 'gurobi_persistent',
+    'cplex': 'cplex_persistent',
+    'xpress': 'xpress_persistent'
+}
+
+def supports_persistent(solver):
+    return solver in PERSISTENT_SOLVERS or solver.startswith('appsi_')
+
+class solver_session():
+    # Loads a model into a persistent solver once. After that, only the constraint components
+    # passed to add_constraints() are pushed to the solver, and each solve() re-optimises
+    # from the solver's previous basis instead of rebuilding the problem from scratch.
+    
+    def __init__(self, model, options, solver):
+        if not supports_persistent(solver):
+            raise InvalidSolverError('Given solver has no persistent interface: ' + str(solver))
+        
+        self.model = model
+        self.solver = solver
+        self.appsi = solver.startswith('appsi_')
+        
+        if self.appsi:
+            self.opt = SolverFactory(solver)
+            # Changes are pushed explicitly, so APPSI does not need to scan the model
+            # for them before every solve
+            for check in ['check_for_new_or_removed_constraints', 'check_for_new_or_removed_vars',
+                          'check_for_new_or_removed_params', 'check_for_new_objective',
+                          'update_constraints', 'update_vars', 'update_params',
+                          'update_named_expressions', 'update_objective']:
+                setattr(self.opt.update_config, check, False)
+        else:
+            self.opt = SolverFactory(PERSISTENT_SOLVERS[solver])
+        
+        self.opt.options.update(options)
+        self.opt.set_instance(model)
+        
+        self.constraints_added = 0
+    
+    def add_constraints(self, components):
+        # components may be whole (indexed) constraint components or single constraints,
+        # e.g. cuts reactivated by a cut pool. Inactive constraints are not sent.
+        for component in components:
+            constraints = [constraint for constraint in constraint_data(component) if constraint.active]
+            if self.appsi:
+                self.opt.add_constraints(constraints)
+            else:
+                for constraint in constraints:
+                    self.opt.add_constraint(constraint)
+            self.constraints_added += len(constraints)
+    
+    def add_variables(self, variables):
+        if len(variables) == 0:
+            return
+        if self.appsi:
+            self.opt.add_variables(list(variables))
+        else:
+            for variable in variables:
+                self.opt.add_var(variable)
+
+    def set_objective(self, objective):
+        # Replaces the objective with the given (new) objective component
+        self.opt.set_objective(objective)
+
+    def update_variables(self, variables):
+        # Pushes changed variable bounds (or fixings) to the solver
+        if len(variables) == 0:
+            return
+        if self.appsi:
+            self.opt.update_variables(list(variables))
+        else:
+            for variable in variables:
+                self.opt.update_var(variable)
+
+    def remove_constraints(self, components):
+        for component in components:
+            if self.appsi:
+                self.opt.remove_constraints(constraint_data(component))
+            else:
+                for constraint in constraint_data(component):
+                    self.opt.remove_constraint(constraint)
+
+    def solve(self, warmstart=False, cutoff=None, options=None):
+        if options is not None:
+            self.opt.options.update(options)
+
+        if cutoff is not None and supports_native_cutoff(self.solver):
+            self.opt.options.update(native_cutoff_options(self.solver, cutoff))
+
+        if self.appsi:
+            results = self.opt.solve(self.model, load_solutions=False, warmstart=warmstart)
+            if len(results.solution) > 0:
+                self.opt.load_vars()
+        else:
+            results = self.opt.solve(warmstart=warmstart, load_solutions=False, save_results=False)
+            if results.solver.termination_condition in (TerminationCondition.optimal,
+                                                        TerminationCondition.feasible):
+                self.opt.load_vars()
+        
+        return results
+
+def constraint_data(component):
+    # The individual constraints of a constraint component
+    if component.is_indexed():
+        return list(component.values())
+    return [component]
+
+# Solvers that take models kept as SciPy sparse matrices and run in-process,
+# without going through Pyomo (see ilp_model.cussens.sparse_model)
+SPARSE_SOLVERS = ['highs']
+
+# scipy.optimize.milp status codes
+SPARSE_TERMINATION_CONDITIONS = {
+    0: TerminationCondition.optimal,
+    1: TerminationCondition.maxTimeLimit,
+    2: TerminationCondition.infeasible,
+    3: TerminationCondition.unbounded,
+    4: TerminationCondition.error
+}
+
+# highspy.HighsModelStatus names. kObjectiveBound means that nothing beats the cutoff.
+HIGHS_TERMINATION_CONDITIONS = {
+    'kOptimal': TerminationCondition.optimal,
+    'kTimeLimit': TerminationCondition.maxTimeLimit,
+    'kInfeasible': TerminationCondition.infeasible,
+    'kUnbounded': TerminationCondition.unbounded,
+    'kUnboundedOrInfeasible': TerminationCondition.infeasibleOrUnbounded,
+    'kObjectiveBound': TerminationCondition.minFunctionValue,
+    'kIterationLimit': TerminationCondition.maxIterations,
+    'kSolutionLimit': TerminationCondition.maxIterations
+}
+
+# scipy.optimize.milp option names that HiGHS calls differently
+HIGHS_OPTION_NAMES = {
+    'disp': 'output_flag',
+    'node_limit': 'mip_max_nodes'
+}
+
+class sparse_solver_results():
+    # Mirrors the parts of Pyomo's SolverResults that Bayene reads
+    # (results.solver.termination_condition), plus the solution itself.
+    class solver_info():
+        def __init__(self, termination_condition, message):
+            self.termination_condition = termination_condition
+            self.message = message
+    
+    def __init__(self, termination_condition, message, x, objective, bound):
+        self.solver = self.solver_info(termination_condition, message)
+        self.x = x
+        self.objective = objective
+        self.bound = bound
+
+def call_highs(objective, constraint_matrix, row_lower, row_upper, lower_bounds, upper_bounds,
+               integrality, options, maximize=True, cutoff=None, start=None):
+    # Solves max (or min) objective.x  s.t.  row_lower <= constraint_matrix.x <= row_upper,
+    # lower_bounds <= x <= upper_bounds, with HiGHS. cutoff prunes every solution whose
+    # objective is no better than it, and start is a MIP start (a full vector of values).
+    # Both need highspy; without it the problem goes through scipy.optimize.milp, which takes
+    # neither, so the cutoff becomes an explicit objective row and the start is ignored.
+    try:
+        import highspy
+    except ImportError:
+        return call_scipy_milp(objective, constraint_matrix, row_lower, row_upper, lower_bounds, upper_bounds,
+                               integrality, options, maximize, cutoff)
+    
+    sign = -1.0 if maximize else 1.0
+    constraint_matrix = constraint_matrix.tocsr()
+    n_columns = len(objective)
+    
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', False)
+    for name, value in options.items():
+        highs.setOptionValue(HIGHS_OPTION_NAMES.get(name, name), value)
+    
+    # HiGHS minimises sign * objective, so the cutoff is an upper limit on that
+    if cutoff is not None:
+        highs.setOptionValue('objective_bound', sign * cutoff)
+    
+    lp = highspy.HighsLp()
+    lp.num_col_ = n_columns
+    lp.num_row_ = constraint_matrix.shape[0]
+    lp.col_cost_ = sign * np.asarray(objective, dtype=float)
+    lp.col_lower_ = np.asarray(lower_bounds, dtype=float)
+    lp.col_upper_ = np.asarray(upper_bounds, dtype=float)
+    lp.row_lower_ = np.asarray(row_lower, dtype=float)
+    lp.row_upper_ = np.asarray(row_upper, dtype=float)
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.num_col_ = n_columns
+    lp.a_matrix_.num_row_ = constraint_matrix.shape[0]
+    lp.a_matrix_.start_ = constraint_matrix.indptr
+    lp.a_matrix_.index_ = constraint_matrix.indices
+    lp.a_matrix_.value_ = constraint_matrix.data
+    if np.any(integrality):
+        lp.integrality_ = [highspy.HighsVarType.kInteger if integral else highspy.HighsVarType.kContinuous
+                           for integral in integrality]
+    highs.passModel(lp)
+    
+    if start is not None and np.any(integrality):
+        solution = highspy.HighsSolution()
+        solution.col_value = np.asarray(start, dtype=float)
+        solution.value_valid = True
+        highs.setSolution(solution)
+    
+    highs.run()
+    
+    model_status = highs.getModelStatus()
+    info = highs.getInfo()
+    termination_condition = HIGHS_TERMINATION_CONDITIONS.get(model_status.name, TerminationCondition.error)
+    
+    # A solution is only returned if HiGHS reports a feasible one (e.g. not when it stopped
+    # at the time limit before finding any)
+    x = None
+    objective_value = None
+    if info.primal_solution_status == 2:
+        x = np.array(highs.getSolution().col_value)
+        objective_value = sign * info.objective_function_value
+    
+    bound = None
+    if np.any(integrality):
+        if math.isfinite(info.mip_dual_bound):
+            bound = sign * info.mip_dual_bound
+    elif termination_condition == TerminationCondition.optimal:
+        bound = objective_value
+    
+    return sparse_solver_results(termination_condition, highs.modelStatusToString(model_status), x, objective_value, bound)
+
+def call_scipy_milp(objective, constraint_matrix, row_lower, row_upper, lower_bounds, upper_bounds,
+                    integrality, options, maximize=True, cutoff=None):
+    # call_highs() through scipy.optimize.milp, for when highspy is not installed
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    
+    sign = -1.0 if maximize else 1.0
+    
+    # objective >= cutoff (or <= when minimising) as a dense extra row
+    if cutoff is not None:
+        constraint_matrix = scipy.sparse.vstack([constraint_matrix, scipy.sparse.csr_matrix(np.asarray(objective, dtype=float))], format='csr')
+        row_lower = np.append(row_lower, cutoff if maximize else -np.inf)
+        row_upper = np.append(row_upper, np.inf if maximize else cutoff)
+    
+    constraints = []
+    if constraint_matrix.shape[0] > 0:
+        constraints.append(LinearConstraint(constraint_matrix, row_lower, row_upper))
+    
+    scipy_result = milp(sign * np.asarray(objective, dtype=float), integrality=integrality,
+                        bounds=Bounds(lower_bounds, upper_bounds), constraints=constraints,
+                        options=options)
+    
+    dual_bound = getattr(scipy_result, 'mip_dual_bound', None)
+    return sparse_solver_results(
+        SPARSE_TERMINATION_CONDITIONS.get(scipy_result.status, TerminationCondition.error), scipy_result.message,
+        scipy_result.x, None if scipy_result.x is None else sign * scipy_result.fun,
+        None if dual_bound is None else sign * dual_bound
+    )
@@ -0,0 +1,258 @@
+"""
+inference.py: Parameters and exact inference for a learned Bayesian network structure.
+
+estimate_cpts() fits the conditional probability table of every node from a discrete dataset
+(e.g. the integer matrix returned by cussens_files.read_cussens_data) by counting with
+np.bincount over chunks of rows, smoothed with a symmetric Dirichlet prior. The CPT of a node
+is a NumPy array with one axis per parent (in the order of its parent set) followed by the
+node's own axis.
+
+variable_elimination answers P(target | evidence) for a fixed target and set of evidence
+variables. Everything that does not depend on the evidence values is done once, when it is
+built: nodes that are neither ancestors of the target nor of the evidence are dropped, an
+elimination order is chosen (greedy min-fill) and the sequence of factor contractions is laid
+out. A query then takes a whole batch of evidence rows: the evidence values index into the
+CPTs, which gives every factor a leading row axis, and each elimination step is one np.einsum
+over all the rows at once.
+
+inference_engine keeps one variable_elimination per (target, evidence variables), and splits
+the rows of a data matrix by which values are missing (coded as negative numbers).
+"""
+import numpy as np
+
+from bayene import scorer
+
+# Pseudo-count added to every cell of a CPT
+DEFAULT_ALPHA = 1.0
+
+# Rows evaluated together by one query; bounds the size of the batched factors
+DEFAULT_BATCH_SIZE = 4096
+
+# Label of the row axis of the factors in a batched query
+BATCH = -1
+
+class InvalidQueryError(Exception):
+	def __init__(self, value):
+		self.value = value
+	def __str__(self):
+		return repr(self.value)
+
+def estimate_cpts(data, parents, arities, alpha=DEFAULT_ALPHA):
+	# parents[node]: the parents of every node. Returns cpts[node] with
+	# cpts[node][parent values..., node value] = P(node value | parent values)
+	cpts = []
+
+	for node, parent_set in enumerate(parents):
+		parent_set = list(parent_set)
+		arity = int(arities[node])
+		shape = [int(arities[parent]) for parent in parent_set] + [arity]
+
+		n_cells = int(np.prod(shape))
+		if n_cells >= (1 << 62):
+			raise InvalidQueryError('CPT of node ' + str(node) + ' has too many cells: ' + str(shape))
+
+		# Parent configurations are counted in mixed-radix order, the same order as a C-ordered
+		# array of the given shape
+		counts = scorer.family_table(data, node, parent_set, arities).astype(np.float64)
+
+		counts = counts.reshape(shape) + alpha
+		cpts.append(counts / counts.sum(axis=-1, keepdims=True))
+
+	return cpts
+
+def relevant_nodes(parents, query_nodes):
+	# The query nodes and all their ancestors; the other nodes sum out to one
+	relevant = set()
+	stack = list(query_nodes)
+	while len(stack) > 0:
+		node = stack.pop()
+		if node in relevant:
+			continue
+		relevant.add(node)
+		stack.extend(parents[node])
+	return relevant
+
+def elimination_order(scopes, hidden, arities):
+	# Greedy min-fill order of the hidden variables over the interaction graph of the given
+	# factor scopes, ties broken by the size of the factor the elimination creates
+	neighbours = dict((variable, set()) for scope in scopes for variable in scope)
+	for scope in scopes:
+		for variable in scope:
+			neighbours[variable].update(other for other in scope if other != variable)
+
+	order = []
+	remaining = set(hidden)
+	while len(remaining) > 0:
+		def cost(variable):
+			adjacent = list(neighbours[variable])
+			fill = sum(1 for index, first in enumerate(adjacent) for second in adjacent[index + 1:]
+			           if second not in neighbours[first])
+			size = 1
+			for other in adjacent:
+				size *= int(arities[other])
+			return (fill, size, variable)
+
+		variable = min(remaining, key=cost)
+		order.append(variable)
+		remaining.discard(variable)
+
+		adjacent = neighbours.pop(variable)
+		for other in adjacent:
+			neighbours[other].discard(variable)
+			neighbours[other].update(adjacent - set([other]))
+
+	return order
+
+def contract(operands, scopes, output_scope):
+	# Product of the factors summed down to output_scope, as a single einsum
+	labels = {}
+	arguments = []
+	for operand, scope in zip(operands, scopes):
+		arguments.append(operand)
+		arguments.append([labels.setdefault(variable, len(labels)) for variable in scope])
+	arguments.append([labels[variable] for variable in output_scope])
+	return np.einsum(*arguments, optimize=len(operands) > 2)
+
+class variable_elimination():
+
+	def __init__(self, parents, arities, cpts, target, evidence_variables):
+		self.target = target
+		self.evidence_variables = list(evidence_variables)
+		self.arities = arities
+
+		if target in self.evidence_variables:
+			raise InvalidQueryError('The target ' + str(target) + ' cannot be evidence as well.')
+
+		relevant = relevant_nodes(parents, [target] + self.evidence_variables)
+		evidence_index = dict((variable, index) for index, variable in enumerate(self.evidence_variables))
+
+		# Every relevant CPT, with the evidence variables indexed away: (cpt, evidence axes,
+		# columns of the evidence they take, scope after indexing)
+		self.factors = []
+		scopes = []
+		for node in sorted(relevant):
+			scope = list(parents[node]) + [node]
+			evidence_axes = [axis for axis, variable in enumerate(scope) if variable in evidence_index]
+			columns = [evidence_index[scope[axis]] for axis in evidence_axes]
+			kept = [variable for variable in scope if variable not in evidence_index]
+			if len(evidence_axes) > 0:
+				kept = [BATCH] + kept
+			self.factors.append((cpts[node], evidence_axes, columns, kept))
+			scopes.append(kept)
+
+		hidden = relevant - set([target]) - set(self.evidence_variables)
+		self.order = elimination_order([[variable for variable in scope if variable != BATCH] for scope in scopes],
+		                               hidden, arities)
+
+		# Lay out the contractions: each step multiplies the factors that mention the variable
+		# and sums it out. Factor i of the plan is the i-th input or the output of a step.
+		self.steps = []
+		live = dict(enumerate(scopes))
+		next_factor = len(scopes)
+		for variable in self.order:
+			inputs = [factor for factor, scope in live.items() if variable in scope]
+			output_scope = []
+			for factor in inputs:
+				for other in live.pop(factor):
+					if other != variable and other not in output_scope:
+						output_scope.append(other)
+			self.steps.append((inputs, output_scope))
+			live[next_factor] = output_scope
+			next_factor += 1
+
+		self.final_inputs = list(live.keys())
+		self.final_scopes = list(live.values())
+
+	def query(self, evidence_values):
+		# evidence_values: (rows, len(evidence_variables)) array of observed values.
+		# Returns P(target | evidence) as a (rows, arity of target) array.
+		# Rows without any evidence are (rows, 0) arrays, whose row count a reshape cannot infer
+		evidence_values = np.asarray(evidence_values, dtype=np.int64)
+		if evidence_values.ndim < 2:
+			evidence_values = evidence_values.reshape(-1 if len(self.evidence_variables) > 0 else 1, len(self.evidence_variables))
+		n_rows = evidence_values.shape[0]
+
+		factors = {}
+		scopes = {}
+		for index, (cpt, evidence_axes, columns, scope) in enumerate(self.factors):
+			if len(evidence_axes) > 0:
+				moved = np.moveaxis(cpt, evidence_axes, list(range(len(evidence_axes))))
+				factors[index] = moved[tuple(evidence_values[:, column] for column in columns)]
+			else:
+				factors[index] = cpt
+			scopes[index] = scope
+
+		next_factor = len(self.factors)
+		for inputs, output_scope in self.steps:
+			product = contract([factors.pop(factor) for factor in inputs], [scopes.pop(factor) for factor in inputs],
+			                   output_scope)
+			# Rescale every row, so that long chains of small probabilities cannot underflow;
+			# the posterior is normalised per row at the end
+			if len(output_scope) > 1 and output_scope[0] == BATCH:
+				scale = product.reshape(n_rows, -1).max(axis=1)
+				product = product / np.where(scale > 0, scale, 1.0).reshape((n_rows,) + (1,) * (len(output_scope) - 1))
+			factors[next_factor] = product
+			scopes[next_factor] = output_scope
+			next_factor += 1
+
+		posterior = contract([factors[factor] for factor in factors], [scopes[factor] for factor in factors],
+		                     [BATCH, self.target] if any(BATCH in scope for scope in scopes.values()) else [self.target])
+		posterior = np.broadcast_to(posterior, (n_rows, int(self.arities[self.target])))
+
+		totals = posterior.sum(axis=1, keepdims=True)
+		return posterior / np.where(totals > 0, totals, 1.0)
+
+class inference_engine():
+
+	def __init__(self, parents, arities, cpts, batch_size=DEFAULT_BATCH_SIZE):
+		self.parents = [list(parent_set) for parent_set in parents]
+		self.arities = [int(arity) for arity in arities]
+		self.cpts = cpts
+		self.batch_size = batch_size
+
+		# (target, evidence variables) -> variable_elimination
+		self.compiled = {}
+
+	@classmethod
+	def fit(cls, data, parents, arities, alpha=DEFAULT_ALPHA, **kwargs):
+		return cls(parents, arities, estimate_cpts(data, parents, arities, alpha=alpha), **kwargs)
+
+	def compile(self, target, evidence_variables):
+		key = (target, tuple(evidence_variables))
+		if key not in self.compiled:
+			self.compiled[key] = variable_elimination(self.parents, self.arities, self.cpts, target, evidence_variables)
+		return self.compiled[key]
+
+	def posterior(self, data, target, evidence_variables=None):
+		# P(target | the other columns of each row), as a (rows, arity of target) array.
+		# Negative values are missing, and rows are grouped by which columns they miss, so
+		# each group is answered by one compiled query. Only evidence_variables (by default
+		# every column but the target) are used as evidence.
+		data = np.asarray(data)
+		if data.ndim == 1:
+			data = data.reshape(1, -1)
+		if data.shape[1] != len(self.parents):
+			raise InvalidQueryError('Expected ' + str(len(self.parents)) + ' columns, got ' + str(data.shape[1]) + '.')
+
+		if evidence_variables is None:
+			evidence_variables = [variable for variable in range(len(self.parents)) if variable != target]
+		evidence_variables = np.array([variable for variable in evidence_variables if variable != target], dtype=np.int64)
+
+		evidence = data[:, evidence_variables]
+		observed = evidence >= 0 if np.issubdtype(evidence.dtype, np.signedinteger) else np.ones(evidence.shape, dtype=bool)
+
+		posterior = np.empty((data.shape[0], self.arities[target]))
+		patterns, pattern_of_row = np.unique(observed, axis=0, return_inverse=True)
+		pattern_of_row = pattern_of_row.ravel()
+
+		for pattern_index, pattern in enumerate(patterns):
+			rows = np.flatnonzero(pattern_of_row == pattern_index)
+			query = self.compile(target, evidence_variables[pattern].tolist())
+			for start in range(0, len(rows), self.batch_size):
+				batch = rows[start:start + self.batch_size]
+				posterior[batch] = query.query(evidence[np.ix_(batch, np.flatnonzero(pattern))])
+
+		return posterior
+
+	def predict(self, data, target, evidence_variables=None):
+		return np.argmax(self.posterior(data, target, evidence_variables), axis=1)
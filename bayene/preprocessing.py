@@ -0,0 +1,106 @@
+"""
+preprocessing.py: Shrinks a set of local scores (as returned by read_cussens_scores() or
+scorer.score_parent_sets()) before the ILP is built.
+
+A candidate parent set W of a node is dominated if some proper subset of W scores at least
+as well: any DAG using W stays acyclic and scores no worse with the subset instead, so W can
+never be needed for an optimal DAG. Dominated candidates are removed, the candidate list is
+compacted to the parent sets still in use, and nodes left with a single candidate are
+reported as fixed (the model writers fix the variable of such a node).
+"""
+import numpy as np
+
+class preprocessed_scores():
+
+	def __init__(self, scores, parents, original_candidates, n_original_columns):
+		# scores/parents: the reduced problem, with candidate indexes into the compacted parents
+		# original_candidates[i]: index of parents[i] in the original candidate list
+		self.scores = scores
+		self.parents = parents
+		self.original_candidates = original_candidates
+		self.n_original_columns = n_original_columns
+
+	@property
+	def n_columns(self):
+		return sum(len(node_scores) for node_scores in self.scores)
+
+	@property
+	def n_eliminated(self):
+		return self.n_original_columns - self.n_columns
+
+	@property
+	def fixed(self):
+		# node -> its only remaining candidate (in reduced indexes)
+		return dict((node, next(iter(node_scores.keys())))
+		            for node, node_scores in enumerate(self.scores) if len(node_scores) == 1)
+
+	def report(self):
+		return {
+			'original_columns': self.n_original_columns,
+			'columns': self.n_columns,
+			'eliminated': self.n_eliminated,
+			'fixed_nodes': len(self.fixed)
+		}
+
+	def to_original(self, solution):
+		# Map a solution keyed by (node, reduced candidate) back to (node, original candidate)
+		return dict(((key[0], int(self.original_candidates[key[1]])), value) for key, value in solution.items())
+
+def parent_set_words(parents, n_nodes):
+	# Every parent set as a row of uint64 bitmask words, for vectorised subset tests
+	n_words = max(1, (n_nodes + 63) // 64)
+	words = np.zeros((len(parents), n_words), dtype=np.uint64)
+	for candidate, parent_set in enumerate(parents):
+		for parent in parent_set:
+			words[candidate, parent // 64] |= np.uint64(1) << np.uint64(parent % 64)
+	return words
+
+def undominated_candidates(candidate_scores, candidate_words, candidate_sizes):
+	# Boolean mask over candidates of the ones that no proper subset scores at least as well.
+	# Candidates are visited by decreasing score (smaller sets first on ties), so a candidate
+	# is dominated iff it is a superset of a candidate kept before it; dominated candidates
+	# never need to be compared against, since whatever dominates them dominates their supersets.
+	order = np.lexsort((candidate_sizes, -candidate_scores))
+
+	keep = np.zeros(len(candidate_scores), dtype=bool)
+	kept_words = np.zeros_like(candidate_words)
+	n_kept = 0
+
+	for position in order:
+		row = candidate_words[position]
+		# kept & ~row == 0 in every word <=> the kept set is a subset of this one
+		if n_kept > 0 and np.any(np.all((kept_words[:n_kept] & ~row) == 0, axis=1)):
+			continue
+		keep[position] = True
+		kept_words[n_kept] = row
+		n_kept += 1
+
+	return keep
+
+def prune_dominated(scores, parents):
+	# Returns a preprocessed_scores with the dominated candidates removed and the candidate
+	# list compacted. The solution of the reduced problem maps back with to_original().
+	n_nodes = len(scores)
+	words = parent_set_words(parents, n_nodes)
+	sizes = np.array([len(parent_set) for parent_set in parents], dtype=np.int64)
+
+	kept_scores = []
+	for node_scores in scores:
+		candidates = np.array(list(node_scores.keys()), dtype=np.int64)
+		if len(candidates) == 0:
+			kept_scores.append({})
+			continue
+		candidate_scores = np.array([node_scores[candidate] for candidate in candidates.tolist()], dtype=np.float64)
+		keep = undominated_candidates(candidate_scores, words[candidates], sizes[candidates])
+		kept_scores.append(dict((int(candidate), node_scores[int(candidate)]) for candidate in candidates[keep]))
+
+	# Compact the candidate list to the parent sets still used by some node
+	original_candidates = np.array(sorted(set(candidate for node_scores in kept_scores for candidate in node_scores)), dtype=np.int64)
+	reduced_index = dict((int(candidate), index) for index, candidate in enumerate(original_candidates))
+
+	reduced_scores = [dict((reduced_index[candidate], score) for candidate, score in node_scores.items())
+	                  for node_scores in kept_scores]
+	reduced_parents = [list(parents[candidate]) for candidate in original_candidates.tolist()]
+
+	return preprocessed_scores(reduced_scores, reduced_parents, original_candidates,
+	                           sum(len(node_scores) for node_scores in scores))
@@ -0,0 +1,384 @@
+"""
+scorer.py: Local scores for candidate parent sets, computed directly from a discrete dataset
+(e.g. the integer matrix returned by cussens_files.read_cussens_data). The output uses the same
+layout as cussens_files.read_cussens_scores(), so it can be handed to the ILP model as-is.
+"""
+import collections
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.special import gammaln
+
+from bayene.utils.cussens_files import smallest_dtype
+
+# Number of parent-configuration encodings kept by count_cache
+DEFAULT_CACHE_SIZE = 64
+
+# Above this many cells, contingency tables are built with np.unique instead of np.bincount
+# to avoid allocating mostly empty tables
+DENSE_TABLE_LIMIT = 1 << 22
+
+# Rows encoded at a time by family_table(), extend_codes() and family_counts_from_codes(),
+# so that counting never needs int64 codes for the whole dataset
+DEFAULT_CHUNK_ROWS = 1 << 18
+
+class InvalidScoreTypeError(Exception):
+	def __init__(self, value):
+		self.value = value
+	def __str__(self):
+		return repr(self.value)
+
+def generate_parent_sets(n_variables, n_parents):
+	# Every subset of the variables with at most n_parents members, smallest first
+	parent_candidates = []
+	for size in range(n_parents + 1):
+		parent_candidates.extend(list(parent_set) for parent_set in itertools.combinations(range(n_variables), size))
+	return parent_candidates
+
+def infer_arities(data):
+	# Assume values are coded 0..(arity - 1), as in Cussens data files
+	return [int(column.max()) + 1 if len(column) > 0 else 1 for column in data.T]
+
+def encode_columns(data, columns, arities, chunk_rows=DEFAULT_CHUNK_ROWS):
+	# Mixed-radix encoding of the joint value of the given columns, one code per row, in the
+	# smallest unsigned type that holds them. Returns the codes and the number of possible
+	# codes (see extend_codes).
+	codes = np.zeros(data.shape[0], dtype=np.uint8)
+	n_configs = 1
+	
+	for column in columns:
+		codes, n_configs = extend_codes(codes, n_configs, data[:, column], int(arities[column]), chunk_rows)
+	
+	return codes, n_configs
+
+def extend_codes(codes, n_configs, values, arity, chunk_rows=DEFAULT_CHUNK_ROWS):
+	# Codes of the configurations extended by one more column: codes * arity + values, in
+	# the smallest unsigned type that holds them. Only chunk_rows rows at a time are widened
+	# to int64. Once the number of possible codes exceeds DENSE_TABLE_LIMIT, the codes are
+	# compressed to the observed configurations (keeping their order).
+	n_extended = n_configs * arity
+	extended = np.empty(len(codes), dtype=smallest_dtype([n_extended]))
+	for start in range(0, len(codes), chunk_rows):
+		extended[start:start + chunk_rows] = codes[start:start + chunk_rows].astype(np.int64) * arity + values[start:start + chunk_rows]
+	
+	if n_extended <= DENSE_TABLE_LIMIT:
+		return extended, n_extended
+	
+	observed = np.unique(extended)
+	compressed = np.empty(len(codes), dtype=smallest_dtype([len(observed)]))
+	for start in range(0, len(codes), chunk_rows):
+		compressed[start:start + chunk_rows] = np.searchsorted(observed, extended[start:start + chunk_rows])
+	
+	return compressed, len(observed)
+
+def family_counts(data, child, parent_set, arities):
+	# Contingency counts of (parent configuration, child value) for the observed parent
+	# configurations only. Returns (N_ij, N_ijk): N_ij[j] is the number of rows in parent
+	# configuration j and N_ijk[j] the per-child-value counts of those rows.
+	n_parent_configs = 1
+	for parent in parent_set:
+		n_parent_configs *= int(arities[parent])
+	
+	if n_parent_configs * int(arities[child]) <= DENSE_TABLE_LIMIT:
+		table = family_table(data, child, parent_set, arities)
+		N_ij = table.sum(axis=1)
+		observed = N_ij > 0
+		return N_ij[observed], table[observed]
+	
+	parent_codes, n_parent_configs = encode_columns(data, parent_set, arities)
+	return family_counts_from_codes(parent_codes, n_parent_configs, data[:, child], int(arities[child]))
+
+def family_table(data, child, parent_set, arities, chunk_rows=DEFAULT_CHUNK_ROWS):
+	# Dense (parent configuration, child value) count table, with parent configurations in
+	# mixed-radix order, accumulated over chunks of rows (data may be a memory-mapped array)
+	n_parent_configs = 1
+	for parent in parent_set:
+		n_parent_configs *= int(arities[parent])
+	child_arity = int(arities[child])
+	
+	table = np.zeros(n_parent_configs * child_arity, dtype=np.int64)
+	for start in range(0, data.shape[0], chunk_rows):
+		chunk = data[start:start + chunk_rows]
+		parent_codes, _ = encode_columns(chunk, parent_set, arities)
+		table += np.bincount(parent_codes.astype(np.int64) * child_arity + chunk[:, child], minlength=len(table))
+	
+	return table.reshape(n_parent_configs, child_arity)
+
+def family_counts_from_codes(parent_codes, n_parent_configs, child_values, child_arity, chunk_rows=DEFAULT_CHUNK_ROWS):
+	# Family codes are only formed (in int64) chunk_rows rows at a time
+	if n_parent_configs * child_arity <= DENSE_TABLE_LIMIT:
+		table = np.zeros(n_parent_configs * child_arity, dtype=np.int64)
+		for start in range(0, len(parent_codes), chunk_rows):
+			family_codes = parent_codes[start:start + chunk_rows].astype(np.int64) * child_arity + child_values[start:start + chunk_rows]
+			table += np.bincount(family_codes, minlength=len(table))
+		table = table.reshape(n_parent_configs, child_arity)
+		N_ij = table.sum(axis=1)
+		observed = N_ij > 0
+		return N_ij[observed], table[observed]
+	
+	observed_parents = np.unique(parent_codes)
+	table = np.zeros((len(observed_parents), child_arity), dtype=np.int64)
+	for start in range(0, len(parent_codes), chunk_rows):
+		parent_index = np.searchsorted(observed_parents, parent_codes[start:start + chunk_rows])
+		np.add.at(table, (parent_index, child_values[start:start + chunk_rows]), 1)
+	return table.sum(axis=1), table
+
+def bdeu_score(N_ij, N_ijk, n_parent_configs, child_arity, ess=1.0):
+	# Unobserved parent configurations contribute zero, so only observed ones are summed
+	alpha_j = ess / n_parent_configs
+	alpha_jk = alpha_j / child_arity
+	
+	return float(
+		np.sum(gammaln(alpha_j) - gammaln(alpha_j + N_ij))
+		+ np.sum(gammaln(alpha_jk + N_ijk[N_ijk > 0]) - gammaln(alpha_jk))
+	)
+
+def bic_score(N_ij, N_ijk, n_parent_configs, child_arity, n_samples):
+	nonzero = N_ijk > 0
+	log_likelihood = np.sum(N_ijk[nonzero] * np.log(N_ijk[nonzero] / np.broadcast_to(N_ij[:, None], N_ijk.shape)[nonzero]))
+	penalty = 0.5 * np.log(n_samples) * n_parent_configs * (child_arity - 1)
+	
+	return float(log_likelihood - penalty)
+
+def local_score(data, child, parent_set, arities, score_type='bdeu', ess=1.0):
+	N_ij, N_ijk = family_counts(data, child, parent_set, arities)
+	
+	n_parent_configs = 1
+	for parent in parent_set:
+		n_parent_configs *= int(arities[parent])
+	
+	return _score_from_counts(N_ij, N_ijk, n_parent_configs, int(arities[child]), data.shape[0], score_type, ess)
+
+class count_cache():
+	# LRU cache of the mixed-radix parent configuration codes for variable subsets.
+	# The codes of a subset are derived from the cached codes of its prefix with one
+	# multiply-add, so each subset costs O(rows) once, no matter how many children or
+	# supersets use it. When the radix product grows too large, codes are compressed to
+	# the observed configurations before being cached. Codes are kept in the smallest
+	# unsigned type that holds them, and built in chunks by extend_codes.
+	
+	def __init__(self, data, arities, max_entries=DEFAULT_CACHE_SIZE):
+		self.data = data
+		self.arities = arities
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+	
+	def parent_codes(self, parent_set):
+		# parent_set must be a sorted tuple. Returns (codes, n_configs).
+		if len(parent_set) == 0:
+			return np.zeros(self.data.shape[0], dtype=np.uint8), 1
+		
+		if parent_set in self.entries:
+			self.hits += 1
+			self.entries.move_to_end(parent_set)
+			return self.entries[parent_set]
+		
+		self.misses += 1
+		prefix_codes, prefix_configs = self.parent_codes(parent_set[:-1])
+		
+		last = parent_set[-1]
+		codes, n_configs = extend_codes(prefix_codes, prefix_configs, self.data[:, last], int(self.arities[last]))
+		
+		self.entries[parent_set] = (codes, n_configs)
+		if len(self.entries) > self.max_entries:
+			self.entries.popitem(last=False)
+		
+		return codes, n_configs
+
+def score_child(child, data, arities, n_parents, score_type='bdeu', ess=1.0, pruning=True, cache=None):
+	# Scores the parent sets of one child, smallest first, and returns {parent tuple: score}.
+	# With pruning, parent sets that provably cannot be in an optimal network are dropped:
+	#  - a parent set is dropped once scored if one of its subsets scores at least as well;
+	#  - BIC: score(S) <= -penalty(S) since the log-likelihood is never positive, so S is never
+	#    scored if a subset already reaches -penalty(S). Penalties grow with S, so the same
+	#    test prunes all its supersets as they come up (de Campos and Ji, 2011);
+	#  - BDeu: once every observed configuration of S occurs only once, all supersets of S
+	#    have the same score as S (de Campos and Ji, 2011), so they are never scored.
+	if score_type not in ('bdeu', 'bic'):
+		raise InvalidScoreTypeError('Given score type is not supported: ' + str(score_type))
+	
+	if cache is None:
+		cache = count_cache(data, arities)
+	
+	n_samples = data.shape[0]
+	child_arity = int(arities[child])
+	child_values = data[:, child]
+	others = [variable for variable in range(data.shape[1]) if variable != child]
+	
+	child_scores = {}
+	
+	# Best score among the kept subsets of each parent set of the previous size, and the
+	# parent sets whose configurations all occur at most once (BDeu rule)
+	previous_best = {}
+	saturated = set()
+	
+	for size in range(n_parents + 1):
+		current_best = {}
+		
+		for parent_set in itertools.combinations(others, size):
+			subset_best = None
+			subset_saturated = False
+			for dropped in range(size):
+				subset = parent_set[:dropped] + parent_set[dropped + 1:]
+				if subset in saturated:
+					subset_saturated = True
+				if subset in previous_best and (subset_best is None or previous_best[subset] > subset_best):
+					subset_best = previous_best[subset]
+			
+			n_parent_configs = 1
+			for parent in parent_set:
+				n_parent_configs *= int(arities[parent])
+			
+			if pruning and size > 0:
+				if score_type == 'bdeu' and subset_saturated:
+					saturated.add(parent_set)
+					current_best[parent_set] = subset_best
+					continue
+				if score_type == 'bic' and subset_best is not None \
+				and subset_best >= -0.5 * np.log(n_samples) * n_parent_configs * (child_arity - 1):
+					current_best[parent_set] = subset_best
+					continue
+			
+			codes, n_codes = cache.parent_codes(parent_set)
+			N_ij, N_ijk = family_counts_from_codes(codes, n_codes, child_values, child_arity)
+			score = _score_from_counts(N_ij, N_ijk, n_parent_configs, child_arity, n_samples, score_type, ess)
+			
+			if pruning and score_type == 'bdeu' and N_ij.max() <= 1:
+				saturated.add(parent_set)
+			
+			if pruning and subset_best is not None and subset_best >= score:
+				current_best[parent_set] = subset_best
+				continue
+			
+			child_scores[parent_set] = score
+			current_best[parent_set] = score if subset_best is None else max(score, subset_best)
+		
+		previous_best = current_best
+	
+	return child_scores
+
+def score_parent_sets(data, n_parents, arities=None, score_type='bdeu', ess=1.0, pruning=True,
+                      n_jobs=1, cache_size=DEFAULT_CACHE_SIZE):
+	# Enumerates and scores the parent sets (up to n_parents members) of every variable.
+	# Returns (dataset_scores, parent_candidates) in the read_cussens_scores() layout.
+	# With n_jobs > 1 (or n_jobs=None for one per CPU) each child is scored in a separate task
+	# of a process pool; workers memory-map the dataset instead of receiving a pickled copy.
+	if score_type not in ('bdeu', 'bic'):
+		raise InvalidScoreTypeError('Given score type is not supported: ' + str(score_type))
+	
+	if arities is None:
+		arities = infer_arities(data)
+	arities = [int(arity) for arity in arities]
+	
+	n_variables = data.shape[1]
+	
+	if n_jobs == 1:
+		cache = count_cache(data, arities, cache_size)
+		children_scores = [score_child(child, data, arities, n_parents, score_type, ess, pruning, cache)
+		                   for child in range(n_variables)]
+	else:
+		children_scores = _score_children_in_pool(data, arities, n_parents, score_type, ess, pruning,
+		                                          n_jobs, cache_size)
+	
+	# Number the distinct parent sets kept for any child, smallest first
+	all_parent_sets = set()
+	for child_scores in children_scores:
+		all_parent_sets.update(child_scores.keys())
+	
+	parent_candidates = sorted(all_parent_sets, key=lambda parent_set: (len(parent_set), parent_set))
+	parent_set_index = dict((parent_set, index) for index, parent_set in enumerate(parent_candidates))
+	
+	dataset_scores = [dict((parent_set_index[parent_set], score) for parent_set, score in child_scores.items())
+	                  for child_scores in children_scores]
+	
+	return dataset_scores, [list(parent_set) for parent_set in parent_candidates]
+
+# State of a scoring worker process, set up once by _initialise_worker()
+_worker_state = None
+
+def _initialise_worker(data_path, arities, n_parents, score_type, ess, pruning, cache_size):
+	global _worker_state
+	
+	data = np.load(data_path, mmap_mode='r')
+	_worker_state = {
+		'data': data, 'arities': arities, 'n_parents': n_parents, 'score_type': score_type,
+		'ess': ess, 'pruning': pruning, 'cache': count_cache(data, arities, cache_size)
+	}
+
+def _score_child_task(child):
+	state = _worker_state
+	return score_child(child, state['data'], state['arities'], state['n_parents'], state['score_type'],
+	                   state['ess'], state['pruning'], state['cache'])
+
+def memmapped_path(data):
+	# Path of the .npy file data is a memory map of, if it maps the whole array in that file
+	filename = getattr(data, 'filename', None)
+	if not isinstance(data, np.memmap) or filename is None or not filename.endswith('.npy'):
+		return None
+	
+	stored = np.load(filename, mmap_mode='r')
+	if stored.shape != data.shape or stored.dtype != data.dtype or stored.offset != data.offset \
+	   or not data.flags['C_CONTIGUOUS']:
+		return None
+	return filename
+
+def _score_children_in_pool(data, arities, n_parents, score_type, ess, pruning, n_jobs, cache_size):
+	temp_dir = tempfile.mkdtemp(prefix='bayene_scorer_')
+	try:
+		# A dataset already memory-mapped from a whole .npy file (e.g. read_cussens_data with
+		# memmap_path) is shared as it is; anything else is saved for the workers first
+		data_path = memmapped_path(data)
+		if data_path is None:
+			data_path = os.path.join(temp_dir, 'data.npy')
+			np.save(data_path, np.ascontiguousarray(data))
+		
+		pool = multiprocessing.Pool(
+			processes=n_jobs,
+			initializer=_initialise_worker,
+			initargs=(data_path, arities, n_parents, score_type, ess, pruning, cache_size)
+		)
+		try:
+			children_scores = pool.map(_score_child_task, range(data.shape[1]), chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	finally:
+		shutil.rmtree(temp_dir, ignore_errors=True)
+	
+	return children_scores
+
+def calculate_scores(data, parent_candidates, arities=None, score_type='bdeu', ess=1.0):
+	# Returns dataset_scores in the read_cussens_scores() layout: dataset_scores[node] maps the
+	# index of each candidate in parent_candidates to its local score. Candidates that contain
+	# the node itself are skipped.
+	if score_type not in ('bdeu', 'bic'):
+		raise InvalidScoreTypeError('Given score type is not supported: ' + str(score_type))
+	
+	if arities is None:
+		arities = infer_arities(data)
+	
+	dataset_scores = []
+	
+	for child in range(data.shape[1]):
+		child_scores = {}
+		for candidate_index, parent_set in enumerate(parent_candidates):
+			if child in parent_set:
+				continue
+			child_scores[candidate_index] = local_score(data, child, parent_set, arities, score_type, ess)
+		dataset_scores.append(child_scores)
+	
+	return dataset_scores
+
+def _score_from_counts(N_ij, N_ijk, n_parent_configs, child_arity, n_samples, score_type, ess):
+	if score_type == 'bdeu':
+		return bdeu_score(N_ij, N_ijk, n_parent_configs, child_arity, ess)
+	elif score_type == 'bic':
+		return bic_score(N_ij, N_ijk, n_parent_configs, child_arity, n_samples)
+	else:
+		raise InvalidScoreTypeError('Given score type is not supported: ' + str(score_type))
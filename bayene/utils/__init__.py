@@ -1 +1 @@
-__all__ = ['cussens_files']
\ No newline at end of file
+__all__ = ['cussens_files', 'score_cache']
\ No newline at end of file
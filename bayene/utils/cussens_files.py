@@ -1,9 +1,30 @@
 """
 cussens_files.py:
 """
+import os
+import warnings
+
 import numpy as np
 
-def read_cussens_data(data_file_object, names = False, arities = True):
+# Characters of the data block read and parsed at a time by read_cussens_data()
+DEFAULT_CHUNK_SIZE = 1 << 22
+
+class InvalidDataFileError(Exception):
+	def __init__(self, value):
+		self.value = value
+	def __str__(self):
+		return repr(self.value)
+
+def smallest_dtype(arities):
+	# Smallest unsigned integer type holding the values 0..(arity - 1) of every variable
+	largest = max([int(arity) for arity in arities] + [1]) - 1
+	for dtype in (np.uint8, np.uint16, np.uint32):
+		if largest <= np.iinfo(dtype).max:
+			return np.dtype(dtype)
+	return np.dtype(np.uint64)
+
+def read_cussens_data(data_file_object, names = False, arities = True, chunk_size = DEFAULT_CHUNK_SIZE,
+                      memmap_path = None):
 	# Cussens 'data' file structure according to the GOBNILP 1.6.1 manual:
 	# We ignore all the comment lines that start with '#'.
 	# (Among all the non-comment lines) First line is the total number of BN variables.
@@ -11,41 +32,187 @@ def read_cussens_data(data_file_object, names = False, arities = True):
 	# output more intelligible.
 	# Third line shows the arities of the variables: they show how many values each variables
 	# can take.
-	# The rest of the file should be the record of instances, with each column representing one
-	# variable.
+	# The next line is the number of instances, and the rest of the file should be the record
+	# of instances, with each column representing one variable.
 	# Since the file format itself cannot directly tell us if variables names or arities are
 	# available in the file beforehand, user must specify their existence in parameters.
 	# Default values are names=False and arities=True.
 	
-	dataset_data = []
+	# The instances are parsed chunk_size characters at a time, straight into an array of the
+	# smallest unsigned type that holds every value (uint8 for arities up to 256), so no 64-bit
+	# copy of the whole dataset is ever made. With memmap_path, that array is a memory-mapped
+	# .npy file, which np.load(memmap_path, mmap_mode='r') opens again without parsing.
+	
 	dataset_names = []
 	dataset_arities = []
 	
 	# Read the very first line of the file and get the total number of attributes
-	n_attributes = int(data_file_object.readline().rstrip())
-	print("Total number of attributes: " + n_attributes)
+	n_attributes = int(_header_line(data_file_object))
+	print("Total number of attributes: " + str(n_attributes))
 	
 	if names:
-		dataset_names = data_file_object.readline().split()
+		dataset_names = _header_line(data_file_object).split()
 	else:
 		dataset_names = range(n_attributes)
 	
 	if arities:
-		dataset_arities = [int(i) for i in data_file_object.readline().split()]
+		dataset_arities = [int(i) for i in _header_line(data_file_object).split()]
+		if len(dataset_arities) != n_attributes:
+			raise InvalidDataFileError('Expected ' + str(n_attributes) + ' arities, got ' + str(len(dataset_arities)) + '.')
 	
-	n_samples = int(data_file_object.readline().rstrip())
+	n_samples = int(_header_line(data_file_object))
 	
-	dataset_data = np.loadtxt(data_file_object, dtype=int)
+	# Without arities, start from uint8 and widen if larger values come up
+	dtype = smallest_dtype(dataset_arities) if arities else np.dtype(np.uint8)
+	dataset_data = _allocate_data((n_samples, n_attributes), dtype, memmap_path)
+	
+	# Values seen in each column, to count them if the arities are not given
+	observed_values = [set() for _ in range(n_attributes)]
+	
+	n_rows = 0
+	remainder = ''
+	end_of_file = False
+	while not end_of_file:
+		block = data_file_object.read(chunk_size)
+		end_of_file = len(block) == 0
+		
+		# Parse whole lines only; a line cut at the end of the block waits for the next one
+		text = remainder + block
+		if not end_of_file:
+			cut = text.rfind('\n')
+			if cut < 0:
+				remainder = text
+				continue
+			text, remainder = text[:cut + 1], text[cut + 1:]
+		
+		chunk = _parse_rows(text, n_attributes)
+		if len(chunk) == 0:
+			continue
+		
+		if n_rows + len(chunk) > n_samples:
+			raise InvalidDataFileError('Data file has more than the ' + str(n_samples) + ' instances it declares.')
+		if chunk.min() < 0:
+			raise InvalidDataFileError('Negative value in instances ' + str(n_rows) + '-' + str(n_rows + len(chunk) - 1) + '.')
+		
+		if arities:
+			out_of_range = np.flatnonzero(chunk.max(axis=0) >= np.array(dataset_arities))
+			if len(out_of_range) > 0:
+				raise InvalidDataFileError('Values of variable ' + str(int(out_of_range[0])) + ' exceed its arity.')
+		else:
+			if chunk.max() > np.iinfo(dtype).max:
+				dtype = smallest_dtype([chunk.max() + 1])
+				dataset_data = _widen_data(dataset_data, n_rows, dtype, memmap_path)
+			for column in range(n_attributes):
+				observed_values[column].update(np.unique(chunk[:, column]).tolist())
+		
+		dataset_data[n_rows:n_rows + len(chunk)] = chunk
+		n_rows += len(chunk)
+	
+	if n_rows != n_samples:
+		raise InvalidDataFileError('Data file declares ' + str(n_samples) + ' instances but has ' + str(n_rows) + '.')
+	
+	if memmap_path is not None:
+		dataset_data.flush()
 	
 	# If arities are not given, assume that the number of unique elements for each variables
 	# are full arities
 	if not arities:
-		for column in dataset_data.T:
-			dataset_arities.append(len(np.unique(column)))
+		dataset_arities = [len(values) for values in observed_values]
 	
 	return dataset_data, dataset_names, dataset_arities
 
+def _header_line(data_file_object):
+	# Next line that is neither blank nor a comment
+	for line in iter(data_file_object.readline, ''):
+		stripped = line.strip()
+		if len(stripped) > 0 and not stripped.startswith('#'):
+			return stripped
+	raise InvalidDataFileError('Data file ended before its header was complete.')
+
+def _parse_rows(text, n_attributes):
+	# Rows of whitespace-separated integers, as an int64 array of shape (rows, n_attributes)
+	if '#' in text:
+		text = '\n'.join(line for line in text.splitlines() if not line.lstrip().startswith('#'))
+	
+	# np.fromstring stops at the first token that is not a number, with only a warning
+	with warnings.catch_warnings():
+		warnings.simplefilter('error', DeprecationWarning)
+		try:
+			values = np.fromstring(text, dtype=np.int64, sep=' ')
+		except (DeprecationWarning, ValueError):
+			raise InvalidDataFileError('Data file has a value that is not an integer.')
+	
+	if len(values) % n_attributes != 0:
+		raise InvalidDataFileError('Data file has an instance without exactly ' + str(n_attributes) + ' values.')
+	
+	return values.reshape(-1, n_attributes)
+
+def _allocate_data(shape, dtype, memmap_path):
+	if memmap_path is None:
+		return np.empty(shape, dtype=dtype)
+	return np.lib.format.open_memmap(memmap_path, mode='w+', dtype=dtype, shape=shape)
+
+def _widen_data(dataset_data, n_rows, dtype, memmap_path):
+	# Copy of the rows read so far into an array of a wider type
+	if memmap_path is None:
+		widened = np.empty(dataset_data.shape, dtype=dtype)
+		widened[:n_rows] = dataset_data[:n_rows]
+		return widened
+	
+	temp_path = memmap_path + '.tmp'
+	widened = np.lib.format.open_memmap(temp_path, mode='w+', dtype=dtype, shape=dataset_data.shape)
+	widened[:n_rows] = dataset_data[:n_rows]
+	widened.flush()
+	del dataset_data, widened
+	os.replace(temp_path, memmap_path)
+	return np.load(memmap_path, mmap_mode='r+')
+
+class cussens_scores():
+	# Compact, NumPy-backed view of a Cussens score file.
+	# Rows are (node, candidate, score) triples grouped by node: the rows of node v are
+	# node_offsets[v]:node_offsets[v+1]. Each distinct parent set is stored only once, in
+	# CSR form: the members of parent set k are parent_members[parent_offsets[k]:parent_offsets[k+1]].
+	
+	def __init__(self, node_offsets, candidates, scores, parent_offsets, parent_members):
+		self.node_offsets = node_offsets
+		self.candidates = candidates
+		self.scores = scores
+		self.parent_offsets = parent_offsets
+		self.parent_members = parent_members
+	
+	@property
+	def n_attributes(self):
+		return len(self.node_offsets) - 1
+	
+	@property
+	def n_parent_sets(self):
+		return len(self.parent_offsets) - 1
+	
+	def parent_set(self, candidate):
+		return self.parent_members[self.parent_offsets[candidate]:self.parent_offsets[candidate + 1]]
+	
+	def to_dicts(self):
+		# List-of-dicts view returned by read_cussens_scores(): dataset_scores[node] maps
+		# parent set indexes to scores, dataset_all_parents[k] is the list of members of parent set k
+		candidates = self.candidates.tolist()
+		scores = self.scores.tolist()
+		node_offsets = self.node_offsets.tolist()
+		
+		dataset_scores = [dict(zip(candidates[node_offsets[node]:node_offsets[node + 1]],
+		                           scores[node_offsets[node]:node_offsets[node + 1]]))
+		                  for node in range(self.n_attributes)]
+		
+		members = self.parent_members.tolist()
+		parent_offsets = self.parent_offsets.tolist()
+		dataset_all_parents = [members[parent_offsets[k]:parent_offsets[k + 1]] for k in range(self.n_parent_sets)]
+		
+		return dataset_scores, dataset_all_parents
+
 def read_cussens_scores(score_file_object):
+	# List-of-dicts view of the score file (see read_cussens_score_arrays() for the file format)
+	return read_cussens_score_arrays(score_file_object).to_dicts()
+
+def read_cussens_score_arrays(score_file_object):
 	# Cussens 'score' file structure according to the GOBNILP 1.6.1 manual:
 	# First line is the total number of BN variables.
 	# After that, there are groups of lines for each variable of the dataset.
@@ -53,11 +220,19 @@ def read_cussens_scores(score_file_object):
 	# (ex. 0 10 means the variable is 0th variable and have 10 candidate parent sets).
 	# The lines after that are calculated scores for each candidate parent set.
 	# First token: Score, 2nd: number of parents, the rest: serial number of parent nodes
-
-	# Store scores here
-	dataset_scores = []
-	dataset_all_parents = []
-
+	
+	# The file is streamed line by line. Parent sets are deduplicated through a dict keyed by
+	# the tuple of members, so each line costs O(number of parents) rather than O(number of
+	# distinct parent sets seen so far). Members keep their order in the file, and as before,
+	# only parent sets listed with the same members in the same order are merged.
+	parent_set_index = {}
+	parent_members = []
+	parent_offsets = [0]
+	
+	node_offsets = [0]
+	candidates = []
+	scores = []
+	
 	# Read the very first line of the file and get the total number of attributes
 	n_attributes = score_file_object.readline().rstrip()
 	print("Total number of attributes: " + n_attributes)
@@ -67,36 +242,38 @@ def read_cussens_scores(score_file_object):
 	while not file_read_complete:
 		
 		current_line_tokens = score_file_object.readline().split()
-
+		
 		if len(current_line_tokens) == 0:
 			file_read_complete = True
-
+		
 		elif len(current_line_tokens) == 2:
-			current_attribute_serial = int(current_line_tokens[0])
-			
 			# current_line_tokens[1] shows the number of candidates this attribute have
 			loop_counter = int(current_line_tokens[1])
 			
-			# Create a dict that contains score info for this attribute and will be added to dataset_scores
-			current_attribute_candidate_scores = {}
-			
 			while loop_counter > 0:
 				candidate_line_tokens = score_file_object.readline().split()
 				
-				# Check if the candidate being examined was previously detected earlier
-				current_candidate = [int(i) for i in candidate_line_tokens[2:]]
+				current_candidate = tuple(int(i) for i in candidate_line_tokens[2:])
 				
 				# If this candidate already exists, use the same index number to store the score
-				if current_candidate in dataset_all_parents:
-					this_candidate_index = dataset_all_parents.index(current_candidate)
-				else:
-					dataset_all_parents.append(current_candidate)
-					this_candidate_index = len(dataset_all_parents) - 1
+				this_candidate_index = parent_set_index.get(current_candidate)
+				if this_candidate_index is None:
+					this_candidate_index = len(parent_offsets) - 1
+					parent_set_index[current_candidate] = this_candidate_index
+					parent_members.extend(current_candidate)
+					parent_offsets.append(len(parent_members))
 				
-				current_attribute_candidate_scores[this_candidate_index] = float(candidate_line_tokens[0])
+				candidates.append(this_candidate_index)
+				scores.append(float(candidate_line_tokens[0]))
 				
 				loop_counter -= 1
-
-			dataset_scores.append(current_attribute_candidate_scores)
 			
-	return dataset_scores, dataset_all_parents
\ No newline at end of file
+			node_offsets.append(len(candidates))
+	
+	return cussens_scores(
+		np.array(node_offsets, dtype=np.int64),
+		np.array(candidates, dtype=np.int32),
+		np.array(scores, dtype=np.float64),
+		np.array(parent_offsets, dtype=np.int64),
+		np.array(parent_members, dtype=np.int32)
+	)
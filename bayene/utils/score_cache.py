@@ -0,0 +1,176 @@
+"""
+score_cache.py: Compiled binary cache for Cussens score files. A score file is parsed once
+with read_cussens_score_arrays() and its arrays are written into a flat binary file, which
+later runs memory-map instead of re-parsing the text. Since the arrays are mapped read-only,
+worker processes loading the same cache share the same pages.
+
+Cache file layout:
+  bytes 0-7          magic b'BAYENESC'
+  bytes 8-HEADER_SIZE JSON header (utf-8, padded with spaces) recording the source file's
+                     size, mtime and SHA-256, and the dtype/offset/length of every array
+  after that         raw arrays, each starting on an ALIGNMENT-byte boundary
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import cussens_files
+
+MAGIC = b'BAYENESC'
+VERSION = 2
+HEADER_SIZE = 4096
+ALIGNMENT = 64
+
+ARRAY_NAMES = ['node_offsets', 'candidates', 'scores', 'parent_offsets', 'parent_members']
+
+class InvalidCacheError(Exception):
+	def __init__(self, value):
+		self.value = value
+	def __str__(self):
+		return repr(self.value)
+
+def default_cache_path(score_path):
+	return score_path + '.cache'
+
+def file_digest(path, chunk_size=1 << 20):
+	digest = hashlib.sha256()
+	with open(path, 'rb') as source_file:
+		for chunk in iter(lambda: source_file.read(chunk_size), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def source_fingerprint(score_path, digest=None):
+	status = os.stat(score_path)
+	return {
+		'size': status.st_size,
+		'mtime_ns': status.st_mtime_ns,
+		'sha256': digest if digest is not None else file_digest(score_path)
+	}
+
+def compile_cussens_scores(score_path, cache_path=None):
+	if cache_path is None:
+		cache_path = default_cache_path(score_path)
+	
+	# Fingerprint the source before parsing it, so that a concurrent edit makes the cache stale
+	# rather than silently matching
+	fingerprint = source_fingerprint(score_path)
+	
+	with open(score_path, 'r') as score_file_object:
+		score_arrays = cussens_files.read_cussens_score_arrays(score_file_object)
+	
+	arrays_info = {}
+	offset = HEADER_SIZE
+	for name in ARRAY_NAMES:
+		array = np.ascontiguousarray(getattr(score_arrays, name))
+		arrays_info[name] = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+		offset += array.nbytes
+		offset += (-offset) % ALIGNMENT
+	
+	header = {'version': VERSION, 'source': fingerprint, 'arrays': arrays_info}
+	
+	# Write into a temporary file first and move it into place, so that readers never
+	# see a half-written cache
+	temp_path = cache_path + '.tmp' + str(os.getpid())
+	with open(temp_path, 'wb') as cache_file:
+		cache_file.write(_encode_header(header))
+		for name in ARRAY_NAMES:
+			cache_file.seek(arrays_info[name]['offset'])
+			cache_file.write(np.ascontiguousarray(getattr(score_arrays, name)).tobytes())
+	os.replace(temp_path, cache_path)
+	
+	return cache_path
+
+def load_cussens_scores(score_path, cache_path=None, compile_if_stale=True):
+	# Returns a cussens_files.cussens_scores whose arrays are read-only memory maps of the cache.
+	# The cache is recompiled when the source file changed since it was written.
+	if cache_path is None:
+		cache_path = default_cache_path(score_path)
+	
+	header = None
+	if os.path.exists(cache_path):
+		try:
+			header = _read_header(cache_path)
+		except InvalidCacheError:
+			header = None
+	
+	if header is not None and not _is_fresh(header, score_path, cache_path):
+		header = None
+	
+	if header is None:
+		if not compile_if_stale:
+			raise InvalidCacheError('Score cache for ' + score_path + ' is missing or out of date.')
+		compile_cussens_scores(score_path, cache_path)
+		header = _read_header(cache_path)
+	
+	arrays = {}
+	for name in ARRAY_NAMES:
+		info = header['arrays'][name]
+		if info['length'] == 0:
+			arrays[name] = np.zeros(0, dtype=np.dtype(info['dtype']))
+		else:
+			arrays[name] = np.memmap(cache_path, dtype=np.dtype(info['dtype']), mode='r',
+			                         offset=info['offset'], shape=(info['length'],))
+	
+	return cussens_files.cussens_scores(**arrays)
+
+def read_score_file(score_path, use_cache=True, cache_path=None):
+	# (dataset_scores, dataset_all_parents) of a score file, like cussens_files.read_cussens_scores(),
+	# loaded through the cache (compiled on first use). With use_cache=False, or if the cache
+	# cannot be written next to the score file, the text is parsed as before.
+	if use_cache:
+		try:
+			return load_cussens_scores(score_path, cache_path).to_dicts()
+		except OSError:
+			pass
+	
+	with open(score_path, 'r') as score_file_object:
+		return cussens_files.read_cussens_scores(score_file_object)
+
+def _is_fresh(header, score_path, cache_path):
+	source = header['source']
+	status = os.stat(score_path)
+	
+	if status.st_size != source['size']:
+		return False
+	if status.st_mtime_ns == source['mtime_ns']:
+		return True
+	
+	# The source was touched: only the content hash can tell whether it really changed.
+	# If it did not, record the new mtime so that the next load skips hashing again.
+	if file_digest(score_path) != source['sha256']:
+		return False
+	
+	header['source']['mtime_ns'] = status.st_mtime_ns
+	try:
+		with open(cache_path, 'r+b') as cache_file:
+			cache_file.write(_encode_header(header))
+	except OSError:
+		# Read-only caches are still valid, just slower to validate
+		pass
+	
+	return True
+
+def _encode_header(header):
+	encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+	if len(MAGIC) + len(encoded) > HEADER_SIZE:
+		raise InvalidCacheError('Score cache header does not fit in ' + str(HEADER_SIZE) + ' bytes.')
+	return MAGIC + encoded.ljust(HEADER_SIZE - len(MAGIC), b' ')
+
+def _read_header(cache_path):
+	with open(cache_path, 'rb') as cache_file:
+		raw_header = cache_file.read(HEADER_SIZE)
+	
+	if len(raw_header) != HEADER_SIZE or raw_header[:len(MAGIC)] != MAGIC:
+		raise InvalidCacheError(cache_path + ' is not a Bayene score cache.')
+	
+	try:
+		header = json.loads(raw_header[len(MAGIC):].decode('utf-8'))
+	except ValueError:
+		raise InvalidCacheError(cache_path + ' has a corrupted header.')
+	
+	if header.get('version') != VERSION:
+		raise InvalidCacheError(cache_path + ' was written by an incompatible version of Bayene.')
+	
+	return header
@@ -0,0 +1,5 @@
+"""
+benchmarks: Timing scripts for Bayene. Run each one from the repository root with
+'python -m benchmarks.<name>'. benchmarks.suite times every stage and stores the results as
+JSON for comparison between commits.
+"""
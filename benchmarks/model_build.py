@@ -0,0 +1,62 @@
+"""
+model_build.py: Times main_model.model_writer construction and the cost of adding one
+cluster cut / one cycle cut. Uses synthetic score files at insurance (27 nodes) and
+alarm (37 nodes) scale, plus any real score files given on the command line.
+
+Usage: python -m benchmarks.model_build [score files...]
+"""
+import contextlib
+import io
+import random
+import sys
+import timeit
+
+from bayene.utils import cussens_files
+from bayene.ilp_model.cussens import main_model
+
+from .synthetic_scores import generate_score_file
+
+def read_scores(score_file_object):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return cussens_files.read_cussens_scores(score_file_object)
+
+def time_model(name, scores, parents, n_cuts=20, seed=0):
+	rng = random.Random(seed)
+	n_nodes = len(scores)
+	n_candidates = sum(len(node_scores) for node_scores in scores)
+	
+	start_time = timeit.default_timer()
+	problem = main_model.model_writer(scores, parents)
+	build_time = timeit.default_timer() - start_time
+	
+	clusters = [rng.sample(range(n_nodes), rng.randint(2, max(2, n_nodes // 3))) for _ in range(n_cuts)]
+	
+	start_time = timeit.default_timer()
+	for cluster_members in clusters:
+		problem.add_cluster_cuts(cluster_members)
+	cluster_time = (timeit.default_timer() - start_time) / n_cuts
+	
+	start_time = timeit.default_timer()
+	for cycle in clusters:
+		problem.add_cycle_cuts([cycle])
+	cycle_time = (timeit.default_timer() - start_time) / n_cuts
+	
+	print('%-28s %6d %10d %10.3f %14.2f %14.2f' % (name, n_nodes, n_candidates, build_time,
+	                                               cluster_time * 1e3, cycle_time * 1e3))
+
+def main():
+	print('%-28s %6s %10s %10s %14s %14s' % ('instance', 'nodes', 'columns', 'build (s)',
+	                                         'cluster (ms)', 'cycle (ms)'))
+	
+	for name, n_nodes, candidates_per_node in [('synthetic insurance-scale', 27, 500),
+	                                           ('synthetic alarm-scale', 37, 1000)]:
+		scores, parents = read_scores(io.StringIO(generate_score_file(n_nodes, candidates_per_node, 3)))
+		time_model(name, scores, parents)
+	
+	for score_path in sys.argv[1:]:
+		with open(score_path, 'r') as score_file_object:
+			scores, parents = read_scores(score_file_object)
+		time_model(score_path[-28:], scores, parents)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,44 @@
+"""
+read_scores.py: Times read_cussens_scores() on synthetic score files of growing size.
+The time per line should stay roughly constant if loading scales linearly.
+
+Usage: python -m benchmarks.read_scores
+"""
+import contextlib
+import io
+import timeit
+
+from bayene.utils import cussens_files
+
+from .synthetic_scores import generate_score_file
+
+def time_loader(loader, contents, repeat=3):
+	best = None
+	for _ in range(repeat):
+		score_file_object = io.StringIO(contents)
+		start_time = timeit.default_timer()
+		# read_cussens_scores prints the number of attributes; keep the benchmark output clean
+		with contextlib.redirect_stdout(io.StringIO()):
+			loader(score_file_object)
+		elapsed = timeit.default_timer() - start_time
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def main():
+	n_nodes = 60
+	
+	print('%10s %10s %12s %12s %16s' % ('cand/node', 'lines', 'dicts (s)', 'arrays (s)', 'us/line (dicts)'))
+	
+	for candidates_per_node in [1000, 2000, 4000, 8000]:
+		contents = generate_score_file(n_nodes, candidates_per_node, parent_limit=3)
+		n_lines = contents.count('\n')
+		
+		dicts_time = time_loader(cussens_files.read_cussens_scores, contents)
+		arrays_time = time_loader(cussens_files.read_cussens_score_arrays, contents)
+		
+		print('%10d %10d %12.3f %12.3f %16.2f' % (candidates_per_node, n_lines, dicts_time, arrays_time,
+		                                          dicts_time / n_lines * 1e6))
+
+if __name__ == '__main__':
+	main()
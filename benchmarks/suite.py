@@ -0,0 +1,232 @@
+"""
+suite.py: The benchmark suite. For synthetic score files of controlled size (and any real
+score files given on the command line) it times
+  - read_cussens_scores()
+  - model_writer construction (main_model and sparse_model)
+  - add_cluster_cuts() and add_cycle_cuts()
+  - find_cycles() and find_sink_heuristic() on a fractional solution
+  - a full solve with solve_model(), using a locally installed open-source solver
+and writes the results as JSON, together with the commit and library versions, so that runs
+from different commits can be compared.
+
+Usage:
+  python -m benchmarks.suite -o results.json [--sizes small medium] [score files...]
+  python -m benchmarks.suite -o new.json --compare old.json
+  python -m benchmarks.suite --write-scores synthetic_scores/
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+from bayene.utils import cussens_files
+from bayene.ilp_model.cussens import main_model
+from bayene.ilp_model.cussens import sparse_model
+from bayene.ilp_model.cussens import solution_controller
+
+from .synthetic_scores import generate_score_file
+
+# name -> (nodes, candidates per node, parent limit)
+SIZES = {
+	'small': (15, 40, 2),
+	'medium': (27, 200, 3),
+	'insurance': (27, 500, 3),
+	'alarm': (37, 1000, 3)
+}
+
+DEFAULT_SIZES = ['small', 'medium', 'insurance']
+
+# Full solves take much longer than the rest, so only these sizes are solved by default
+DEFAULT_SOLVE_SIZES = ['small', 'medium']
+
+# Open-source solvers, in order of preference. 'highs' (SciPy's HiGHS on the sparse model)
+# needs nothing besides SciPy, so it is always there as the last resort.
+OPEN_SOURCE_SOLVERS = ['appsi_highs', 'cbc', 'glpk', 'highs']
+
+def available_solver():
+	from pyomo.opt import SolverFactory
+	for solver in OPEN_SOURCE_SOLVERS[:-1]:
+		try:
+			if SolverFactory(solver).available(exception_flag=False):
+				return solver
+		except Exception:
+			continue
+	return OPEN_SOURCE_SOLVERS[-1]
+
+def measure(function, repeat):
+	# Best and median wall-clock seconds over repeat calls of function()
+	times = []
+	for _ in range(repeat):
+		start_time = timeit.default_timer()
+		function()
+		times.append(timeit.default_timer() - start_time)
+	return {'best': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+def read_scores(contents):
+	# read_cussens_scores prints the number of attributes; keep the benchmark output clean
+	with contextlib.redirect_stdout(io.StringIO()):
+		return cussens_files.read_cussens_scores(io.StringIO(contents))
+
+def random_clusters(n_nodes, n_cuts, rng):
+	return [sorted(rng.sample(range(n_nodes), rng.randint(2, max(2, n_nodes // 3)))) for _ in range(n_cuts)]
+
+def fractional_solution(scores, rng):
+	# A fractional solution like the ones the cutting plane loop separates: every node splits
+	# its weight between its best parent set and a random other one, which creates cycles.
+	solution = {}
+	for node, node_scores in enumerate(scores):
+		candidates = sorted(node_scores.keys(), key=lambda candidate: node_scores[candidate], reverse=True)
+		if len(candidates) == 1:
+			solution[(node, candidates[0])] = 1.0
+			continue
+		solution[(node, candidates[0])] = 0.5
+		solution[(node, rng.choice(candidates[1:]))] = 0.5
+	return solution
+
+def benchmark_instance(name, contents, solver, repeat, solve, n_cuts=20, seed=0):
+	rng = random.Random(seed)
+
+	scores, parents = read_scores(contents)
+	instance = {
+		'instance': name, 'nodes': len(scores), 'columns': sum(len(node_scores) for node_scores in scores),
+		'lines': contents.count('\n'), 'timings': {}
+	}
+	timings = instance['timings']
+
+	timings['read_cussens_scores'] = measure(lambda: read_scores(contents), repeat)
+	timings['main_model.model_writer'] = measure(lambda: main_model.model_writer(scores, parents), repeat)
+	timings['sparse_model.model_writer'] = measure(lambda: sparse_model.model_writer(scores, parents), repeat)
+
+	# Cuts are added to a fresh model each time, so every run does the same work
+	clusters = random_clusters(len(scores), n_cuts, rng)
+	for writer_name, writer in [('main_model', main_model.model_writer), ('sparse_model', sparse_model.model_writer)]:
+		problems = [writer(scores, parents) for _ in range(repeat)]
+		timings[writer_name + '.add_cluster_cuts'] = measure(lambda: problems.pop().add_cluster_cuts(clusters), repeat)
+		problems = [writer(scores, parents) for _ in range(repeat)]
+		timings[writer_name + '.add_cycle_cuts'] = measure(lambda: problems.pop().add_cycle_cuts(clusters), repeat)
+
+	current_solution = fractional_solution(scores, rng)
+	timings['find_cycles'] = measure(lambda: solution_controller.find_cycles(current_solution, parents), repeat)
+	timings['find_sink_heuristic'] = measure(
+		lambda: solution_controller.find_sink_heuristic(current_solution, scores, parents), repeat
+	)
+
+	if solve:
+		solve_results = {}
+
+		def full_solve():
+			best_solution, results, objective_progress, _ = solution_controller.solve_model(
+				scores, parents, solver, True, False, True, verbose=False
+			)
+			solve_results['objective'] = best_solution.objective_value() if best_solution is not None else None
+			solve_results['termination_condition'] = str(results.solver.termination_condition)
+			solve_results['iterations'] = len(objective_progress) + 1
+
+		# A solve is long enough that one run is representative
+		timings['solve_model'] = measure(full_solve, 1)
+		instance['solve'] = solve_results
+
+	return instance
+
+def environment(solver):
+	try:
+		commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+		                                 cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+
+	import scipy
+	import pyomo.version
+
+	return {
+		'commit': commit, 'date': datetime.datetime.now().isoformat(), 'solver': solver,
+		'python': platform.python_version(), 'platform': platform.platform(),
+		'numpy': np.__version__, 'scipy': scipy.__version__, 'pyomo': pyomo.version.version
+	}
+
+def compare(results, baseline):
+	# Prints the ratio of every best time to the baseline's (above 1 means slower now)
+	baseline_timings = dict((instance['instance'], instance['timings']) for instance in baseline['instances'])
+
+	print('%-28s %-32s %10s %10s %8s' % ('instance', 'benchmark', 'base (s)', 'now (s)', 'ratio'))
+	for instance in results['instances']:
+		if instance['instance'] not in baseline_timings:
+			continue
+		for benchmark, timing in sorted(instance['timings'].items()):
+			if benchmark not in baseline_timings[instance['instance']]:
+				continue
+			base_time = baseline_timings[instance['instance']][benchmark]['best']
+			print('%-28s %-32s %10.4f %10.4f %8.2f' % (instance['instance'][-28:], benchmark, base_time, timing['best'],
+			                                           timing['best'] / base_time if base_time > 0 else float('inf')))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Time the stages of Bayene on synthetic and real score files.')
+	parser.add_argument('score_files', nargs='*', help='real score files to benchmark as well')
+	parser.add_argument('-o', '--output', default=None, help='JSON file the results are written to')
+	parser.add_argument('--sizes', nargs='*', default=DEFAULT_SIZES, choices=sorted(SIZES.keys()),
+	                    help='synthetic instance sizes to benchmark')
+	parser.add_argument('--solve-sizes', nargs='*', default=DEFAULT_SOLVE_SIZES, choices=sorted(SIZES.keys()),
+	                    help='synthetic sizes to run a full solve on (real score files are always solved)')
+	parser.add_argument('--no-solve', action='store_true', help='skip the full solves')
+	parser.add_argument('--solver', default=None, help='solver for the full solves (default: the first open-source '
+	                    'solver found among ' + ', '.join(OPEN_SOURCE_SOLVERS) + ')')
+	parser.add_argument('--repeat', type=int, default=5, help='runs of each benchmark (the best and median are kept)')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic score files')
+	parser.add_argument('--compare', default=None, help='earlier results to compare against')
+	parser.add_argument('--write-scores', default=None, metavar='DIR',
+	                    help='only write the synthetic score files into DIR and exit')
+	args = parser.parse_args(argv)
+
+	if args.write_scores is not None:
+		if not os.path.isdir(args.write_scores):
+			os.makedirs(args.write_scores)
+		for size in args.sizes:
+			n_nodes, candidates_per_node, parent_limit = SIZES[size]
+			score_path = os.path.join(args.write_scores, 'synthetic_%s_%d_%d_%d_%d.scores'
+			                          % (size, n_nodes, candidates_per_node, parent_limit, args.seed))
+			with open(score_path, 'w') as score_file:
+				score_file.write(generate_score_file(n_nodes, candidates_per_node, parent_limit, args.seed))
+			print(score_path)
+		return
+
+	solver = args.solver if args.solver is not None else available_solver()
+	results = {'environment': environment(solver), 'instances': []}
+
+	benchmarks = []
+	for size in args.sizes:
+		n_nodes, candidates_per_node, parent_limit = SIZES[size]
+		benchmarks.append(('synthetic ' + size, generate_score_file(n_nodes, candidates_per_node, parent_limit, args.seed),
+		                   not args.no_solve and size in args.solve_sizes))
+	for score_path in args.score_files:
+		with open(score_path, 'r') as score_file:
+			benchmarks.append((score_path, score_file.read(), not args.no_solve))
+
+	print('%-28s %-32s %10s %10s' % ('instance', 'benchmark', 'best (s)', 'median (s)'))
+	for name, contents, solve in benchmarks:
+		sys.stderr.write('Benchmarking ' + name + '..\n')
+		instance = benchmark_instance(name, contents, solver, args.repeat, solve, seed=args.seed)
+		results['instances'].append(instance)
+
+		for benchmark, timing in sorted(instance['timings'].items()):
+			print('%-28s %-32s %10.4f %10.4f' % (name[-28:], benchmark, timing['best'], timing['median']))
+
+	if args.output is not None:
+		with open(args.output, 'w') as output_file:
+			json.dump(results, output_file, indent=1)
+
+	if args.compare is not None:
+		with open(args.compare, 'r') as baseline_file:
+			compare(results, json.load(baseline_file))
+
+if __name__ == '__main__':
+	main()
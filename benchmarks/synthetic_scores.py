@@ -0,0 +1,37 @@
+"""
+synthetic_scores.py: Generates synthetic score files in the Cussens (GOBNILP) format,
+so that the benchmarks can control the size of the input precisely.
+"""
+import random
+
+def generate_score_file(n_nodes, candidates_per_node, parent_limit, seed=0):
+	# Returns the contents of a score file as a string. Every node gets the empty parent set
+	# plus (candidates_per_node - 1) distinct random parent sets of size 1..parent_limit.
+	# Each (parent, child) pair has a random gain, a few of them large, so that the best
+	# parent sets of different nodes conflict and the solver needs cutting planes.
+	rng = random.Random(seed)
+	
+	gains = [[rng.uniform(0.0, 40.0) if rng.random() < 0.3 else rng.uniform(0.0, 3.0) for _ in range(n_nodes)]
+	         for _ in range(n_nodes)]
+	
+	lines = [str(n_nodes)]
+	
+	for node in range(n_nodes):
+		others = [other for other in range(n_nodes) if other != node]
+		
+		chosen = set([()])
+		# Guard against asking for more parent sets than there are
+		attempts = 0
+		while len(chosen) < candidates_per_node and attempts < candidates_per_node * 20:
+			size = rng.randint(1, min(parent_limit, len(others)))
+			chosen.add(tuple(sorted(rng.sample(others, size))))
+			attempts += 1
+		
+		lines.append(str(node) + ' ' + str(len(chosen)))
+		
+		for parent_set in sorted(chosen, key=lambda p: (len(p), p)):
+			score = -1000.0 + sum(gains[node][parent] for parent in parent_set) - 12.0 * len(parent_set) \
+			        + rng.uniform(-2.0, 2.0)
+			lines.append(' '.join(['%.6f' % score, str(len(parent_set))] + [str(p) for p in parent_set]))
+	
+	return '\n'.join(lines) + '\n'
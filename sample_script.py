@@ -1,7 +1,7 @@
 from __future__ import division
 
 from bayene.bayesian_network import cussensILPBN
-from bayene.utils import cussens_files
+from bayene.utils import score_cache
 from bayene.ilp_model.cussens.solution_controller import convert_to_graph
 
 import matplotlib.pyplot as plt
@@ -9,8 +9,8 @@ import networkx as nx
 
 import timeit
 
-with open('test_datasets/parent_3/1000/insurance_1000_1_3.scores', 'r') as test_file:
-    test_scores, test_parent_sets = cussens_files.read_cussens_scores(test_file)
+# Parsed once, then loaded from the compiled cache written next to the score file
+test_scores, test_parent_sets = score_cache.read_score_file('test_datasets/parent_3/1000/insurance_1000_1_3.scores')
     
 variablecount = 0
 
@@ -32,7 +32,7 @@ elapsed = timeit.default_timer() - start_time
 
 print('Time elapsed: ' + str(elapsed))
 
-graph = convert_to_graph(instance.main_model)
+graph = convert_to_graph(instance)
 
 # Progress Graph
 plt.figure(1)
@@ -47,7 +47,7 @@ nx.draw_networkx(graph, pos=nx.random_layout(graph))
 # Sink Heuristic Performance
 sink_performance = []
 for i in range(len(progress1)):
-    sink_performance.append(((float(progress2[i]) - instance.main_model.objective()) / instance.main_model.objective()))
+    sink_performance.append(((float(progress2[i]) - instance.objective_value()) / instance.objective_value()))
 
 plt.figure(3)
 
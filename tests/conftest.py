@@ -0,0 +1,83 @@
+import contextlib
+import io
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+from pyomo.environ import SolverFactory
+
+# The repository is not installed as a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bayene.utils import cussens_files
+from benchmarks.synthetic_scores import generate_score_file
+
+def solver_available(solver):
+	try:
+		return bool(SolverFactory(solver).available(exception_flag=False))
+	except Exception:
+		return False
+
+requires_appsi_highs = pytest.mark.skipif(not solver_available('appsi_highs'), reason='appsi_highs is not available')
+
+def read_scores(score_text):
+	# read_cussens_scores() prints the number of attributes
+	with contextlib.redirect_stdout(io.StringIO()):
+		return cussens_files.read_cussens_scores(io.StringIO(score_text))
+
+def synthetic_scores(n_nodes, candidates_per_node, parent_limit, seed=0):
+	return read_scores(generate_score_file(n_nodes, candidates_per_node, parent_limit, seed))
+
+def disjoint_union(problems):
+	# Scores and parents of several problems side by side, with nodes and candidates renumbered
+	scores = []
+	parents = []
+	for problem_scores, problem_parents in problems:
+		node_offset = len(scores)
+		candidate_offset = len(parents)
+		scores.extend(dict((candidate + candidate_offset, score) for candidate, score in node_scores.items())
+		              for node_scores in problem_scores)
+		parents.extend([parent + node_offset for parent in parent_set] for parent_set in problem_parents)
+	return scores, parents
+
+def optimal_score(scores, parents):
+	# Exact optimum by dynamic programming over node subsets (Silander and Myllymaki, 2006):
+	# the best DAG over a subset ends in a sink whose parents all lie in the rest of the subset
+	n_nodes = len(scores)
+	masks = [sum(1 << parent for parent in parent_set) for parent_set in parents]
+
+	# Candidates of each node by decreasing score, so the first one allowed is the best
+	ranked = [sorted(((score, masks[candidate]) for candidate, score in node_scores.items()), reverse=True)
+	          for node_scores in scores]
+
+	def best_parent_score(node, allowed):
+		return next(score for score, mask in ranked[node] if mask & ~allowed == 0)
+
+	best = [0.0] * (1 << n_nodes)
+	for subset in range(1, 1 << n_nodes):
+		best[subset] = max(best[subset & ~(1 << sink)] + best_parent_score(sink, subset & ~(1 << sink))
+		                   for sink in range(n_nodes) if subset & (1 << sink))
+	return best[-1]
+
+def is_acyclic(solution, parents, n_nodes):
+	graph = nx.DiGraph()
+	graph.add_nodes_from(range(n_nodes))
+	for (node, candidate), value in solution.items():
+		if value > 0.5:
+			graph.add_edges_from((parent, node) for parent in parents[candidate])
+	return nx.is_directed_acyclic_graph(graph)
+
+def random_dataset(n_rows, arities, seed=0):
+	# Each column depends on the previous one, so that parent sets matter
+	rng = np.random.default_rng(seed)
+	data = np.zeros((n_rows, len(arities)), dtype=np.int64)
+	for column, arity in enumerate(arities):
+		noise = rng.integers(0, arity, n_rows)
+		if column == 0:
+			data[:, column] = noise
+		else:
+			copied = rng.random(n_rows) < 0.7
+			data[:, column] = np.where(copied, data[:, column - 1] % arity, noise)
+	return data
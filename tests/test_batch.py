@@ -0,0 +1,74 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+from bayene import batch
+from benchmarks.synthetic_scores import generate_score_file
+
+from conftest import requires_appsi_highs, synthetic_scores, optimal_score
+
+# cussensILPBN needs pyutilib for its temporary files
+pytest.importorskip('pyutilib.services')
+
+CLASSIFIER_OPTIONS = {'solver': 'appsi_highs', 'gomory_cut': False}
+
+def write_score_files(directory, seeds):
+	paths = []
+	for seed in seeds:
+		path = directory / ('problem_' + str(seed) + '.scores')
+		path.write_text(generate_score_file(10, 20, 3, seed))
+		paths.append(str(path))
+	return paths
+
+@requires_appsi_highs
+def test_run_job_solves_a_score_file(tmp_path):
+	score_path, = write_score_files(tmp_path, [0])
+
+	record = batch.run_job(score_path, CLASSIFIER_OPTIONS)
+
+	assert record['status'] == 'ok'
+	assert record['n_nodes'] == 10
+	assert record['objective'] == pytest.approx(optimal_score(*synthetic_scores(10, 20, 3, 0)))
+
+@requires_appsi_highs
+def test_run_batch_resumes_from_its_output(tmp_path):
+	write_score_files(tmp_path, [0, 1, 2])
+	output_path = str(tmp_path / 'results.jsonl')
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		counts = batch.run_batch(str(tmp_path / '*.scores'), output_path, n_jobs=2, classifier_options=CLASSIFIER_OPTIONS)
+	assert counts['ok'] == 3
+
+	# A line cut short by a crash does not count as done
+	with open(output_path) as output_file:
+		records = [json.loads(line) for line in output_file]
+	with open(output_path, 'w') as output_file:
+		output_file.write(json.dumps(records[0]) + '\n' + json.dumps(records[1])[:20])
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		counts = batch.run_batch(str(tmp_path / '*.scores'), output_path, n_jobs=2, classifier_options=CLASSIFIER_OPTIONS)
+	assert sum(counts.values()) == 2
+	assert batch.completed_jobs(output_path) == set(record['score_file'] for record in records)
+
+def test_completed_jobs_can_retry_failed(tmp_path):
+	output_path = tmp_path / 'results.jsonl'
+	output_path.write_text(json.dumps({'score_file': 'a', 'status': 'ok'}) + '\n'
+	                       + json.dumps({'score_file': 'b', 'status': 'timeout'}) + '\n')
+
+	assert batch.completed_jobs(str(output_path)) == set(['a', 'b'])
+	assert batch.completed_jobs(str(output_path), retry_failed=True) == set(['a'])
+
+def test_completed_jobs_skips_lines_without_a_score_file(tmp_path):
+	output_path = tmp_path / 'results.jsonl'
+	output_path.write_text(json.dumps({'status': 'ok'}) + '\n' + json.dumps(['a']) + '\n'
+	                       + json.dumps({'score_file': 'b', 'status': 'ok'}) + '\n')
+
+	assert batch.completed_jobs(str(output_path)) == set(['b'])
+	assert batch.completed_jobs(str(output_path), retry_failed=True) == set(['b'])
+
+def test_parse_option():
+	assert batch.parse_option('time_limit=2.5') == ('time_limit', 2.5)
+	assert batch.parse_option('decompose=False') == ('decompose', False)
+	assert batch.parse_option('solver=appsi_highs') == ('solver', 'appsi_highs')
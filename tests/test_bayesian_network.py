@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from bayene import scorer
+from bayene import inference
+
+from conftest import requires_appsi_highs, random_dataset, optimal_score
+
+# cussensILPBN needs pyutilib for its temporary files
+pytest.importorskip('pyutilib.services')
+
+from bayene.bayesian_network import cussensILPBN
+
+ARITIES = [2, 3, 2, 3, 2, 2]
+
+@requires_appsi_highs
+@pytest.mark.parametrize('options', [{}, {'preprocess': False}, {'solver': 'highs'}, {'n_jobs': 2}])
+def test_fit_learns_the_optimal_structure(options):
+	data = random_dataset(500, ARITIES)
+	scores, parents = scorer.score_parent_sets(data, 2, ARITIES)
+
+	options = dict({'solver': 'appsi_highs', 'n_parents': 2, 'verbose': False}, **options)
+	classifier = cussensILPBN(**options).fit(data, ARITIES)
+
+	learned = sum(scores[node][candidate] for node, candidate in classifier.chosen_parent_sets.items())
+	assert len(classifier.chosen_parent_sets) == len(ARITIES)
+	assert learned == pytest.approx(optimal_score(scores, parents))
+
+@requires_appsi_highs
+def test_predict_uses_the_learned_network():
+	data = random_dataset(500, ARITIES)
+	classifier = cussensILPBN(solver='appsi_highs', n_parents=2, verbose=False, target=1).fit(data, ARITIES)
+
+	queries = data[:50].astype(np.int64)
+	queries[::3, 0] = -1
+
+	probabilities = classifier.predict_proba(queries)
+	np.testing.assert_allclose(probabilities, classifier.inference_engine.posterior(queries, 1))
+	np.testing.assert_array_equal(classifier.predict(queries), np.argmax(probabilities, axis=1))
+
+@requires_appsi_highs
+def test_predict_needs_a_target():
+	data = random_dataset(100, ARITIES)
+	classifier = cussensILPBN(solver='appsi_highs', n_parents=1, verbose=False).fit(data, ARITIES)
+
+	with pytest.raises(inference.InvalidQueryError):
+		classifier.predict(data)
@@ -0,0 +1,126 @@
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+
+from bayene.utils import cussens_files
+from bayene.utils import score_cache
+
+from conftest import read_scores
+
+SCORE_FILE = """3
+0 3
+-10.5 0
+-8.25 1 1
+-9.0 2 2 1
+1 2
+-7.0 0
+-6.5 1 0
+2 2
+-4.0 0
+-3.0 2 0 1
+"""
+
+def test_read_cussens_scores_deduplicates_parent_sets():
+	scores, parents = read_scores(SCORE_FILE)
+
+	# Members keep their file order, and each distinct parent set is stored only once
+	assert len(scores) == 3
+	assert sorted(map(tuple, parents)) == [(), (0,), (0, 1), (1,), (2, 1)]
+
+	index = dict((tuple(parent_set), candidate) for candidate, parent_set in enumerate(parents))
+	assert scores[0] == {index[()]: -10.5, index[(1,)]: -8.25, index[(2, 1)]: -9.0}
+	assert scores[1] == {index[()]: -7.0, index[(0,)]: -6.5}
+	assert scores[2] == {index[()]: -4.0, index[(0, 1)]: -3.0}
+
+def test_score_cache_matches_parsed_scores(tmp_path):
+	score_path = str(tmp_path / 'problem.scores')
+	with open(score_path, 'w') as score_file:
+		score_file.write(SCORE_FILE)
+
+	expected = read_scores(SCORE_FILE)
+	assert score_cache.load_cussens_scores(score_path).to_dicts() == expected
+
+	# A fresh cache is used as is, a missing one is not compiled on request
+	assert score_cache.load_cussens_scores(score_path, compile_if_stale=False).to_dicts() == expected
+	with pytest.raises(score_cache.InvalidCacheError):
+		score_cache.load_cussens_scores(score_path, cache_path=str(tmp_path / 'other.cache'), compile_if_stale=False)
+
+def test_score_cache_recompiles_when_the_source_changes(tmp_path):
+	score_path = str(tmp_path / 'problem.scores')
+	with open(score_path, 'w') as score_file:
+		score_file.write(SCORE_FILE)
+	score_cache.load_cussens_scores(score_path)
+
+	changed = SCORE_FILE.replace('-4.0 0', '-2.0 0')
+	with open(score_path, 'w') as score_file:
+		score_file.write(changed)
+	os.utime(score_path, (time.time() + 10, time.time() + 10))
+
+	assert score_cache.load_cussens_scores(score_path).to_dicts() == read_scores(changed)
+
+def test_read_score_file_goes_through_the_cache(tmp_path):
+	score_path = str(tmp_path / 'problem.scores')
+	with open(score_path, 'w') as score_file:
+		score_file.write(SCORE_FILE)
+
+	assert score_cache.read_score_file(score_path, use_cache=False) == read_scores(SCORE_FILE)
+	assert not os.path.exists(score_cache.default_cache_path(score_path))
+
+	assert score_cache.read_score_file(score_path) == read_scores(SCORE_FILE)
+	assert os.path.exists(score_cache.default_cache_path(score_path))
+
+def data_file(rows, arities=None, n_declared=None):
+	lines = [str(len(rows[0]))]
+	if arities is not None:
+		lines.append(' '.join(str(arity) for arity in arities))
+	lines.append(str(len(rows) if n_declared is None else n_declared))
+	lines.extend(' '.join(str(value) for value in row) for row in rows)
+	return io.StringIO('\n'.join(lines) + '\n')
+
+def read_data(data_file_object, **kwargs):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return cussens_files.read_cussens_data(data_file_object, **kwargs)
+
+@pytest.mark.parametrize('chunk_size', [7, 64, cussens_files.DEFAULT_CHUNK_SIZE])
+def test_read_cussens_data_across_chunk_boundaries(chunk_size):
+	rng = np.random.default_rng(0)
+	rows = rng.integers(0, 3, (50, 4))
+
+	data, names, arities = read_data(data_file(rows.tolist(), [3, 3, 3, 3]), chunk_size=chunk_size)
+
+	assert data.dtype == np.uint8
+	assert arities == [3, 3, 3, 3]
+	np.testing.assert_array_equal(data, rows)
+
+def test_read_cussens_data_widens_without_arities():
+	rows = [[0, 1], [2, 300], [1, 70000]]
+
+	data, names, arities = read_data(data_file(rows), arities=False, chunk_size=8)
+
+	assert data.dtype == np.uint32
+	np.testing.assert_array_equal(data, rows)
+	# Without arities, the number of distinct values of each column is taken
+	assert arities == [3, 3]
+
+def test_read_cussens_data_to_memmap(tmp_path):
+	rows = [[0, 1], [1, 0], [1, 1]]
+	memmap_path = str(tmp_path / 'data.npy')
+
+	data, names, arities = read_data(data_file(rows, [2, 2]), memmap_path=memmap_path)
+
+	np.testing.assert_array_equal(np.load(memmap_path, mmap_mode='r'), rows)
+
+@pytest.mark.parametrize('rows, arities, n_declared, message', [
+	([[0, 1], [1, 2]], [2, 2], None, 'exceed its arity'),
+	([[0, 1], [-1, 0]], [2, 2], None, 'Negative value'),
+	([[0, 1], [1, 0]], [2, 2], 1, 'more than the 1 instances'),
+	([[0, 1], [1, 0]], [2, 2], 3, 'declares 3 instances but has 2'),
+	([[0, 1], [1, 0]], [2], None, 'Expected 2 arities'),
+])
+def test_read_cussens_data_errors(rows, arities, n_declared, message):
+	with pytest.raises(cussens_files.InvalidDataFileError, match=message):
+		read_data(data_file(rows, arities, n_declared))
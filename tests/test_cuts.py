@@ -0,0 +1,72 @@
+import pytest
+
+from bayene.ilp_model import cussens
+from bayene.ilp_model.cussens import cycle_separator, cut_pool, heuristics, instrumentation, main_model, sparse_model
+
+from conftest import requires_appsi_highs, synthetic_scores, optimal_score, is_acyclic
+
+# Three nodes, each with the empty parent set and one parent set closing the cycle 0 -> 1 -> 2 -> 0
+SCORES = [{0: -10.0, 3: -1.0}, {0: -10.0, 1: -1.0}, {0: -10.0, 2: -1.0}]
+PARENTS = [[], [0], [1], [2]]
+
+def test_find_violated_cycles():
+	cyclic = {(0, 3): 1.0, (1, 1): 1.0, (2, 2): 1.0, (0, 0): 0.0, (1, 0): 0.0, (2, 0): 0.0}
+
+	cycles = cycle_separator.find_violated_cycles(cyclic, PARENTS)
+
+	assert [sorted(cycle) for cycle in cycles] == [[0, 1, 2]]
+	assert cycle_separator.cycle_violation(cycles[0], cyclic, PARENTS) == pytest.approx(1.0)
+
+	# Half of every edge leaves the cycle cut satisfied
+	half = dict((key, 0.5) for key in cyclic)
+	assert cycle_separator.find_violated_cycles(half, PARENTS) == []
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_sink_heuristic_gives_a_dag(seed):
+	scores, parents = synthetic_scores(10, 20, 3, seed)
+
+	# Starting from the best candidate of every node, which is usually cyclic
+	best = dict(((node, max(node_scores, key=node_scores.get)), 1.0) for node, node_scores in enumerate(scores))
+	total_score, solution, found = heuristics.sink_heuristic(scores, parents).find(best)
+
+	assert found
+	assert is_acyclic(solution, parents, len(scores))
+	assert sum(value for value in solution.values()) == len(scores)
+	assert total_score == pytest.approx(sum(scores[node][candidate] for (node, candidate), value in solution.items() if value > 0.5))
+	assert total_score <= optimal_score(scores, parents) + 1e-6
+
+@pytest.mark.parametrize('model_writer', [main_model.model_writer, sparse_model.model_writer])
+def test_cut_pool_ages_out_slack_cuts_and_brings_back_violated_ones(model_writer):
+	problem = model_writer(SCORES, PARENTS)
+	pool = cut_pool.cut_pool(problem, max_age=2)
+
+	new_clusters, reactivated = pool.filter_new([[0, 1, 2], [0, 1, 2]])
+	assert new_clusters == [[0, 1, 2]]
+	problem.add_cluster_cuts(new_clusters)
+	pool.register(new_clusters)
+
+	empty = {(0, 0): 1.0, (1, 0): 1.0, (2, 0): 1.0}
+	pool.update(empty)
+	assert pool.active == set([(0, 1, 2)])
+	pool.update(empty)
+	assert pool.inactive == set([(0, 1, 2)])
+
+	cyclic = {(0, 3): 1.0, (1, 1): 1.0, (2, 2): 1.0}
+	assert pool.update(cyclic) == 1
+	assert pool.active == set([(0, 1, 2)])
+	assert pool.report()['reactivated'] == 1
+
+@requires_appsi_highs
+def test_instrumentation_records_every_iteration():
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+	recorder = instrumentation.memory_recorder()
+
+	best_solution, results, objective_progress, heuristic_progress = cussens.solve_model(
+		scores, parents, 'appsi_highs', True, False, True, verbose=False, decompose=False, event_sinks=[recorder])
+
+	iterations = recorder.of_type('iteration')
+	assert [event['iteration'] for event in iterations] == list(range(len(iterations)))
+	assert all('rows' in event and 'termination_condition' in event for event in iterations)
+	# The last iteration solves to the optimal DAG
+	assert iterations[-1]['objective'] == pytest.approx(best_solution.objective_value())
+	assert iterations[-1]['bound'] == pytest.approx(best_solution.objective_value())
@@ -0,0 +1,58 @@
+import pytest
+from pyomo.opt import TerminationCondition
+
+from bayene.ilp_model import cussens
+from bayene.ilp_model.cussens import decomposition
+
+from conftest import requires_appsi_highs, synthetic_scores, disjoint_union, optimal_score, is_acyclic
+
+def decomposable_scores():
+	# Two independent 12-node problems and a node with no candidate parents at all
+	return disjoint_union([synthetic_scores(12, 30, 3, 0), synthetic_scores(12, 30, 3, 1), ([{0: -5.0}], [[]])])
+
+def test_find_components():
+	scores, parents = decomposable_scores()
+
+	components = decomposition.find_components(scores, parents)
+
+	assert [len(nodes) for nodes in components] == [12, 12, 1]
+	assert sorted(node for nodes in components for node in nodes) == list(range(25))
+	for nodes in components:
+		for node in nodes:
+			for candidate in scores[node]:
+				assert set(parents[candidate]) <= set(nodes)
+
+@requires_appsi_highs
+@pytest.mark.parametrize('component_jobs', [1, 2])
+def test_decomposed_solve_adds_up_the_component_optima(component_jobs):
+	scores, parents = decomposable_scores()
+	first, second = synthetic_scores(12, 30, 3, 0), synthetic_scores(12, 30, 3, 1)
+
+	best_solution, results, objective_progress, heuristic_progress = cussens.solve_model(
+		scores, parents, 'appsi_highs', True, False, True, verbose=False, component_jobs=component_jobs)
+
+	assert results.solver.termination_condition == TerminationCondition.optimal
+	assert best_solution.component_sizes == [12, 12, 1]
+	assert best_solution.objective_value() == pytest.approx(optimal_score(*first) + optimal_score(*second) - 5.0)
+	assert is_acyclic(best_solution.solution_values(), parents, len(scores))
+
+def test_singleton_takes_its_best_candidate():
+	# Candidates are re-indexed within the component: 0 and 2 become 0 and 1
+	problem = decomposition.component_problem([{0: -3.0, 2: -1.0}], [[], [], []], [0])
+
+	result = decomposition._solve_singleton(problem)
+
+	assert result['solution'] == {(0, 1): 1.0}
+	assert result['objective'] == result['bound'] == -1.0
+	assert result['termination_condition'] == str(TerminationCondition.optimal)
+
+@requires_appsi_highs
+def test_components_past_the_deadline_time_out():
+	scores, parents = decomposable_scores()
+
+	best_solution, results, objective_progress, heuristic_progress = cussens.solve_model(
+		scores, parents, 'appsi_highs', True, False, True, verbose=False, time_limit=1e-9)
+
+	# No component gets to run, so nothing is known about feasibility
+	assert best_solution is None
+	assert results.solver.termination_condition == TerminationCondition.maxTimeLimit
@@ -0,0 +1,64 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from bayene import inference
+
+from conftest import random_dataset
+
+ARITIES = [2, 3, 2, 2, 3]
+PARENTS = [[], [0], [0, 1], [2], [1, 3]]
+
+def enumerated_posterior(cpts, row, target):
+	# P(target | the non-negative values of the other columns), by summing the full joint distribution
+	posterior = np.zeros(ARITIES[target])
+	for assignment in itertools.product(*[range(arity) for arity in ARITIES]):
+		if any(row[variable] >= 0 and row[variable] != assignment[variable]
+		       for variable in range(len(ARITIES)) if variable != target):
+			continue
+		probability = 1.0
+		for node, parent_set in enumerate(PARENTS):
+			probability *= cpts[node][tuple(assignment[parent] for parent in parent_set) + (assignment[node],)]
+		posterior[assignment[target]] += probability
+	return posterior / posterior.sum()
+
+def test_cpts_are_smoothed_frequencies():
+	data = random_dataset(200, ARITIES)
+	cpts = inference.estimate_cpts(data, PARENTS, ARITIES, alpha=0.5)
+
+	for node, parent_set in enumerate(PARENTS):
+		assert cpts[node].shape == tuple(ARITIES[parent] for parent in parent_set) + (ARITIES[node],)
+		np.testing.assert_allclose(cpts[node].sum(axis=-1), 1.0)
+
+	# P(node 1 = 2 | node 0 = 1)
+	rows = data[data[:, 0] == 1]
+	assert cpts[1][1, 2] == pytest.approx((np.sum(rows[:, 1] == 2) + 0.5) / (len(rows) + 0.5 * 3))
+
+@pytest.mark.parametrize('target', [0, 2, 4])
+def test_posterior_matches_enumeration(target):
+	data = random_dataset(300, ARITIES)
+	engine = inference.inference_engine.fit(data, PARENTS, ARITIES, batch_size=7)
+
+	# Some values missing (negative), including rows without any evidence
+	rng = np.random.default_rng(1)
+	queries = random_dataset(40, ARITIES, seed=2)
+	queries[rng.random(queries.shape) < 0.3] = -1
+	queries[0] = -1
+
+	posterior = engine.posterior(queries, target)
+
+	for row, row_posterior in zip(queries.tolist(), posterior):
+		np.testing.assert_allclose(row_posterior, enumerated_posterior(engine.cpts, row, target), atol=1e-12)
+
+def test_predict_takes_the_most_probable_value():
+	data = random_dataset(300, ARITIES)
+	engine = inference.inference_engine.fit(data, PARENTS, ARITIES)
+
+	np.testing.assert_array_equal(engine.predict(data[:20], 1), np.argmax(engine.posterior(data[:20], 1), axis=1))
+
+def test_posterior_checks_the_number_of_columns():
+	engine = inference.inference_engine.fit(random_dataset(50, ARITIES), PARENTS, ARITIES)
+
+	with pytest.raises(inference.InvalidQueryError):
+		engine.posterior(np.zeros((2, 3), dtype=np.int64), 0)
@@ -0,0 +1,37 @@
+import pytest
+
+from bayene import preprocessing
+
+from conftest import synthetic_scores, optimal_score
+
+def test_prune_dominated_removes_sets_a_subset_beats():
+	scores = [{0: -10.0, 1: -12.0, 2: -9.5, 3: -9.0}, {0: -5.0, 4: -4.0}, {0: -1.0}]
+	parents = [[], [1], [1, 2], [2], [0]]
+
+	preprocessed = preprocessing.prune_dominated(scores, parents)
+	kept = [set(tuple(preprocessed.parents[candidate]) for candidate in node_scores) for node_scores in preprocessed.scores]
+
+	# [1] scores worse than [], and [1, 2] worse than its subset [2]
+	assert kept == [set([(), (2,)]), set([(), (0,)]), set([()])]
+	assert preprocessed.n_eliminated == 2
+	assert preprocessed.fixed == {2: preprocessed.parents.index([])}
+
+	# Reduced candidates map back to the original ones
+	reduced = dict((node, candidate) for node, node_scores in enumerate(preprocessed.scores) for candidate in node_scores
+	               if preprocessed.parents[candidate] == [])
+	assert preprocessed.to_original(dict(((node, candidate), 1.0) for node, candidate in reduced.items())) == \
+		{(0, 0): 1.0, (1, 0): 1.0, (2, 0): 1.0}
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_prune_dominated_keeps_the_optimum(seed):
+	scores, parents = synthetic_scores(10, 30, 3, seed)
+
+	preprocessed = preprocessing.prune_dominated(scores, parents)
+
+	assert preprocessed.n_eliminated > 0
+	assert optimal_score(preprocessed.scores, preprocessed.parents) == pytest.approx(optimal_score(scores, parents))
+	for node_scores in preprocessed.scores:
+		for candidate, score in node_scores.items():
+			members = set(preprocessed.parents[candidate])
+			assert all(other_score < score for other, other_score in node_scores.items()
+			           if other != candidate and set(preprocessed.parents[other]) < members)
@@ -0,0 +1,104 @@
+import itertools
+
+import numpy as np
+import pytest
+from scipy.special import gammaln
+
+from bayene import scorer
+
+from conftest import random_dataset
+
+ARITIES = [2, 3, 4, 2, 3]
+
+def brute_force_score(data, child, parent_set, arities, score_type, ess=1.0):
+	# Counts every (parent configuration, child value) with a dict, one row at a time
+	counts = {}
+	for row in data.tolist():
+		configuration = tuple(row[parent] for parent in parent_set)
+		counts.setdefault(configuration, [0] * arities[child])[row[child]] += 1
+
+	n_parent_configs = int(np.prod([arities[parent] for parent in parent_set]))
+	child_arity = arities[child]
+
+	score = 0.0
+	if score_type == 'bdeu':
+		alpha_j = ess / n_parent_configs
+		alpha_jk = alpha_j / child_arity
+		for child_counts in counts.values():
+			score += gammaln(alpha_j) - gammaln(alpha_j + sum(child_counts))
+			score += sum(gammaln(alpha_jk + count) - gammaln(alpha_jk) for count in child_counts)
+	else:
+		for child_counts in counts.values():
+			score += sum(count * np.log(count / sum(child_counts)) for count in child_counts if count > 0)
+		score -= 0.5 * np.log(len(data)) * n_parent_configs * (child_arity - 1)
+	return score
+
+@pytest.mark.parametrize('score_type', ['bdeu', 'bic'])
+def test_local_score_matches_brute_force(score_type):
+	data = random_dataset(500, ARITIES)
+
+	for child in range(len(ARITIES)):
+		others = [variable for variable in range(len(ARITIES)) if variable != child]
+		for size in range(3):
+			for parent_set in itertools.combinations(others, size):
+				assert scorer.local_score(data, child, parent_set, ARITIES, score_type) == \
+					pytest.approx(brute_force_score(data, child, parent_set, ARITIES, score_type))
+
+def test_family_table_is_the_same_in_any_chunk_size():
+	data = random_dataset(1000, ARITIES).astype(np.uint8)
+
+	expected = scorer.family_table(data, 2, [0, 1, 4], ARITIES)
+	for chunk_rows in [1, 7, 999, 5000]:
+		np.testing.assert_array_equal(scorer.family_table(data, 2, [0, 1, 4], ARITIES, chunk_rows=chunk_rows), expected)
+	assert expected.sum() == len(data)
+
+def test_codes_are_narrow_and_compressed_past_the_dense_limit(monkeypatch):
+	data = random_dataset(300, ARITIES).astype(np.uint8)
+
+	codes, n_configs = scorer.encode_columns(data, [0, 1, 2], ARITIES, chunk_rows=64)
+	assert codes.dtype == np.uint8
+	assert n_configs == 24
+	np.testing.assert_array_equal(codes, (data[:, 0].astype(int) * 3 + data[:, 1]) * 4 + data[:, 2])
+
+	# Past the dense limit, codes only number the observed configurations, in the same order
+	monkeypatch.setattr(scorer, 'DENSE_TABLE_LIMIT', 10)
+	compressed, n_observed = scorer.encode_columns(data, [0, 1, 2], ARITIES, chunk_rows=64)
+	assert n_observed == len(np.unique(codes))
+	np.testing.assert_array_equal(np.unique(codes)[compressed], codes)
+
+@pytest.mark.parametrize('score_type', ['bdeu', 'bic'])
+def test_sparse_counting_gives_the_same_scores(monkeypatch, score_type):
+	data = random_dataset(400, ARITIES).astype(np.uint8)
+	expected = scorer.score_child(3, data, ARITIES, 3, score_type, pruning=False)
+
+	monkeypatch.setattr(scorer, 'DENSE_TABLE_LIMIT', 8)
+	sparse = scorer.score_child(3, data, ARITIES, 3, score_type, pruning=False)
+
+	assert sparse.keys() == expected.keys()
+	for parent_set, score in expected.items():
+		assert sparse[parent_set] == pytest.approx(score)
+
+@pytest.mark.parametrize('score_type', ['bdeu', 'bic'])
+def test_pruning_only_drops_parent_sets_a_subset_beats(score_type):
+	data = random_dataset(60, ARITIES).astype(np.uint8)
+
+	for child in range(len(ARITIES)):
+		full = scorer.score_child(child, data, ARITIES, 3, score_type, pruning=False)
+		pruned = scorer.score_child(child, data, ARITIES, 3, score_type, pruning=True)
+
+		assert set(pruned) <= set(full)
+		for parent_set, score in pruned.items():
+			assert score == pytest.approx(full[parent_set])
+		for parent_set in set(full) - set(pruned):
+			best_subset = max(full[subset] for size in range(len(parent_set))
+			                  for subset in itertools.combinations(parent_set, size))
+			assert best_subset >= full[parent_set] - 1e-9
+
+def test_score_parent_sets_in_processes_matches_in_process():
+	data = random_dataset(300, ARITIES).astype(np.uint8)
+
+	assert scorer.score_parent_sets(data, 2, ARITIES, n_jobs=2) == scorer.score_parent_sets(data, 2, ARITIES, n_jobs=1)
+
+def test_unknown_score_type():
+	with pytest.raises(scorer.InvalidScoreTypeError):
+		scorer.score_parent_sets(random_dataset(10, ARITIES), 1, ARITIES, score_type='aic')
@@ -0,0 +1,176 @@
+import pytest
+from pyomo.opt import TerminationCondition
+
+import bayene.ilp_solver
+from bayene.ilp_model import cussens
+from bayene.ilp_model.cussens import branch_and_cut, cluster_separator, solution_controller
+
+from conftest import requires_appsi_highs, synthetic_scores, optimal_score, is_acyclic
+
+SOLVE_MODES = {
+	'appsi': dict(solver='appsi_highs'),
+	'persistent': dict(solver='appsi_highs', persistent=True),
+	'no_cutoff': dict(solver='appsi_highs', cutoff=False),
+	'sparse': dict(solver='highs'),
+	'branch_and_cut': dict(solver='appsi_highs', branch_and_cut=True),
+	'branch_and_cut_persistent': dict(solver='appsi_highs', branch_and_cut=True, persistent=True),
+	'branch_and_cut_sparse': dict(solver='highs', branch_and_cut=True, node_jobs=2),
+	'cut_pool_aging': dict(solver='appsi_highs', cut_max_age=1, max_active_cuts=20),
+	'no_cluster_heuristics': dict(solver='appsi_highs', cluster_heuristics=False),
+	'one_cluster_cut': dict(solver='appsi_highs', max_cluster_cuts=1),
+}
+
+def solve(scores, parents, solver='appsi_highs', sink_heuristic=True, **options):
+	options.setdefault('verbose', False)
+	return cussens.solve_model(scores, parents, solver, True, False, sink_heuristic, **options)
+
+@requires_appsi_highs
+@pytest.mark.parametrize('mode', sorted(SOLVE_MODES))
+@pytest.mark.parametrize('seed', [0, 1])
+def test_solve_reaches_the_exact_optimum(mode, seed):
+	scores, parents = synthetic_scores(12, 30, 3, seed)
+
+	best_solution, results, objective_progress, heuristic_progress = solve(scores, parents, **SOLVE_MODES[mode])
+
+	assert results.solver.termination_condition == TerminationCondition.optimal
+	assert best_solution.objective_value() == pytest.approx(optimal_score(scores, parents))
+	assert is_acyclic(best_solution.solution_values(), parents, len(scores))
+
+@requires_appsi_highs
+@pytest.mark.parametrize('seed', [4, 6])
+def test_solve_stopped_by_the_native_cutoff_returns_the_optimal_incumbent(monkeypatch, seed):
+	# On these problems the sink heuristic finds the optimum before the last solve
+	scores, parents = synthetic_scores(12, 30, 3, seed)
+	call_solver = bayene.ilp_solver.call_solver
+	stopped = []
+
+	def stopping_at_the_cutoff(model, options, **kwargs):
+		# Like HiGHS with objective_bound: report the cutoff instead of a solution no better than it
+		results = call_solver(model, options, **kwargs)
+		cutoff = kwargs.get('cutoff')
+		if cutoff is not None and results.solver.termination_condition == TerminationCondition.optimal \
+				and results.problem.lower_bound <= cutoff + 2 * bayene.ilp_solver.CUTOFF_TOLERANCE * abs(cutoff):
+			results.solver.termination_condition = TerminationCondition.minFunctionValue
+			stopped.append(cutoff)
+		return results
+	monkeypatch.setattr(bayene.ilp_solver, 'call_solver', stopping_at_the_cutoff)
+
+	best_solution, results, objective_progress, heuristic_progress = solve(scores, parents, decompose=False)
+
+	assert len(stopped) == 1
+	assert results.solver.termination_condition == TerminationCondition.optimal
+	assert best_solution.objective_value() == pytest.approx(optimal_score(scores, parents))
+	assert best_solution.bound == best_solution.objective_value()
+	assert best_solution.gap == 0.0
+	assert is_acyclic(best_solution.solution_values(), parents, len(scores))
+
+@requires_appsi_highs
+def test_failed_cluster_separation_is_not_optimal(monkeypatch):
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+	monkeypatch.setattr(cluster_separator.cluster_separator, 'separate', lambda self, *args, **kwargs: (None, []))
+
+	# Without cycle cuts either, nothing shows that the first solution is cyclic
+	best_solution, results, objective_progress, heuristic_progress = cussens.solve_model(
+		scores, parents, 'appsi_highs', False, False, True, verbose=False, decompose=False)
+
+	assert results.solver.termination_condition == TerminationCondition.error
+	if best_solution is not None:
+		assert is_acyclic(best_solution.solution_values(), parents, len(scores))
+
+@requires_appsi_highs
+def test_session_steps_to_the_same_result():
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+
+	# A decomposed solve runs as a single step
+	session = solution_controller.solve_session(scores, parents, 'appsi_highs', True, False, True,
+	                                            verbose=False, decompose=False)
+	steps = 0
+	while not session.step():
+		steps += 1
+	best_solution, results, objective_progress, heuristic_progress = session.result()
+
+	assert steps > 0
+	assert best_solution.objective_value() == pytest.approx(optimal_score(scores, parents))
+
+@requires_appsi_highs
+def test_gap_target_stops_with_a_certified_dag():
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+	optimum = optimal_score(scores, parents)
+
+	best_solution, results, objective_progress, heuristic_progress = solve(scores, parents, gap_target=0.5)
+
+	assert is_acyclic(best_solution.solution_values(), parents, len(scores))
+	assert best_solution.objective_value() <= optimum + 1e-6
+	assert best_solution.bound >= optimum - 1e-6
+	assert best_solution.gap <= 0.5
+
+@requires_appsi_highs
+def test_time_limit_returns_the_incumbent():
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+
+	best_solution, results, objective_progress, heuristic_progress = solve(scores, parents, time_limit=1e-9, decompose=False)
+
+	assert results.solver.termination_condition == TerminationCondition.maxTimeLimit
+	# The sink heuristic gives a DAG before the first solve
+	if best_solution is not None:
+		assert is_acyclic(best_solution.solution_values(), parents, len(scores))
+
+@requires_appsi_highs
+def test_branch_and_cut_respects_max_nodes():
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+
+	best_solution, results, objective_progress, heuristic_progress = solve(
+		scores, parents, branch_and_cut=True, node_jobs=2, max_nodes=3, node_cut_rounds=0)
+
+	if best_solution is not None:
+		assert best_solution.branch_and_cut_stats['nodes'] <= 3
+
+@requires_appsi_highs
+def test_branch_and_cut_keeps_the_bound_of_nodes_it_could_not_solve(monkeypatch):
+	# The root of this problem is fractional, and every node below it fails
+	scores, parents = synthetic_scores(12, 30, 3, 2)
+	evaluate = branch_and_cut.node_evaluator.evaluate
+	root = branch_and_cut.node_evaluator(scores, parents, 'appsi_highs', False, cut_rounds=0).evaluate([], [], None)
+
+	def failing_below_the_root(self, branchings, cuts, cutoff, time_limit=None):
+		if len(branchings) > 0:
+			return {'status': 'failed', 'bound': None, 'solution': {}, 'cuts': [], 'heuristic': None, 'branching_key': None}
+		return evaluate(self, branchings, cuts, cutoff, time_limit)
+	monkeypatch.setattr(branch_and_cut.node_evaluator, 'evaluate', failing_below_the_root)
+
+	best_solution, results, objective_progress, heuristic_progress = branch_and_cut.solve(
+		scores, parents, 'appsi_highs', False, cut_rounds=0, log=lambda *args: None)
+
+	assert root['status'] == 'fractional'
+	assert best_solution.branch_and_cut_stats['failed'] == 2
+	assert results.solver.termination_condition == TerminationCondition.feasible
+	assert results.bound == pytest.approx(root['bound'])
+	assert best_solution.objective_value() < results.bound
+
+@requires_appsi_highs
+def test_branch_and_cut_nodes_get_the_time_left():
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+	evaluator = branch_and_cut.node_evaluator(scores, parents, 'appsi_highs', False)
+
+	assert evaluator.evaluate([], [], None, time_limit=1e-9)['status'] == 'time_limit'
+	assert evaluator.evaluate([], [], None)['status'] == 'integral'
+
+@requires_appsi_highs
+def test_cut_cache_reuses_the_cuts_of_an_earlier_solve(tmp_path):
+	scores, parents = synthetic_scores(12, 30, 3, 0)
+
+	first = solve(scores, parents, cut_cache=str(tmp_path))[0]
+	second = solve(scores, parents, cut_cache=str(tmp_path))[0]
+
+	assert len(list(tmp_path.iterdir())) == 1
+	assert second.objective_value() == pytest.approx(first.objective_value())
+	assert second.add_cluster_total_count + second.add_cycle_total_count <= first.add_cluster_total_count + first.add_cycle_total_count
+
+@requires_appsi_highs
+def test_keep_model():
+	scores, parents = synthetic_scores(6, 8, 2, 0)
+
+	assert solve(scores, parents)[0].model is None
+	best_solution = solve(scores, parents, keep_model=True)[0]
+	assert best_solution.model is not None
+	assert best_solution.model.objective_value() == pytest.approx(best_solution.objective_value())